@@ -0,0 +1,4 @@
+'''
+load tests of the web server against stub translators, see `python -m
+benchmarks --help`
+'''
@@ -0,0 +1,131 @@
+import json
+import time
+import urllib.error
+import urllib.request
+import uuid
+from urllib.parse import urlencode
+
+import simple_websocket
+
+# type imports
+from typing import Any
+
+
+class Client:
+    '''
+    minimal HTTP and WebSocket client for the server at `base_url`, using
+    only the standard library and `simple_websocket` (a `flask-sock`
+    dependency)
+    '''
+
+    def __init__(self, base_url: str, timeout: float = 600):
+        self.base_url = base_url
+        self.timeout = timeout
+
+    def request(self, method: str, path: str, body: bytes | None = None,
+                headers: dict[str, str] = {}) -> tuple[int, bytes]:
+        req = urllib.request.Request(self.base_url + path, data=body, method=method,
+                                     headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as err:
+            return err.code, err.read()
+
+    def get(self, path: str) -> tuple[int, bytes]:
+        return self.request('GET', path)
+
+    def json(self, body: bytes) -> Any:
+        return json.loads(body)
+
+    def get_json(self, path: str) -> Any:
+        status, body = self.get(path)
+        if status != 200:
+            raise RuntimeError(f'GET {path}: {status} {body[:200]!r}')
+        return json.loads(body)
+
+    def post_form(self, path: str, fields: dict[str, str]) -> tuple[int, bytes]:
+        return self.request('POST', path, urlencode(fields).encode('utf-8'),
+                            {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def post_form_stream(self, path: str, fields: dict[str, str]) -> tuple[float, int]:
+        '''
+        posts a form and reads the streamed response; returns the time until
+        the first body bytes arrived and the status
+        '''
+
+        start = time.perf_counter()
+        req = urllib.request.Request(self.base_url + path, method='POST',
+                                     data=urlencode(fields).encode('utf-8'),
+                                     headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                response.read1()
+                first_output = time.perf_counter() - start
+                response.read()
+                return first_output, response.status
+        except urllib.error.HTTPError as err:
+            return time.perf_counter() - start, err.code
+
+    def post_multipart(self, path: str, fields: dict[str, str],
+                       files: dict[str, tuple[str, bytes]]) -> tuple[int, bytes]:
+        boundary = uuid.uuid4().hex
+        parts = list[bytes]()
+
+        for name, value in fields.items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"'
+                         f'\r\n\r\n{value}\r\n'.encode('utf-8'))
+
+        for name, (filename, content) in files.items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                         f'filename="{filename}"\r\nContent-Type: application/octet-stream'
+                         '\r\n\r\n'.encode('utf-8') + content + b'\r\n')
+
+        parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+
+        return self.request('POST', path, b''.join(parts),
+                            {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+    def wait_for_job(self, job_id: int, poll_interval: float = 0.1) -> str:
+        '''
+        returns the job's final status
+        '''
+
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            status = self.get_json(f'/api/jobs/{job_id}')['status']
+            if status in ('done', 'error', 'archived'):
+                return status
+            time.sleep(poll_interval)
+
+        raise TimeoutError(f'Job {job_id} did not finish')
+
+    def follow_log(self, job_id: int) -> tuple[int, int]:
+        '''
+        reads the log of a job until its end; returns the number of messages
+        and bytes received
+        '''
+
+        ws_url = self.base_url.replace('http://', 'ws://', 1) + f'/api/jobs/{job_id}/log'
+        ws = simple_websocket.Client.connect(ws_url)
+
+        messages = 0
+        received = 0
+        try:
+            while True:
+                data = ws.receive(timeout=self.timeout)
+                if data is None:
+                    raise TimeoutError(f'Log of job {job_id} stalled')
+
+                message = json.loads(data)
+                if 'error' in message:
+                    raise RuntimeError(message['error'])
+                if message.get('eof'):
+                    break
+
+                messages += 1
+                received += len(message['log_line'])
+        finally:
+            ws.close()
+
+        return messages, received
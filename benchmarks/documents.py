@@ -0,0 +1,52 @@
+from io import BytesIO
+import random
+from zipfile import ZipFile, ZIP_DEFLATED
+
+__words = ('the model translates structured documents while preserving markup '
+           'commands equations figures tables and references across languages').split()
+
+
+def paragraph(rng: random.Random, sentences: int) -> str:
+    text = list[str]()
+    for _ in range(sentences):
+        words = [rng.choice(__words) for _ in range(rng.randint(8, 20))]
+        text.append(' '.join(words).capitalize() + '.')
+
+    # some markup for the masking and alignment to deal with
+    return ' '.join(text).replace(' equations ', r' equations $x^2 + y$ ', 1) \
+        .replace(' tables ', r' \textbf{tables} ', 1)
+
+
+def snippet(rng: random.Random, paragraphs: int) -> str:
+    return '\n\n'.join(paragraph(rng, rng.randint(2, 5)) for _ in range(paragraphs)) + '\n'
+
+
+def chapter(rng: random.Random, sections: int, paragraphs: int) -> str:
+    return '\n'.join(f'\\section{{Section {section + 1}}}\n\n' + snippet(rng, paragraphs)
+                     for section in range(sections))
+
+
+def document(rng: random.Random, sections: int, paragraphs: int) -> str:
+    return ('\\documentclass{article}\n\\begin{document}\n\n'
+            + chapter(rng, sections, paragraphs)
+            + '\n\\end{document}\n')
+
+
+def project_zip(rng: random.Random, files: int, sections: int, paragraphs: int) -> bytes:
+    '''
+    returns a ZIP of a multi-file project: a main file including `files`
+    chapters, plus a binary figure which the server is to skip
+    '''
+
+    archive = BytesIO()
+    with ZipFile(archive, mode='w', compression=ZIP_DEFLATED) as zf:
+        includes = '\n'.join(f'\\input{{chapters/chapter{n}}}' for n in range(files))
+        zf.writestr('main.tex', '\\documentclass{book}\n\\begin{document}\n'
+                    + includes + '\n\\end{document}\n')
+
+        for n in range(files):
+            zf.writestr(f'chapters/chapter{n}.tex', chapter(rng, sections, paragraphs))
+
+        zf.writestr('figures/figure.pdf', rng.randbytes(64 * 1024))
+
+    return archive.getvalue()
@@ -0,0 +1,209 @@
+import argparse
+from datetime import datetime, timezone
+import json
+import os
+from pathlib import Path
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+from threading import Thread
+
+from .client import Client
+from .stubs import LatencySettings, install_stubs
+
+# type imports
+from typing import Any, Optional
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='runs load scenarios against an in-process server with stub translators')
+
+    latency = parser.add_argument_group('stub latencies (seconds)')
+    latency.add_argument('--load-latency', type=float, default=0.5)
+    latency.add_argument('--batch-latency', type=float, default=0.02)
+    latency.add_argument('--segment-latency', type=float, default=0.005)
+    latency.add_argument('--align-latency', type=float, default=0.001)
+    latency.add_argument('--align-type', default='auto',
+                         help='aligner wrapped by the stub (default: %(default)s)')
+
+    load = parser.add_argument_group('load')
+    load.add_argument('--scenarios', nargs='+',
+                      default=['translate', 'translate_stream', 'upload', 'logs', 'download'])
+    load.add_argument('--concurrency', type=int, default=8)
+    load.add_argument('--translate-requests', type=int, default=200)
+    load.add_argument('--snippet-sizes', type=int, nargs='+', default=[1, 4, 16],
+                      help='paragraphs per snippet, chosen at random')
+    load.add_argument('--jobs', type=int, default=8)
+    load.add_argument('--job-concurrency', type=int, default=4)
+    load.add_argument('--files', type=int, default=8, help='chapter files per job')
+    load.add_argument('--sections', type=int, default=3)
+    load.add_argument('--paragraphs', type=int, default=4)
+    load.add_argument('--viewers', type=int, default=4, help='log viewers per job')
+    load.add_argument('--downloads', type=int, default=50)
+    load.add_argument('--seed', type=int, default=0)
+
+    server = parser.add_argument_group('server configuration')
+    server.add_argument('--config', type=Path,
+                        help='JSON file with configuration overrides')
+
+    output = parser.add_argument_group('output')
+    output.add_argument('--output', type=Path,
+                        help='results file (default: benchmark-results/<time>.json)')
+    output.add_argument('--compare', type=Path, help='previous results file to compare with')
+    output.add_argument('--keep-work-dir', action='store_true')
+
+    return parser.parse_args()
+
+
+def server_config(work_dir: Path, args: argparse.Namespace) -> dict[str, Any]:
+    config = {
+        'work_dir': str(work_dir),
+        'log_level': 'WARNING',
+        'translator': 'null',
+        'aligner': args.align_type,
+        'texfmt_bin': None,
+        'enable_jobs': True,
+        'enable_translation': True,
+        # every request should reach the translator, so that runs are
+        # comparable
+        'result_cache_mem_bytes': 0,
+        'result_cache_disk_bytes': 0,
+        'translation_memory_max_entries': 0,
+        'preload': None,
+        # all requests come from the same address
+        'client_rate_per_minute': 0,
+    }
+
+    if args.config is not None:
+        with open(args.config) as config_file:
+            config.update(json.load(config_file))
+
+    return config
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: dict[str, dict[str, Any]]):
+    def ms(value: Optional[float]) -> str:
+        return f'{value * 1000:9.1f}' if value is not None else f'{"-":>9}'
+
+    print(f'{"scenario":<18}{"requests":>9}{"errors":>7}{"req/s":>9}'
+          f'{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"peak RSS":>11}')
+    for name, result in results.items():
+        latency = result['latency']
+        throughput = result['throughput']
+        print(f'{name:<18}{result["requests"]:>9}{result["errors"]:>7}'
+              f'{throughput if throughput is not None else 0:>9.2f}'
+              f'{ms(latency["p50"])} {ms(latency["p95"])} {ms(latency["p99"])}'
+              f'{result["peak_rss"] / 2**20:>9.0f}MB')
+
+        for sample in result['error_samples']:
+            print(f'    error: {sample}')
+
+
+def print_comparison(previous: dict[str, Any], results: dict[str, dict[str, Any]]):
+    def ratio(new: Optional[float], old: Optional[float]) -> str:
+        if new is None or old is None or old == 0:
+            return f'{"-":>9}'
+        return f'{new / old:>8.2f}x'
+
+    print(f'\ncompared with {previous.get("commit") or "?"} ({previous.get("timestamp")}):')
+    print(f'{"scenario":<18}{"req/s":>9}{"p50":>10}{"p95":>10}{"p99":>10}{"peak RSS":>10}')
+    for name, result in results.items():
+        old = previous['scenarios'].get(name)
+        if old is None:
+            continue
+        print(f'{name:<18}{ratio(result["throughput"], old["throughput"])}'
+              f' {ratio(result["latency"]["p50"], old["latency"]["p50"])}'
+              f' {ratio(result["latency"]["p95"], old["latency"]["p95"])}'
+              f' {ratio(result["latency"]["p99"], old["latency"]["p99"])}'
+              f' {ratio(result["peak_rss"], old["peak_rss"])}')
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+
+    work_dir = Path(tempfile.mkdtemp(prefix='latexmt-benchmark-'))
+    config = server_config(work_dir.joinpath('work'), args)
+    config_path = work_dir.joinpath('config.json')
+    with open(config_path, 'w') as config_file:
+        json.dump(config, config_file)
+
+    # the configuration is located when `latexmt_web.configure` is imported
+    os.environ['LATEXMT_CONFIG_PATH'] = str(config_path)
+
+    install_stubs(LatencySettings(args.load_latency, args.batch_latency,
+                                  args.segment_latency, args.align_latency),
+                  args.align_type)
+
+    from werkzeug.serving import make_server
+    from latexmt_web.server import app
+    from . import scenarios
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    Thread(target=server.serve_forever, daemon=True, name='benchmark-server').start()
+    client = Client(f'http://127.0.0.1:{server.server_port}')
+
+    results = dict[str, dict[str, Any]]()
+    job_ids = list[int]()
+    try:
+        for name in args.scenarios:
+            print(f'running {name}...', flush=True)
+
+            if name in ('translate', 'translate_stream'):
+                result = scenarios.translate(client, rng, args.concurrency, args.translate_requests,
+                                             args.snippet_sizes, stream=name == 'translate_stream')
+            elif name == 'upload':
+                result, job_ids = scenarios.upload(client, rng, args.job_concurrency, args.jobs,
+                                                   args.files, args.sections, args.paragraphs)
+            elif name == 'logs':
+                result = scenarios.logs(client, job_ids, args.viewers)
+            elif name == 'download':
+                result = scenarios.download(client, job_ids, args.concurrency, args.downloads)
+            else:
+                raise SystemExit(f'unknown scenario: {name}')
+
+            results[name] = result.json()
+    finally:
+        server.shutdown()
+        if not args.keep_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    timestamp = datetime.now(timezone.utc)
+    output = {
+        'commit': git_commit(),
+        'timestamp': timestamp.isoformat(),
+        'python': platform.python_version(),
+        'arguments': {name: str(value) if isinstance(value, Path) else value
+                      for name, value in vars(args).items()},
+        'config': config,
+        # `ru_maxrss` is in KiB on Linux
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'scenarios': results,
+    }
+
+    output_path = args.output or Path('benchmark-results').joinpath(
+        timestamp.strftime('%Y%m%dT%H%M%SZ') + '.json')
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w') as output_file:
+        json.dump(output, output_file, indent=2)
+
+    print()
+    print_results(results)
+    print(f'\nresults written to {output_path}')
+
+    if args.compare is not None:
+        with open(args.compare) as previous_file:
+            print_comparison(json.load(previous_file), results)
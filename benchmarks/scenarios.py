@@ -0,0 +1,221 @@
+from concurrent.futures import ThreadPoolExecutor
+import random
+import time
+from threading import Event, Thread
+
+from latexmt_web.pool import resident_memory
+
+from .client import Client
+from .documents import project_zip, snippet
+
+# type imports
+from typing import Any, Callable, Optional
+
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    '''
+    nearest-rank percentile of `values`, `q` in [0, 100]
+    '''
+
+    if len(values) == 0:
+        return None
+
+    ordered = sorted(values)
+    rank = max(1, round(q / 100 * len(ordered) + 0.5))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summary(values: list[float]) -> dict[str, Optional[float]]:
+    return {
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'mean': sum(values) / len(values) if len(values) > 0 else None,
+        'max': max(values) if len(values) > 0 else None,
+    }
+
+
+class RssSampler:
+    '''
+    samples the resident memory of this process (server and clients) while
+    active
+    '''
+
+    interval = 0.05
+
+    def __init__(self):
+        self.peak = 0
+        self._stopped = Event()
+        self._thread = Thread(target=self._loop, daemon=True, name='rss-sampler')
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            self.peak = max(self.peak, resident_memory())
+            self._stopped.wait(self.interval)
+
+    def __enter__(self) -> 'RssSampler':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_):
+        self._stopped.set()
+        self._thread.join()
+        self.peak = max(self.peak, resident_memory())
+
+
+class ScenarioResult:
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.latencies = list[float]()
+        self.errors = list[str]()
+        self.duration = 0.0
+        self.peak_rss = 0
+        # further per-scenario measurements, as lists of values
+        self.extra = dict[str, list[float]]()
+
+    def json(self) -> dict[str, Any]:
+        return {
+            'concurrency': self.concurrency,
+            'requests': len(self.latencies) + len(self.errors),
+            'errors': len(self.errors),
+            'error_samples': self.errors[:5],
+            'duration': self.duration,
+            'throughput': len(self.latencies) / self.duration if self.duration > 0 else None,
+            'latency': summary(self.latencies),
+            'peak_rss': self.peak_rss,
+            **{name: summary(values) for name, values in self.extra.items()},
+        }
+
+
+def run_concurrent(name: str, concurrency: int,
+                   tasks: list[Callable[[ScenarioResult], Any]]) -> tuple[ScenarioResult, list[Any]]:
+    '''
+    runs `tasks` on `concurrency` threads, timing each; returns the result and
+    the tasks' return values (`None` for failed tasks)
+    '''
+
+    result = ScenarioResult(name, concurrency)
+
+    def timed(task: Callable[[ScenarioResult], Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            value = task(result)
+        except Exception as err:
+            result.errors.append(f'{type(err).__name__}: {err}')
+            return None
+        result.latencies.append(time.perf_counter() - start)
+        return value
+
+    with RssSampler() as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            values = list(executor.map(timed, tasks))
+        result.duration = time.perf_counter() - start
+
+    result.peak_rss = sampler.peak
+    return result, values
+
+
+def translate(client: Client, rng: random.Random, concurrency: int, requests: int,
+              sizes: list[int], stream: bool) -> ScenarioResult:
+    '''
+    `/api/translate` with snippets of `sizes` paragraphs; with `stream`, the
+    time to the first translated paragraph is measured as `first_output`
+    '''
+
+    inputs = [snippet(rng, rng.choice(sizes)) for _ in range(requests)]
+
+    def task(input_text: str) -> Callable[[ScenarioResult], None]:
+        def run(result: ScenarioResult):
+            fields = {'input_text': input_text, 'src_lang': 'de', 'tgt_lang': 'en',
+                      'use_translation_memory': '0'}
+            if stream:
+                fields['stream'] = '1'
+                first_output, status = client.post_form_stream('/api/translate', fields)
+                result.extra.setdefault('first_output', []).append(first_output)
+            else:
+                status, _ = client.post_form('/api/translate', fields)
+
+            if status != 200:
+                raise RuntimeError(f'HTTP {status}')
+
+        return run
+
+    result, _ = run_concurrent('translate_stream' if stream else 'translate', concurrency,
+                               [task(input_text) for input_text in inputs])
+    return result
+
+
+def upload(client: Client, rng: random.Random, concurrency: int, jobs: int,
+           files: int, sections: int, paragraphs: int) -> tuple[ScenarioResult, list[int]]:
+    '''
+    submits multi-file ZIP projects and waits for them to finish; the
+    latency is end to end, `submit` the time to accept the upload
+    '''
+
+    archives = [project_zip(rng, files, sections, paragraphs) for _ in range(jobs)]
+
+    def task(archive: bytes) -> Callable[[ScenarioResult], int]:
+        def run(result: ScenarioResult) -> int:
+            start = time.perf_counter()
+            status, body = client.post_multipart(
+                '/api/jobs',
+                {'model': '', 'input-prefix': '', 'src_lang': 'de', 'tgt_lang': 'en'},
+                {'document': ('project.zip', archive)})
+            if status != 200:
+                raise RuntimeError(f'HTTP {status}: {body[:200]!r}')
+            result.extra.setdefault('submit', []).append(time.perf_counter() - start)
+
+            job_id = int(client.json(body)['id'])
+            final_status = client.wait_for_job(job_id)
+            if final_status != 'done':
+                raise RuntimeError(f'Job {job_id} ended as {final_status}')
+            return job_id
+
+        return run
+
+    result, job_ids = run_concurrent('upload', concurrency,
+                                     [task(archive) for archive in archives])
+    return result, [job_id for job_id in job_ids if job_id is not None]
+
+
+def logs(client: Client, job_ids: list[int], viewers: int) -> ScenarioResult:
+    '''
+    `viewers` concurrent log viewers per job, each reading the whole log
+    '''
+
+    def task(job_id: int) -> Callable[[ScenarioResult], None]:
+        def run(result: ScenarioResult):
+            messages, received = client.follow_log(job_id)
+            result.extra.setdefault('messages', []).append(messages)
+            result.extra.setdefault('bytes', []).append(received)
+
+        return run
+
+    tasks = [task(job_id) for job_id in job_ids for _ in range(viewers)]
+    result, _ = run_concurrent('logs', max(1, len(tasks)), tasks)
+    return result
+
+
+def download(client: Client, job_ids: list[int], concurrency: int,
+             requests: int) -> ScenarioResult:
+    '''
+    concurrent downloads of the jobs' outputs, round robin
+    '''
+
+    def task(job_id: int) -> Callable[[ScenarioResult], None]:
+        def run(result: ScenarioResult):
+            status, body = client.get(f'/api/jobs/{job_id}/download')
+            if status != 200:
+                raise RuntimeError(f'HTTP {status}')
+            result.extra.setdefault('bytes', []).append(len(body))
+
+        return run
+
+    if len(job_ids) == 0:
+        return ScenarioResult('download', concurrency)
+
+    result, _ = run_concurrent('download', concurrency,
+                               [task(job_ids[n % len(job_ids)]) for n in range(requests)])
+    return result
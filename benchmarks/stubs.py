@@ -0,0 +1,73 @@
+import time
+
+from latexmt_web.proxy import TranslatorProxy
+
+# type imports
+from typing import Any, Callable
+
+
+class LatencySettings:
+    '''
+    simulated costs, in seconds: loading a model, per translated batch, per
+    segment of a batch, and per aligner call
+    '''
+
+    def __init__(self, load: float, batch: float, segment: float, align: float):
+        self.load = load
+        self.batch = batch
+        self.segment = segment
+        self.align = align
+
+
+class LatencyTranslator(TranslatorProxy):
+    '''
+    deterministic stand-in for a model: the wrapped `null` translator's
+    output, after the configured delay
+    '''
+
+    def __init__(self, translator: Any, latency: LatencySettings):
+        super().__init__(translator)
+        self.latency = latency
+
+    def _translate_segments(self, segments: list[str]) -> list[str]:
+        if len(segments) > 0:
+            time.sleep(self.latency.batch + self.latency.segment * len(segments))
+        return super()._translate_segments(segments)
+
+
+class LatencyAligner:
+    def __init__(self, aligner: Any, latency: LatencySettings):
+        self._aligner = aligner
+        self._latency = latency
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._aligner, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            time.sleep(self._latency.align)
+            return attr(*args, **kwargs)
+
+        return call
+
+
+def install_stubs(latency: LatencySettings, stub_align_type: str) -> Callable:
+    '''
+    makes every translator pool load a `null` translator and aligner wrapped
+    with `latency`, whatever translator is configured; returns the original
+    loader
+    '''
+
+    from latexmt_web import translator as translator_module
+
+    original = translator_module.get_translator_aligner_base
+
+    def load_stub(src_lang: str, tgt_lang: str, trans_type: str, align_type: str, **kwargs):
+        time.sleep(latency.load)
+        translator, aligner = original(src_lang=src_lang, tgt_lang=tgt_lang,
+                                       trans_type='null', align_type=stub_align_type, **kwargs)
+        return LatencyTranslator(translator, latency), LatencyAligner(aligner, latency)
+
+    translator_module.get_translator_aligner_base = load_stub  # type: ignore
+    return original
@@ -0,0 +1,255 @@
+from collections import OrderedDict, deque
+from flask import current_app
+import math
+import time
+from threading import Lock
+
+from .configure import ConfigKey
+from .metrics import Counter, register
+
+# type imports
+from typing import Any, Optional
+
+
+rejected_requests = register(Counter(
+    'latexmt_rejected_requests_total', 'Requests rejected by admission control',
+    ('kind', 'reason')))
+
+
+class Overloaded(Exception):
+    '''
+    the request is not admitted; clients should retry after `retry_after`
+    seconds
+    '''
+
+    def __init__(self, message: str, status: int, retry_after: int):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+
+    def take(self) -> float:
+        '''
+        takes a token; returns 0 on success, otherwise the seconds until a
+        token will be available
+        '''
+
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+
+        return (1 - self._tokens) / self.rate
+
+
+class ClientLimiter:
+    '''
+    a token bucket per client; the least recently seen clients are forgotten
+    beyond `max_clients`
+    '''
+
+    def __init__(self, rate_per_minute: int, burst: int, max_clients: int = 10_000):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_clients = max_clients
+
+        self._mutex = Lock()
+        self._buckets = OrderedDict[str, TokenBucket]()
+
+    def check(self, client: str, kind: str):
+        with self._mutex:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(client)
+
+            wait = bucket.take()
+
+        if wait > 0:
+            rejected_requests.inc(kind=kind, reason='client_rate')
+            raise Overloaded('Too many requests', 429, math.ceil(wait))
+
+
+class ServiceRate:
+    '''
+    completions per second over the last `window` seconds (or since
+    created, if that is shorter)
+    '''
+
+    def __init__(self, window: float):
+        self.window = window
+        self._created = time.monotonic()
+        self._completions = deque[float]()
+
+    def _trim(self, now: float):
+        while len(self._completions) > 0 and now - self._completions[0] > self.window:
+            self._completions.popleft()
+
+    def observe(self):
+        now = time.monotonic()
+        self._completions.append(now)
+        self._trim(now)
+
+    def rate(self) -> Optional[float]:
+        now = time.monotonic()
+        self._trim(now)
+
+        span = min(self.window, now - self._created)
+        if len(self._completions) == 0 or span <= 0:
+            return None
+        return len(self._completions) / span
+
+    def retry_after(self, backlog: int, default: int, limit: int) -> int:
+        '''
+        the seconds needed to work off `backlog` at the observed rate, or
+        `default` without observations
+        '''
+
+        rate = self.rate()
+        if rate is None:
+            return default
+        return max(1, min(limit, math.ceil(backlog / rate)))
+
+
+class InteractiveSlot:
+    '''
+    a place in a pair's interactive budget, held until `release`d
+    '''
+
+    def __init__(self, controller: 'AdmissionController', pair: str):
+        self.controller = controller
+        self.pair = pair
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._leave_interactive(self.pair)
+
+    def __enter__(self) -> 'InteractiveSlot':
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+
+class AdmissionController:
+    '''
+    bounds the work accepted per language pair, with separate budgets for
+    interactive requests (being translated or waiting for a replica) and
+    jobs (not finished yet), and the request rate per client
+
+    a budget of 0 disables the respective bound
+    '''
+
+    # seconds of completions the service rate is observed over
+    interactive_window = 60
+    job_window = 3600
+
+    def __init__(self, interactive_limit: int, job_limit: int,
+                 client_limiter: Optional[ClientLimiter]):
+        self.interactive_limit = interactive_limit
+        self.job_limit = job_limit
+        self.client_limiter = client_limiter
+
+        self._mutex = Lock()
+        self._interactive = dict[str, int]()
+        self._interactive_rates = dict[str, ServiceRate]()
+        self._job_rates = dict[str, ServiceRate]()
+
+    def check_client(self, client: str, kind: str):
+        if self.client_limiter is not None:
+            self.client_limiter.check(client, kind)
+
+    def enter_interactive(self, pair: str) -> InteractiveSlot:
+        with self._mutex:
+            active = self._interactive.get(pair, 0)
+            rate = self._interactive_rates.setdefault(pair, ServiceRate(self.interactive_window))
+
+            if self.interactive_limit > 0 and active >= self.interactive_limit:
+                retry_after = rate.retry_after(active - self.interactive_limit + 1,
+                                               default=1, limit=60)
+                rejected_requests.inc(kind='interactive', reason='capacity')
+                raise Overloaded(f'Too many requests for {pair}, try again later',
+                                 503, retry_after)
+
+            self._interactive[pair] = active + 1
+
+        return InteractiveSlot(self, pair)
+
+    def _leave_interactive(self, pair: str):
+        with self._mutex:
+            self._interactive[pair] -= 1
+            if self._interactive[pair] == 0:
+                del self._interactive[pair]
+            self._interactive_rates[pair].observe()
+
+    def check_job(self, pair: str, unfinished: int):
+        '''
+        `unfinished` is the number of jobs of the pair not finished yet
+        '''
+
+        with self._mutex:
+            rate = self._job_rates.setdefault(pair, ServiceRate(self.job_window))
+            if self.job_limit <= 0 or unfinished < self.job_limit:
+                return
+
+            retry_after = rate.retry_after(unfinished - self.job_limit + 1,
+                                           default=60, limit=3600)
+
+        rejected_requests.inc(kind='job', reason='capacity')
+        raise Overloaded(f'Too many jobs for {pair}, try again later', 503, retry_after)
+
+    def job_finished(self, pair: str):
+        with self._mutex:
+            self._job_rates.setdefault(pair, ServiceRate(self.job_window)).observe()
+
+    def stats(self) -> dict[str, Any]:
+        with self._mutex:
+            return {
+                'interactive_limit': self.interactive_limit,
+                'job_limit': self.job_limit,
+                'interactive': dict(self._interactive),
+                'interactive_rates': {pair: rate.rate()
+                                      for pair, rate in self._interactive_rates.items()},
+                'job_rates': {pair: rate.rate() for pair, rate in self._job_rates.items()},
+            }
+
+
+__admission: Optional[AdmissionController] = None
+__admission_mutex = Lock()
+
+
+def get_admission() -> AdmissionController:
+    global __admission
+
+    config = current_app.config
+
+    with __admission_mutex:
+        if __admission is None:
+            client_limiter = None
+            if config[ConfigKey.CLIENT_RATE_PER_MINUTE] > 0:
+                client_limiter = ClientLimiter(config[ConfigKey.CLIENT_RATE_PER_MINUTE],
+                                               burst=config[ConfigKey.CLIENT_BURST])
+
+            __admission = AdmissionController(
+                interactive_limit=config[ConfigKey.ADMISSION_INTERACTIVE_LIMIT],
+                job_limit=config[ConfigKey.ADMISSION_JOB_LIMIT],
+                client_limiter=client_limiter,
+            )
+
+    return __admission
@@ -0,0 +1,74 @@
+import os
+from zipfile import ZipFile, ZipInfo, ZIP_STORED
+
+from .dirs import archive_base
+
+# type imports
+from pathlib import Path
+from typing import Iterator
+
+
+def archive_filename(job_id: int) -> Path:
+    return archive_base().joinpath(f'{job_id}.zip')
+
+
+def output_files(output_dir: Path) -> list[Path]:
+    return sorted(path for path in output_dir.rglob('*') if path.is_file())
+
+
+class _ChunkWriter:
+    '''
+    unseekable file object collecting what `ZipFile` writes, to be passed on
+    in chunks
+    '''
+
+    def __init__(self):
+        self._chunks = list[bytes]()
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(output_dir: Path, files: list[Path],
+               chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    '''
+    yields a ZIP archive of `files` (relative to `output_dir`) while it is
+    being written, holding at most about `chunk_size` bytes in memory
+    '''
+
+    writer = _ChunkWriter()
+    with ZipFile(writer, mode='w', compression=ZIP_STORED) as zf:  # type: ignore
+        for file in files:
+            zinfo = ZipInfo.from_file(file, arcname=str(file.relative_to(output_dir)))
+            zinfo.compress_type = ZIP_STORED
+
+            with open(file, 'rb') as src, zf.open(zinfo, mode='w') as dst:
+                while len(chunk := src.read(chunk_size)) > 0:
+                    dst.write(chunk)
+                    yield writer.take()
+
+            yield writer.take()
+
+    # central directory
+    yield writer.take()
+
+
+def build_zip(output_dir: Path, path: Path):
+    '''
+    writes the ZIP archive of all files in `output_dir` to `path`, atomically
+    '''
+
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as tmp_file:
+        for chunk in stream_zip(output_dir, output_files(output_dir)):
+            tmp_file.write(chunk)
+    os.replace(tmp_path, path)
@@ -0,0 +1,179 @@
+from concurrent.futures import Future
+import heapq
+import itertools
+import logging
+import time
+from threading import Condition, Thread, current_thread
+
+from .pool import Priority, ReplicaPool
+from .proxy import TranslatorProxy, translate_segments
+
+# type imports
+from typing import Any, Optional
+from latexmt_core.translation import Translator
+
+
+class BatchItem:
+    def __init__(self, priority: Priority, seq: int, segment: str):
+        self.priority = priority
+        self.seq = seq
+        self.segment = segment
+        self.enqueued = time.monotonic()
+        self.future = Future[str]()
+
+    def __lt__(self, other: 'BatchItem') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class BatchScheduler:
+    '''
+    coalesces segments submitted concurrently by several callers into batches
+    of at most `max_size` segments, waiting at most `max_wait` seconds for a
+    batch to fill up
+
+    each batch is run on a replica checked out of `pool`; there is one
+    dispatcher thread per potential replica so that replicas run in parallel,
+    and dispatchers exit after `idle_exit` seconds without work, so that the
+    threads of a pool which is no longer used do not linger
+    '''
+
+    idle_exit = 60.0
+
+    def __init__(self, pool: ReplicaPool, max_size: int, max_wait: float):
+        self.pool = pool
+        self.max_size = max_size
+        self.max_wait = max_wait
+
+        self._cond = Condition()
+        self._queue = list[BatchItem]()
+        self._seq = itertools.count()
+        self._dispatchers = list[Thread]()
+        self._stopped = False
+
+        self._batches = 0
+        self._segments = 0
+        self._queue_time = 0.0
+
+        self.logger = logging.getLogger(__name__).getChild(pool.name)
+
+    def _start(self):
+        # dispatchers remove themselves when they exit, see `_next_batch`
+        while len(self._dispatchers) < self.pool.max_replicas:
+            dispatcher = Thread(target=self._dispatch, daemon=True,
+                                name=f'batch-{self.pool.name}-{len(self._dispatchers)}')
+            dispatcher.start()
+            self._dispatchers.append(dispatcher)
+
+    def submit(self, segments: list[str], priority: Priority) -> list[Future[str]]:
+        items = [BatchItem(priority, next(self._seq), segment) for segment in segments]
+
+        with self._cond:
+            self._start()
+            for item in items:
+                heapq.heappush(self._queue, item)
+            self._cond.notify_all()
+
+        return [item.future for item in items]
+
+    def stop(self):
+        '''
+        lets the dispatchers exit once the queue is empty
+        '''
+
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _next_batch(self) -> Optional[list[BatchItem]]:
+        '''
+        returns `None` once stopped or idle for `idle_exit` seconds, and out
+        of work
+        '''
+
+        with self._cond:
+            idle_since = time.monotonic()
+            while len(self._queue) == 0:
+                idle = time.monotonic() - idle_since
+                if self._stopped or idle >= self.idle_exit:
+                    # `submit` starts a new dispatcher if needed
+                    self._dispatchers.remove(current_thread())
+                    return None
+                self._cond.wait(self.idle_exit - idle)
+
+            # the oldest waiting segment bounds how long the batch may fill up
+            deadline = min(item.enqueued for item in self._queue) + self.max_wait
+            while len(self._queue) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+                if len(self._queue) == 0:
+                    # taken by another dispatcher
+                    return []
+
+            batch = [heapq.heappop(self._queue)
+                     for _ in range(min(self.max_size, len(self._queue)))]
+
+            now = time.monotonic()
+            self._batches += 1
+            self._segments += len(batch)
+            self._queue_time += sum(now - item.enqueued for item in batch)
+
+        return batch
+
+    def _dispatch(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if len(batch) == 0:
+                continue
+
+            priority = min(item.priority for item in batch)
+            try:
+                with self.pool.checkout(priority) as (translator, _):
+                    results = translate_segments(
+                        translator, [item.segment for item in batch])
+            except Exception as err:
+                self.logger.warning(f'Error translating batch: {err}')
+                for item in batch:
+                    item.future.set_exception(err)
+                continue
+
+            for item, result in zip(batch, results):
+                item.future.set_result(result)
+
+    def translator(self, translator: Translator, priority: Priority) -> Translator:
+        return BatchingTranslator(translator, self, priority)  # type: ignore
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            return {
+                'batches': self._batches,
+                'segments': self._segments,
+                'queued': len(self._queue),
+                'max_size': self.max_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'mean_batch_size': self._segments / self._batches if self._batches > 0 else 0.0,
+                'fill_rate': (self._segments / (self._batches * self.max_size)
+                              if self._batches > 0 else 0.0),
+                'mean_queue_time': self._queue_time / self._segments if self._segments > 0 else 0.0,
+            }
+
+
+class BatchingTranslator(TranslatorProxy):
+    '''
+    sends every segment through the `BatchScheduler` and waits for the results;
+    `translator` is only used to look up attributes other than segment
+    translation
+    '''
+
+    def __init__(self, translator: Translator, scheduler: BatchScheduler,
+                 priority: Priority):
+        super().__init__(translator)
+        self.scheduler = scheduler
+        self.priority = priority
+
+    def _translate_segments(self, segments: list[str]) -> list[str]:
+        futures = self.scheduler.submit(segments, self.priority)
+        return [future.result() for future in futures]
@@ -0,0 +1,289 @@
+from collections import OrderedDict
+from flask import current_app
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from threading import Lock
+
+from .configure import ConfigKey
+from .dirs import basedir
+
+# type imports
+from pathlib import Path
+from typing import Any, Optional
+
+
+def result_cache_filename(): return basedir().joinpath('result_cache.sqlite3')
+
+
+def normalize_text(text: str) -> str:
+    '''
+    strips trailing whitespace from every line and leading/trailing empty
+    lines, so that re-pasted snippets map to the same cache key
+    '''
+
+    return '\n'.join(line.rstrip() for line in text.splitlines()).strip('\n')
+
+
+def glossary_hash(glossary: Optional[str]) -> str:
+    lines = [line.strip() for line in (glossary or '').splitlines()]
+    content = '\n'.join(line for line in lines if len(line) > 0)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def texfmt_signature() -> list[Any]:
+    '''
+    identifies the formatter configuration; the config file's mtime is
+    included so that editing it invalidates previously formatted results
+    '''
+
+    config = current_app.config
+
+    texfmt_bin = config[ConfigKey.TEXFMT_BIN]
+    texfmt_conf = config[ConfigKey.TEXFMT_CONF]
+
+    if texfmt_bin is None or texfmt_bin == '':
+        return [None, None, None]
+
+    texfmt_conf_mtime = None
+    if texfmt_conf is not None and texfmt_conf != '':
+        try:
+            texfmt_conf_mtime = os.stat(texfmt_conf).st_mtime_ns
+        except OSError:
+            pass
+
+    return [texfmt_bin, texfmt_conf, texfmt_conf_mtime]
+
+
+def result_key(input_text: str, src_lang: str, tgt_lang: str,
+               trans_type: str, align_type: str,
+               glossary: Optional[str], mask_str: str,
+               paragraphs: bool = False) -> str:
+    '''
+    `paragraphs` is set for outputs translated paragraph by paragraph, which
+    differ from those of the whole input
+    '''
+
+    key_data = [
+        normalize_text(input_text),
+        src_lang,
+        tgt_lang,
+        trans_type,
+        align_type,
+        glossary_hash(glossary),
+        mask_str,
+        texfmt_signature(),
+    ]
+    if paragraphs:
+        key_data.append('paragraphs')
+
+    return hashlib.sha256(
+        json.dumps(key_data, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    '''
+    two-tier cache for translated snippets: an in-memory LRU bounded by
+    `mem_bytes`, backed by an SQLite store at `path` bounded by `disk_bytes`
+    (a budget of 0 disables the respective tier)
+    '''
+
+    def __init__(self, path: Path, mem_bytes: int, disk_bytes: int):
+        self.path = path
+        self.mem_bytes = mem_bytes
+        self.disk_bytes = disk_bytes
+
+        self._mutex = Lock()
+        self._entries = OrderedDict[str, str]()
+        self._mem_size = 0
+        # guards the disk tier's size and evictions
+        self._disk_mutex = Lock()
+        self._disk_size: Optional[int] = None
+
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._disk_evictions = 0
+
+        self.logger = logging.getLogger(__name__)
+
+    def _connect(self) -> sqlite3.Connection:
+        sql = '''
+            create table if not exists results(
+                key text primary key not null,
+                value text not null,
+                size integer not null,
+                accessed real not null)
+        '''
+
+        # like the job database, so that readers do not wait for writers
+        con = sqlite3.connect(self.path, timeout=30)
+        con.execute('pragma journal_mode = wal')
+        con.execute('pragma synchronous = normal')
+        con.cursor().execute(sql)
+
+        return con
+
+    @staticmethod
+    def _sizeof(key: str, value: str) -> int:
+        return len(key) + len(value.encode('utf-8'))
+
+    def _mem_put(self, key: str, value: str):
+        if key in self._entries:
+            self._mem_size -= self._sizeof(key, self._entries.pop(key))
+
+        size = self._sizeof(key, value)
+        if size > self.mem_bytes:
+            return
+
+        self._entries[key] = value
+        self._mem_size += size
+
+        while self._mem_size > self.mem_bytes:
+            old_key, old_value = self._entries.popitem(last=False)
+            self._mem_size -= self._sizeof(old_key, old_value)
+            self._evictions += 1
+
+    def get(self, key: str) -> Optional[str]:
+        with self._mutex:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key]
+
+        value = None
+        if self.disk_bytes > 0:
+            try:
+                value = self._disk_get(key)
+            except sqlite3.Error as err:
+                # a miss rather than a failed translation
+                self.logger.warning(f'Error reading the result cache: {err}')
+
+        with self._mutex:
+            if value is None:
+                self._misses += 1
+            else:
+                self._disk_hits += 1
+                if self.mem_bytes > 0:
+                    self._mem_put(key, value)
+
+        return value
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        con = self._connect()
+        try:
+            cur = con.cursor()
+            row = cur.execute('select value from results where key = ?',
+                              (key,)).fetchone()
+            if row is None:
+                return None
+
+            cur.execute('update results set accessed = ? where key = ?',
+                        (time.time(), key))
+            con.commit()
+            return row[0]
+        finally:
+            con.close()
+
+    def put(self, key: str, value: str):
+        if self.mem_bytes > 0:
+            with self._mutex:
+                self._mem_put(key, value)
+
+        if self.disk_bytes <= 0:
+            return
+
+        size = self._sizeof(key, value)
+        if size > self.disk_bytes:
+            return
+
+        try:
+            self._disk_put(key, value, size)
+        except sqlite3.Error as err:
+            self.logger.warning(f'Error writing the result cache: {err}')
+
+    def _disk_put(self, key: str, value: str, size: int):
+        con = self._connect()
+        cur = con.cursor()
+
+        # not `_mutex`, so that memory hits do not wait for the disk
+        with self._disk_mutex:
+            try:
+                if self._disk_size is None:
+                    self._disk_size = cur.execute(
+                        'select coalesce(sum(size), 0) from results').fetchone()[0]
+                disk_size = self._disk_size
+
+                row = cur.execute('select size from results where key = ?',
+                                  (key,)).fetchone()
+                if row is not None:
+                    disk_size -= row[0]
+
+                cur.execute('''
+                    insert or replace into results (key, value, size, accessed)
+                        values (?, ?, ?, ?)
+                ''', (key, value, size, time.time()))
+                disk_size += size
+
+                # evict least recently accessed entries until within budget
+                evictions = 0
+                while disk_size > self.disk_bytes:
+                    row = cur.execute('''
+                        select key, size from results
+                            order by accessed asc limit 1
+                    ''').fetchone()
+                    if row is None:
+                        disk_size = 0
+                        break
+
+                    cur.execute('delete from results where key = ?', (row[0],))
+                    disk_size -= row[1]
+                    evictions += 1
+
+                con.commit()
+            except BaseException:
+                con.rollback()
+                raise
+            finally:
+                con.close()
+
+            self._disk_size = disk_size
+            self._disk_evictions += evictions
+
+    def stats(self) -> dict[str, int]:
+        with self._mutex:
+            return {
+                'hits': self._hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'disk_evictions': self._disk_evictions,
+                'mem_entries': len(self._entries),
+                'mem_bytes': self._mem_size,
+                'mem_bytes_limit': self.mem_bytes,
+                'disk_bytes': self._disk_size or 0,
+                'disk_bytes_limit': self.disk_bytes,
+            }
+
+
+__result_cache_mutex = Lock()
+__result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> ResultCache:
+    global __result_cache
+    config = current_app.config
+
+    with __result_cache_mutex:
+        if __result_cache is None:
+            __result_cache = ResultCache(
+                result_cache_filename(),
+                mem_bytes=config[ConfigKey.RESULT_CACHE_MEM_BYTES],
+                disk_bytes=config[ConfigKey.RESULT_CACHE_DISK_BYTES],
+            )
+
+    return __result_cache
@@ -20,6 +20,53 @@ class LatexMtConfig():
     texfmt_conf: Optional[str]
     enable_jobs: Optional[bool]
     endpoint: Optional[str]
+    result_cache_mem_bytes: Optional[int]
+    result_cache_disk_bytes: Optional[int]
+    translation_memory_max_entries: Optional[int]
+    translation_memory_ttl: Optional[int]
+    max_replicas: Optional[int]
+    replica_memory_budget: Optional[int]
+    replica_idle_timeout: Optional[int]
+    batch_max_size: Optional[int]
+    batch_max_wait_ms: Optional[int]
+    job_file_workers: Optional[int]
+    job_concurrency: Optional[int]
+    job_pair_concurrency: Optional[int]
+    job_lease_seconds: Optional[int]
+    job_stop_timeout: Optional[int]
+    job_progress_interval: Optional[int]
+    enable_translation: Optional[bool]
+    worker_pairs: Optional[list[str]]
+    log_buffer_bytes: Optional[int]
+    prebuild_download_zip: Optional[bool]
+    upload_extensions: Optional[list[str]]
+    upload_max_bytes: Optional[int]
+    upload_max_entries: Optional[int]
+    texfmt_workers: Optional[int]
+    texfmt_timeout: Optional[int]
+    texfmt_cache_bytes: Optional[int]
+    max_loaded_pairs: Optional[int]
+    model_memory_budget: Optional[int]
+    preload: Optional[list[str]]
+    api_client_ttl: Optional[int]
+    api_client_max: Optional[int]
+    remote_clients: Optional[int]
+    remote_max_concurrency: Optional[int]
+    remote_chunk_size: Optional[int]
+    remote_retries: Optional[int]
+    remote_backoff_ms: Optional[int]
+    glossary_cache_entries: Optional[int]
+    admission_interactive_limit: Optional[int]
+    admission_job_limit: Optional[int]
+    client_rate_per_minute: Optional[int]
+    client_burst: Optional[int]
+    trusted_proxies: Optional[int]
+    retention_ttl: Optional[dict[str, int]]
+    disk_quota_bytes: Optional[int]
+    compress_logs_after: Optional[int]
+    retention_interval: Optional[int]
+    retention_batch: Optional[int]
+    admin_token: Optional[str]
 
 
 class ConfigKey(StrEnum):
@@ -31,6 +78,53 @@ class ConfigKey(StrEnum):
     TEXFMT_CONF = 'LATEXMT_TEXFMT_CONF'
     ENABLE_JOBS = 'LATEXMT_ENABLE_JOBS'
     ENDPOINT = 'LATEXMT_ENDPOINT'
+    RESULT_CACHE_MEM_BYTES = 'LATEXMT_RESULT_CACHE_MEM_BYTES'
+    RESULT_CACHE_DISK_BYTES = 'LATEXMT_RESULT_CACHE_DISK_BYTES'
+    TRANSLATION_MEMORY_MAX_ENTRIES = 'LATEXMT_TRANSLATION_MEMORY_MAX_ENTRIES'
+    TRANSLATION_MEMORY_TTL = 'LATEXMT_TRANSLATION_MEMORY_TTL'
+    MAX_REPLICAS = 'LATEXMT_MAX_REPLICAS'
+    REPLICA_MEMORY_BUDGET = 'LATEXMT_REPLICA_MEMORY_BUDGET'
+    REPLICA_IDLE_TIMEOUT = 'LATEXMT_REPLICA_IDLE_TIMEOUT'
+    BATCH_MAX_SIZE = 'LATEXMT_BATCH_MAX_SIZE'
+    BATCH_MAX_WAIT_MS = 'LATEXMT_BATCH_MAX_WAIT_MS'
+    JOB_FILE_WORKERS = 'LATEXMT_JOB_FILE_WORKERS'
+    JOB_CONCURRENCY = 'LATEXMT_JOB_CONCURRENCY'
+    JOB_PAIR_CONCURRENCY = 'LATEXMT_JOB_PAIR_CONCURRENCY'
+    JOB_LEASE_SECONDS = 'LATEXMT_JOB_LEASE_SECONDS'
+    JOB_STOP_TIMEOUT = 'LATEXMT_JOB_STOP_TIMEOUT'
+    JOB_PROGRESS_INTERVAL = 'LATEXMT_JOB_PROGRESS_INTERVAL'
+    ENABLE_TRANSLATION = 'LATEXMT_ENABLE_TRANSLATION'
+    WORKER_PAIRS = 'LATEXMT_WORKER_PAIRS'
+    LOG_BUFFER_BYTES = 'LATEXMT_LOG_BUFFER_BYTES'
+    PREBUILD_DOWNLOAD_ZIP = 'LATEXMT_PREBUILD_DOWNLOAD_ZIP'
+    UPLOAD_EXTENSIONS = 'LATEXMT_UPLOAD_EXTENSIONS'
+    UPLOAD_MAX_BYTES = 'LATEXMT_UPLOAD_MAX_BYTES'
+    UPLOAD_MAX_ENTRIES = 'LATEXMT_UPLOAD_MAX_ENTRIES'
+    TEXFMT_WORKERS = 'LATEXMT_TEXFMT_WORKERS'
+    TEXFMT_TIMEOUT = 'LATEXMT_TEXFMT_TIMEOUT'
+    TEXFMT_CACHE_BYTES = 'LATEXMT_TEXFMT_CACHE_BYTES'
+    MAX_LOADED_PAIRS = 'LATEXMT_MAX_LOADED_PAIRS'
+    MODEL_MEMORY_BUDGET = 'LATEXMT_MODEL_MEMORY_BUDGET'
+    PRELOAD = 'LATEXMT_PRELOAD'
+    API_CLIENT_TTL = 'LATEXMT_API_CLIENT_TTL'
+    API_CLIENT_MAX = 'LATEXMT_API_CLIENT_MAX'
+    REMOTE_CLIENTS = 'LATEXMT_REMOTE_CLIENTS'
+    REMOTE_MAX_CONCURRENCY = 'LATEXMT_REMOTE_MAX_CONCURRENCY'
+    REMOTE_CHUNK_SIZE = 'LATEXMT_REMOTE_CHUNK_SIZE'
+    REMOTE_RETRIES = 'LATEXMT_REMOTE_RETRIES'
+    REMOTE_BACKOFF_MS = 'LATEXMT_REMOTE_BACKOFF_MS'
+    GLOSSARY_CACHE_ENTRIES = 'LATEXMT_GLOSSARY_CACHE_ENTRIES'
+    ADMISSION_INTERACTIVE_LIMIT = 'LATEXMT_ADMISSION_INTERACTIVE_LIMIT'
+    ADMISSION_JOB_LIMIT = 'LATEXMT_ADMISSION_JOB_LIMIT'
+    CLIENT_RATE_PER_MINUTE = 'LATEXMT_CLIENT_RATE_PER_MINUTE'
+    CLIENT_BURST = 'LATEXMT_CLIENT_BURST'
+    TRUSTED_PROXIES = 'LATEXMT_TRUSTED_PROXIES'
+    RETENTION_TTL = 'LATEXMT_RETENTION_TTL'
+    DISK_QUOTA_BYTES = 'LATEXMT_DISK_QUOTA_BYTES'
+    COMPRESS_LOGS_AFTER = 'LATEXMT_COMPRESS_LOGS_AFTER'
+    RETENTION_INTERVAL = 'LATEXMT_RETENTION_INTERVAL'
+    RETENTION_BATCH = 'LATEXMT_RETENTION_BATCH'
+    ADMIN_TOKEN = 'LATEXMT_ADMIN_TOKEN'
 
 
 def get_config_path() -> Path:
@@ -52,9 +146,126 @@ def latexmt_configure(app: Flask, path: Path = get_config_path()):
     if config.enable_jobs is None:
         config.enable_jobs = False
 
+    if config.enable_translation is None:
+        config.enable_translation = True
+
     if config.log_level is None:
         config.log_level = 'INFO'
 
+    if config.result_cache_mem_bytes is None:
+        config.result_cache_mem_bytes = 64 * 1024 * 1024
+
+    if config.result_cache_disk_bytes is None:
+        config.result_cache_disk_bytes = 1024 * 1024 * 1024
+
+    if config.translation_memory_max_entries is None:
+        config.translation_memory_max_entries = 1_000_000
+
+    if config.translation_memory_ttl is None:
+        config.translation_memory_ttl = 90 * 24 * 60 * 60
+
+    if config.max_replicas is None:
+        config.max_replicas = 1
+
+    if config.replica_idle_timeout is None:
+        config.replica_idle_timeout = 10 * 60
+
+    if config.batch_max_size is None:
+        config.batch_max_size = 1
+
+    if config.batch_max_wait_ms is None:
+        config.batch_max_wait_ms = 10
+
+    if config.api_client_ttl is None:
+        config.api_client_ttl = 15 * 60
+
+    if config.api_client_max is None:
+        config.api_client_max = 64
+
+    if config.remote_clients is None:
+        config.remote_clients = 4
+
+    if config.remote_max_concurrency is None:
+        config.remote_max_concurrency = 64
+
+    if config.remote_chunk_size is None:
+        config.remote_chunk_size = 8
+
+    if config.remote_retries is None:
+        config.remote_retries = 3
+
+    if config.remote_backoff_ms is None:
+        config.remote_backoff_ms = 200
+
+    if config.job_file_workers is None:
+        config.job_file_workers = 4
+
+    if config.job_concurrency is None:
+        config.job_concurrency = 2
+
+    if config.job_pair_concurrency is None:
+        config.job_pair_concurrency = 1
+
+    if config.job_lease_seconds is None:
+        config.job_lease_seconds = 60
+
+    if config.job_stop_timeout is None:
+        config.job_stop_timeout = 300
+
+    if config.job_progress_interval is None:
+        config.job_progress_interval = 2
+
+    if config.log_buffer_bytes is None:
+        config.log_buffer_bytes = 256 * 1024
+
+    if config.prebuild_download_zip is None:
+        config.prebuild_download_zip = False
+
+    if config.upload_extensions is None:
+        config.upload_extensions = ['.tex', '.Rnw']
+
+    if config.upload_max_bytes is None:
+        config.upload_max_bytes = 256 * 1024 * 1024
+
+    if config.upload_max_entries is None:
+        config.upload_max_entries = 10_000
+
+    if config.texfmt_workers is None:
+        config.texfmt_workers = 4
+
+    if config.texfmt_timeout is None:
+        config.texfmt_timeout = 10
+
+    if config.texfmt_cache_bytes is None:
+        config.texfmt_cache_bytes = 16 * 1024 * 1024
+
+    if config.glossary_cache_entries is None:
+        config.glossary_cache_entries = 32
+
+    if config.admission_interactive_limit is None:
+        config.admission_interactive_limit = 64
+
+    if config.admission_job_limit is None:
+        config.admission_job_limit = 100
+
+    if config.client_rate_per_minute is None:
+        config.client_rate_per_minute = 0
+
+    if config.client_burst is None:
+        config.client_burst = 30
+
+    if config.trusted_proxies is None:
+        config.trusted_proxies = 0
+
+    if config.retention_ttl is None:
+        config.retention_ttl = {}
+
+    if config.retention_interval is None:
+        config.retention_interval = 5 * 60
+
+    if config.retention_batch is None:
+        config.retention_batch = 100
+
     for field in fields(config):
         app.config['LATEXMT_' + field.name.upper()] = \
             getattr(config, field.name)
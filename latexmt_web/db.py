@@ -1,17 +1,121 @@
+import json
 import sqlite3
+from contextlib import contextmanager
 from copy import deepcopy
+import threading
+import time
 
 from .dirs import basedir
+from .events import job_events
 from .job import Job
+from .metrics import timed_db
 
 # type imports
-from typing import Optional
+from typing import Any, Iterator, Optional
 
 
 def db_filename(): return basedir().joinpath('latexmt.sqlite3')
 
 
-def __connect() -> sqlite3.Connection:
+# columns added after the initial schema, as (name, declaration)
+__added_columns = [
+    ('use_translation_memory', 'integer not null default 1'),
+    ('priority', 'integer not null default 0'),
+    ('created', 'real'),
+    ('lease_owner', 'text'),
+    ('lease_expires', 'real'),
+    ('heartbeat', 'real'),
+    ('attempts', 'integer not null default 0'),
+    ('updated', 'real'),
+    ('updated_by', 'text'),
+    ('base_job_id', 'integer'),
+    ('progress', 'text'),
+    ('glossary_id', 'text'),
+    ('fingerprint', 'text'),
+    ('duplicate_of', 'integer'),
+    ('disk_bytes', 'integer'),
+    ('log_compressed', 'integer not null default 0'),
+    ('parameters', 'text'),
+    ('change_seq', 'integer not null default 0'),
+]
+
+__indexes = [
+    'create index if not exists jobs_status_id on jobs(status, id)',
+    'create index if not exists jobs_created on jobs(created)',
+    'create index if not exists jobs_pair_status on jobs(src_lang, tgt_lang, status)',
+    'create index if not exists jobs_updated on jobs(updated)',
+    'create index if not exists jobs_fingerprint on jobs(fingerprint)',
+    'create index if not exists jobs_duplicate_of on jobs(duplicate_of)',
+    'create index if not exists jobs_status_updated on jobs(status, updated)',
+    'create index if not exists jobs_base_job_id on jobs(base_job_id)',
+    'create index if not exists jobs_change_seq on jobs(change_seq)',
+]
+
+# every insert, update (setting `updated`) and deletion of a job bumps the
+# counter in `job_changes`, and inserted and updated jobs record it as their
+# `change_seq`; as writes are serialised, it grows in commit order, unlike
+# `updated`, which is set by the clocks of several processes
+__triggers = [
+    '''create trigger if not exists jobs_inserted after insert on jobs begin
+        update job_changes set seq = seq + 1;
+        update jobs set change_seq = (select seq from job_changes) where id = new.id;
+    end''',
+    '''create trigger if not exists jobs_updated after update of updated on jobs begin
+        update job_changes set seq = seq + 1;
+        update jobs set change_seq = (select seq from job_changes) where id = new.id;
+    end''',
+    '''create trigger if not exists jobs_deleted after delete on jobs begin
+        update job_changes set seq = seq + 1;
+    end''',
+]
+
+__pragmas = [
+    'pragma journal_mode = wal',
+    'pragma synchronous = normal',
+    'pragma busy_timeout = 30000',
+    'pragma temp_store = memory',
+    'pragma cache_size = -8192',
+]
+
+__job_columns = '''id, status, src_lang, tgt_lang, download_url, glossary,
+    use_translation_memory, priority, created, base_job_id, progress,
+    glossary_id, fingerprint, duplicate_of, parameters'''
+
+# statuses of jobs which are claimed by a worker
+running_statuses = ('initialising', 'processing')
+
+# statuses of jobs with complete outputs
+reusable_statuses = ('done', 'archived')
+
+# statuses after which a job does not change anymore (but for `done`
+# becoming `archived`)
+finished_statuses = ('done', 'error', 'archived')
+
+# condition on `jobs` excluding jobs which unfinished jobs still reuse the
+# outputs of, see `Job.base_job_id`
+__not_in_use_as_base = f'''not exists (
+    select 1 from jobs as revised
+        where revised.base_job_id = jobs.id
+            and revised.status in {('uploading', 'new', 'waiting', *running_statuses)})'''
+
+
+class LeaseLost(Exception):
+    '''
+    raised by writes on behalf of a job's lease owner once the job is no
+    longer leased to it (e.g. because it was re-queued and claimed again)
+    '''
+
+    def __init__(self, job_id: int):
+        super().__init__(f'Job {job_id} is no longer leased to this worker')
+        self.job_id = job_id
+
+
+__local = threading.local()
+__migrated_mutex = threading.Lock()
+__migrated = set[str]()
+
+
+def __migrate(con: sqlite3.Connection):
     sql = '''
         create table if not exists jobs(
             id integer primary key not null,
@@ -22,72 +126,202 @@ def __connect() -> sqlite3.Connection:
             glossary text)
     '''
 
-    con = sqlite3.connect(db_filename())
-    con.cursor().execute(sql)
+    cur = con.cursor()
+    with __transaction(con):
+        cur.execute(sql)
+
+        columns = {row[1] for row in cur.execute('pragma table_info(jobs)')}
+        for name, declaration in __added_columns:
+            if name not in columns:
+                cur.execute(f'alter table jobs add column {name} {declaration}')
+
+        # jobs from before `created` and `updated` were recorded count as
+        # created and last updated at the upgrade, so that they expire too
+        cur.execute('''
+            update jobs set created = cast(strftime('%s', 'now') as real)
+                where created is null
+        ''')
+        cur.execute('update jobs set updated = created where updated is null')
+
+        for index in __indexes:
+            cur.execute(index)
+
+        cur.execute('''
+            create table if not exists job_changes(
+                id integer primary key check (id = 0),
+                seq integer not null)
+        ''')
+        cur.execute('insert or ignore into job_changes values (0, 0)')
+        for trigger in __triggers:
+            cur.execute(trigger)
+
+        # segments per input file of finished jobs, see `set_file_segments`
+        cur.execute('''
+            create table if not exists job_files(
+                job_id integer not null,
+                path text not null,
+                segments integer not null,
+                primary key (job_id, path))
+        ''')
+
 
+def __connect() -> sqlite3.Connection:
+    '''
+    returns this thread's connection to the database, opening it and (once per
+    process) migrating the schema if necessary
+    '''
+
+    path = str(db_filename())
+
+    connections: dict[str, sqlite3.Connection] = getattr(__local, 'connections', {})
+    __local.connections = connections
+
+    con = connections.get(path)
+    if con is not None:
+        return con
+
+    # autocommit; multi-statement writes use `__transaction`
+    con = sqlite3.connect(path, timeout=30, isolation_level=None)
+    for pragma in __pragmas:
+        con.execute(pragma)
+
+    with __migrated_mutex:
+        if path not in __migrated:
+            __migrate(con)
+            __migrated.add(path)
+
+    connections[path] = con
     return con
 
 
-def get_jobs() -> dict[int, Job]:
-    sql = 'select id, status, src_lang, tgt_lang, download_url, glossary from jobs'
+@contextmanager
+def __transaction(con: sqlite3.Connection) -> Iterator[sqlite3.Cursor]:
+    '''
+    `begin immediate` takes the write lock up front, so that reads within the
+    transaction cannot be invalidated by other processes
+    '''
 
-    con = __connect()
     cur = con.cursor()
+    cur.execute('begin immediate')
+    try:
+        yield cur
+    except BaseException:
+        cur.execute('rollback')
+        raise
+    cur.execute('commit')
+
+
+def __job_from_row(row) -> Job:
+    (job_id, status, src_lang, tgt_lang, download_url, glossary,
+     use_translation_memory, priority, created, base_job_id, progress,
+     glossary_id, fingerprint, duplicate_of, parameters) = row
+    return Job(job_id, status,
+               model=None,  # type: ignore
+               input_prefix=None,  # type: ignore
+               src_lang=src_lang,
+               tgt_lang=tgt_lang,
+               download_url=download_url,
+               glossary=glossary,
+               glossary_id=glossary_id,
+               use_translation_memory=bool(use_translation_memory),
+               priority=priority,
+               created=created,
+               base_job_id=base_job_id,
+               fingerprint=fingerprint,
+               duplicate_of=duplicate_of,
+               parameters=parameters,
+               progress=json.loads(progress) if progress is not None else None)
+
+
+@timed_db
+def list_jobs(limit: int, cursor: Optional[int] = None,
+              statuses: Optional[list[str]] = None,
+              exclude_statuses: Optional[list[str]] = None) -> tuple[list[Job], Optional[int]]:
+    '''
+    returns up to `limit` (at least one) jobs, newest first, starting below
+    the job ID `cursor`, and the cursor for the next page (`None` on the last
+    page)
+    '''
 
-    jobs = dict[int, Job]()
-    for job_id, status, src_lang, tgt_lang, download_url, glossary in cur.execute(sql):
-        jobs[job_id] = Job(job_id, status, src_lang, tgt_lang,
-                           download_url, glossary)
+    limit = max(1, limit)
 
-    con.close()
-    return jobs
+    conditions = list[str]()
+    params = list[Any]()
 
+    if cursor is not None:
+        conditions.append('id < ?')
+        params.append(cursor)
 
+    if statuses is not None:
+        conditions.append(f'status in ({", ".join("?" for _ in statuses)})')
+        params += statuses
+
+    if exclude_statuses is not None:
+        conditions.append(f'status not in ({", ".join("?" for _ in exclude_statuses)})')
+        params += exclude_statuses
+
+    where = ('where ' + ' and '.join(conditions)) if len(conditions) > 0 else ''
+    sql = f'select {__job_columns} from jobs {where} order by id desc limit ?'
+
+    cur = __connect().cursor()
+    rows = cur.execute(sql, (*params, limit + 1)).fetchall()
+
+    jobs = [__job_from_row(row) for row in rows[:limit]]
+    next_cursor = jobs[-1].id if len(rows) > limit else None
+
+    return jobs, next_cursor
+
+
+@timed_db
 def get_job(job_id) -> Optional[Job]:
-    sql = 'select id, status, src_lang, tgt_lang, download_url, glossary from jobs where id = ?'
+    sql = f'select {__job_columns} from jobs where id = ?'
 
-    con = __connect()
-    cur = con.cursor()
-    res = cur.execute(sql, (job_id,))
+    cur = __connect().cursor()
+    row = cur.execute(sql, (job_id,)).fetchone()
 
-    row = res.fetchone()
     if row is None:
-        con.close()
         return None
 
-    job_id, status, src_lang, tgt_lang, download_url, glossary = row
-
-    con.close()
-    return Job(job_id, status, src_lang, tgt_lang, download_url, glossary)
+    return __job_from_row(row)
 
 
+@timed_db
 def create_job(job: Job) -> Job:
     '''
     returns the `job` object with the updated ID
     '''
 
     sql = '''
-        insert into jobs (status, src_lang, tgt_lang, download_url, glossary)
-            values (?, ?, ?, ?, ?)
+        insert into jobs (status, src_lang, tgt_lang, download_url, glossary,
+                          glossary_id, use_translation_memory, priority, created,
+                          base_job_id, parameters, updated, updated_by)
+            values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     '''
 
-    con = __connect()
-    cur = con.cursor()
+    job = deepcopy(job)
+    if job.created is None:
+        job.created = time.time()
+
+    cur = __connect().cursor()
     cur.execute(sql, (job.status, job.src_lang, job.tgt_lang,
-                      job.download_url, job.glossary))
-    con.commit()
+                      job.download_url, job.glossary, job.glossary_id,
+                      job.use_translation_memory, job.priority, job.created, job.base_job_id,
+                      job.parameters, time.time(), job_events.epoch))
 
-    job = deepcopy(job)
     assert cur.lastrowid is not None
     job.id = cur.lastrowid
 
-    con.close()
+    job_events.publish(job.id, job)
     return job
 
 
-def update_job(job_id: int, job: Job) -> Job:
+@timed_db
+def update_job(job_id: int, job: Job, owner: Optional[str] = None) -> Job:
     '''
     returns the updated job object (should be the same as the input)
+
+    with `owner` given, the job is only updated while leased to `owner`, and
+    `LeaseLost` is raised otherwise
     '''
 
     sql = '''
@@ -96,36 +330,507 @@ def update_job(job_id: int, job: Job) -> Job:
                 src_lang = ?,
                 tgt_lang = ?,
                 download_url = ?,
-                glossary = ?
-            where id = ?
+                glossary = ?,
+                use_translation_memory = ?,
+                priority = ?,
+                progress = ?,
+                fingerprint = ?,
+                duplicate_of = ?,
+                updated = ?,
+                updated_by = ?
+            where id = ? and (? is null or lease_owner = ?)
     '''
 
-    con = __connect()
-    cur = con.cursor()
+    progress = json.dumps(job.progress) if job.progress is not None else None
+
+    cur = __connect().cursor()
     cur.execute(sql, (job.status, job.src_lang, job.tgt_lang,
-                      job.download_url, job.glossary, job_id))
-    con.commit()
+                      job.download_url, job.glossary, job.use_translation_memory,
+                      job.priority, progress, job.fingerprint, job.duplicate_of,
+                      time.time(), job_events.epoch, job_id, owner, owner))
+    if owner is not None and cur.rowcount == 0:
+        raise LeaseLost(job_id)
+    assert cur.rowcount == 1
+
+    upd_job = deepcopy(job)
+    upd_job.id = job_id
 
-    con.close()
-    upd_job = get_job(job_id)
-    assert upd_job is not None
+    job_events.publish(job_id, upd_job)
     return upd_job
 
 
+@timed_db
+def update_progress(job_id: int, progress: dict[str, Any], owner: Optional[str] = None):
+    '''
+    only writes the job's progress, leaving other changes to `update_job`;
+    `owner` is as for `update_job`
+    '''
+
+    sql = '''
+        update jobs set progress = ?, updated = ?, updated_by = ?
+            where id = ? and (? is null or lease_owner = ?)
+    '''
+
+    cur = __connect().cursor()
+    cur.execute(sql, (json.dumps(progress), time.time(), job_events.epoch, job_id,
+                      owner, owner))
+    if owner is not None and cur.rowcount == 0:
+        raise LeaseLost(job_id)
+
+    if cur.rowcount > 0:
+        job_events.publish(job_id, get_job(job_id))
+
+
+@timed_db
 def delete_job(job_id: int) -> int:
     '''
-    returns 1 if a job was deleted, 0 otherwise 
+    returns 1 if a job was deleted, 0 otherwise
     '''
 
     sql = '''
         delete from jobs where id = ?
     '''
 
-    con = __connect()
-    cur = con.cursor()
-    cur.execute(sql, (job_id,))
-    rowcount = cur.rowcount
-    con.commit()
+    with __transaction(__connect()) as cur:
+        cur.execute(sql, (job_id,))
+        deleted = cur.rowcount
+        cur.execute('delete from job_files where job_id = ?', (job_id,))
+
+        # jobs waiting for the deleted one have to run themselves
+        requeued = [row[0] for row in cur.execute('''
+            select id from jobs where duplicate_of = ? and status = 'waiting'
+        ''', (job_id,)).fetchall()]
+        cur.executemany('''
+            update jobs
+                set status = 'new', duplicate_of = null, updated = ?, updated_by = ?
+                where id = ?
+        ''', [(time.time(), job_events.epoch, requeued_id) for requeued_id in requeued])
+
+    if deleted > 0:
+        job_events.publish(job_id, None)
+    for requeued_id in requeued:
+        job_events.publish(requeued_id, get_job(requeued_id))
+    return deleted
+
+
+@timed_db
+def set_file_segments(job_id: int, file_segments: dict[str, int]):
+    '''
+    records the number of segments of each input file (by path relative to
+    the input directory) of job `job_id`, for jobs reusing its outputs
+    '''
+
+    with __transaction(__connect()) as cur:
+        cur.execute('delete from job_files where job_id = ?', (job_id,))
+        cur.executemany('''
+            insert into job_files (job_id, path, segments) values (?, ?, ?)
+        ''', [(job_id, path, segments) for path, segments in file_segments.items()])
+
+
+@timed_db
+def file_segments(job_id: int) -> dict[str, int]:
+    '''
+    returns the segments per input file recorded by `set_file_segments`;
+    empty for jobs which finished before they were recorded
+    '''
+
+    sql = 'select path, segments from job_files where job_id = ?'
+
+    cur = __connect().cursor()
+    return {path: segments for path, segments in cur.execute(sql, (job_id,))}
+
+
+@timed_db
+def claim_duplicate(job_id: int, fingerprint: str) -> Optional[Job]:
+    '''
+    records the fingerprint of job `job_id` and returns the oldest other job
+    with the same fingerprint, preferring finished ones; if that is still
+    queued or running, job `job_id` is set to `waiting` for it
+    '''
+
+    sql = f'''
+        select {__job_columns} from jobs
+            where fingerprint = ? and id != ?
+                and status in {('new', *running_statuses, *reusable_statuses)}
+            order by status in {reusable_statuses} desc, id asc
+            limit 1
+    '''
+
+    with __transaction(__connect()) as cur:
+        row = cur.execute(sql, (fingerprint, job_id)).fetchone()
+        original = __job_from_row(row) if row is not None else None
+
+        if original is None:
+            cur.execute('update jobs set fingerprint = ? where id = ?', (fingerprint, job_id))
+        elif original.status in reusable_statuses:
+            cur.execute('update jobs set fingerprint = ?, duplicate_of = ? where id = ?',
+                        (fingerprint, original.id, job_id))
+        else:
+            cur.execute('''
+                update jobs
+                    set fingerprint = ?, duplicate_of = ?, status = 'waiting',
+                        updated = ?, updated_by = ?
+                    where id = ?
+            ''', (fingerprint, original.id, time.time(), job_events.epoch, job_id))
+
+    job_events.publish(job_id, get_job(job_id))
+    return original
+
+
+@timed_db
+def waiting_duplicates(job_id: int) -> list[Job]:
+    sql = f'''
+        select {__job_columns} from jobs
+            where duplicate_of = ? and status = 'waiting'
+    '''
+
+    cur = __connect().cursor()
+    return [__job_from_row(row) for row in cur.execute(sql, (job_id,))]
+
+
+@timed_db
+def claim_job(owner: str, lease_seconds: float, pair_limit: int,
+              pairs: Optional[list[tuple[str, str]]] = None) -> Optional[Job]:
+    '''
+    atomically moves the most urgent queued (`new`) job to `initialising` and
+    leases it to `owner`; returns `None` if no job may be started
+
+    jobs are only claimed for language pairs with fewer than `pair_limit`
+    running jobs and, if given, within `pairs`
+    '''
+
+    sql = f'''
+        select {__job_columns} from jobs as queued
+            where status = 'new'
+                and (select count(*) from jobs as running
+                        where running.src_lang = queued.src_lang
+                            and running.tgt_lang = queued.tgt_lang
+                            and running.status in {running_statuses}) < ?
+            order by priority desc, id asc
+    '''
+
+    now = time.time()
+
+    with __transaction(__connect()) as cur:
+        job = None
+        for row in cur.execute(sql, (pair_limit,)).fetchall():
+            candidate = __job_from_row(row)
+            if pairs is None or (candidate.src_lang, candidate.tgt_lang) in pairs:
+                job = candidate
+                break
+
+        if job is not None:
+            cur.execute('''
+                update jobs
+                    set status = 'initialising',
+                        lease_owner = ?,
+                        lease_expires = ?,
+                        heartbeat = ?,
+                        attempts = attempts + 1,
+                        updated = ?,
+                        updated_by = ?
+                    where id = ? and status = 'new'
+            ''', (owner, now + lease_seconds, now, now, job_events.epoch, job.id))
+            job.status = 'initialising'
+
+    if job is not None:
+        job_events.publish(job.id, job)
+    return job
+
+
+@timed_db
+def renew_lease(job_id: int, owner: str, lease_seconds: float) -> bool:
+    '''
+    returns False if the job is no longer leased to `owner`
+    '''
+
+    sql = '''
+        update jobs set lease_expires = ?, heartbeat = ?
+            where id = ? and lease_owner = ?
+    '''
+
+    now = time.time()
+
+    cur = __connect().cursor()
+    cur.execute(sql, (now + lease_seconds, now, job_id, owner))
+
+    return cur.rowcount > 0
+
+
+@timed_db
+def release_lease(job_id: int, owner: str):
+    sql = '''
+        update jobs set lease_owner = null, lease_expires = null
+            where id = ? and lease_owner = ?
+    '''
+
+    cur = __connect().cursor()
+    cur.execute(sql, (job_id, owner))
+
+
+@timed_db
+def requeue_orphaned_jobs(owner: Optional[str] = None) -> list[int]:
+    '''
+    puts running jobs whose lease has expired (or, if `owner` is given, which
+    are leased to `owner`) back into the queue; returns their IDs
+    '''
+
+    if owner is None:
+        condition = 'lease_expires is null or lease_expires < ?'
+        params: tuple = (time.time(),)
+    else:
+        condition = 'lease_owner = ?'
+        params = (owner,)
+
+    with __transaction(__connect()) as cur:
+        job_ids = [row[0] for row in cur.execute(f'''
+            select id from jobs
+                where status in {running_statuses} and ({condition})
+        ''', params).fetchall()]
+
+        cur.executemany('''
+            update jobs
+                set status = 'new', lease_owner = null, lease_expires = null,
+                    updated = ?, updated_by = ?
+                where id = ?
+        ''', [(time.time(), job_events.epoch, job_id) for job_id in job_ids])
+
+    for job_id in job_ids:
+        job_events.publish(job_id, get_job(job_id))
+    return job_ids
+
+
+@timed_db
+def requeue_job(job_id: int, owner: str) -> bool:
+    '''
+    puts job `job_id` back into the queue if it is still leased to `owner`,
+    e.g. when it could not be started after claiming it
+    '''
+
+    sql = f'''
+        update jobs
+            set status = 'new', lease_owner = null, lease_expires = null,
+                updated = ?, updated_by = ?
+            where id = ? and lease_owner = ? and status in {running_statuses}
+    '''
+
+    cur = __connect().cursor()
+    cur.execute(sql, (time.time(), job_events.epoch, job_id, owner))
+
+    if cur.rowcount > 0:
+        job_events.publish(job_id, get_job(job_id))
+    return cur.rowcount > 0
+
+
+@timed_db
+def fail_stale_uploads(updated_before: float) -> list[int]:
+    '''
+    sets jobs still `uploading` since before `updated_before` to `error`;
+    returns their IDs
+    '''
+
+    with __transaction(__connect()) as cur:
+        job_ids = [row[0] for row in cur.execute('''
+            select id from jobs where status = 'uploading' and updated < ?
+        ''', (updated_before,)).fetchall()]
+
+        cur.executemany('''
+            update jobs set status = 'error', updated = ?, updated_by = ?
+                where id = ?
+        ''', [(time.time(), job_events.epoch, job_id) for job_id in job_ids])
+
+    for job_id in job_ids:
+        job_events.publish(job_id, get_job(job_id))
+    return job_ids
+
+
+@timed_db
+def last_change() -> int:
+    '''
+    returns the number of changes made to the `jobs` table so far, see
+    `__triggers`
+    '''
+
+    cur = __connect().cursor()
+    return cur.execute('select seq from job_changes').fetchone()[0]
+
+
+@timed_db
+def jobs_changed_since(since: int) -> list[tuple[int, Job]]:
+    '''
+    returns the jobs changed by other processes after change `since` (see
+    `last_change`), with their change number
+    '''
+
+    sql = f'''
+        select {__job_columns}, change_seq from jobs
+            where change_seq > ? and (updated_by is null or updated_by != ?)
+            order by change_seq asc
+    '''
+
+    cur = __connect().cursor()
+    return [(row[-1], __job_from_row(row[:-1]))
+            for row in cur.execute(sql, (since, job_events.epoch))]
+
+
+@timed_db
+def unfinished_jobs(src_lang: str, tgt_lang: str) -> int:
+    '''
+    returns the number of jobs of the pair being uploaded, queued or running
+    '''
+
+    sql = f'''
+        select count(*) from jobs
+            where src_lang = ? and tgt_lang = ?
+                and status in {('uploading', 'new', *running_statuses)}
+    '''
+
+    cur = __connect().cursor()
+    return cur.execute(sql, (src_lang, tgt_lang)).fetchone()[0]
+
+
+@timed_db
+def queue_stats() -> dict[str, dict[str, Any]]:
+    '''
+    returns the number of queued and running jobs, and the age of the oldest
+    queued job, per language pair
+    '''
+
+    sql = f'''
+        select src_lang, tgt_lang,
+               sum(status = 'new'),
+               sum(status in {running_statuses}),
+               min(case when status = 'new' then created end)
+            from jobs
+            where status = 'new' or status in {running_statuses}
+            group by src_lang, tgt_lang
+    '''
+
+    now = time.time()
+
+    cur = __connect().cursor()
+
+    stats = dict[str, dict[str, Any]]()
+    for src_lang, tgt_lang, queued, running, oldest in cur.execute(sql):
+        stats[f'{src_lang}-{tgt_lang}'] = {
+            'queued': queued,
+            'running': running,
+            'oldest_queued_age': now - oldest if oldest is not None else None,
+        }
+
+    return stats
+
+
+@timed_db
+def expired_jobs(status: str, updated_before: float, limit: int) -> list[int]:
+    '''
+    returns up to `limit` IDs of jobs with `status` last updated before
+    `updated_before`, oldest first; jobs still used as the base of unfinished
+    jobs are left out
+    '''
+
+    sql = f'''
+        select id from jobs
+            where status = ? and updated < ? and {__not_in_use_as_base}
+            order by updated asc
+            limit ?
+    '''
+
+    cur = __connect().cursor()
+    return [row[0] for row in cur.execute(sql, (status, updated_before, limit))]
+
+
+@timed_db
+def unmeasured_jobs(limit: int) -> list[int]:
+    '''
+    returns up to `limit` IDs of finished jobs whose disk usage is unknown
+    '''
+
+    sql = f'''
+        select id from jobs
+            where status in {finished_statuses} and disk_bytes is null
+            order by id asc
+            limit ?
+    '''
+
+    cur = __connect().cursor()
+    return [row[0] for row in cur.execute(sql, (limit,))]
+
+
+@timed_db
+def set_disk_usage(job_id: int, disk_bytes: Optional[int], log_compressed: bool = False):
+    '''
+    bookkeeping of the retention sweeper; does not count as an update of
+    the job
+    '''
+
+    sql = '''
+        update jobs set disk_bytes = ?, log_compressed = log_compressed or ?
+            where id = ?
+    '''
+
+    cur = __connect().cursor()
+    cur.execute(sql, (disk_bytes, log_compressed, job_id))
+
+
+@timed_db
+def logs_to_compress(updated_before: float, limit: int) -> list[int]:
+    sql = f'''
+        select id from jobs
+            where status in {finished_statuses} and updated < ? and log_compressed = 0
+            order by updated asc
+            limit ?
+    '''
+
+    cur = __connect().cursor()
+    return [row[0] for row in cur.execute(sql, (updated_before, limit))]
+
+
+@timed_db
+def disk_usage(limit: Optional[int] = None) -> tuple[int, int, list[dict[str, Any]]]:
+    '''
+    returns the total measured disk usage of jobs, the number of finished
+    jobs not measured yet, and the usage per job (largest first, up to
+    `limit` jobs)
+    '''
+
+    cur = __connect().cursor()
+
+    total, unmeasured = cur.execute(f'''
+        select coalesce(sum(disk_bytes), 0),
+               coalesce(sum(status in {finished_statuses} and disk_bytes is null), 0)
+            from jobs
+    ''').fetchone()
+
+    rows = cur.execute('''
+        select id, status, disk_bytes, updated, log_compressed from jobs
+            where disk_bytes is not null
+            order by disk_bytes desc
+            limit ?
+    ''', (limit if limit is not None else -1,)).fetchall()
+
+    jobs = [{'id': job_id, 'status': status, 'disk_bytes': disk_bytes, 'updated': updated,
+             'log_compressed': bool(log_compressed)}
+            for job_id, status, disk_bytes, updated, log_compressed in rows]
+
+    return total, unmeasured, jobs
+
+
+@timed_db
+def oldest_finished_jobs(limit: int) -> list[tuple[int, int]]:
+    '''
+    returns up to `limit` (ID, disk usage) pairs of measured finished jobs,
+    least recently updated first; jobs still used as the base of unfinished
+    jobs are left out
+    '''
+
+    sql = f'''
+        select id, disk_bytes from jobs
+            where status in {finished_statuses} and disk_bytes is not null
+                and {__not_in_use_as_base}
+            order by updated asc
+            limit ?
+    '''
 
-    con.close()
-    return rowcount
+    cur = __connect().cursor()
+    return [(row[0], row[1]) for row in cur.execute(sql, (limit,))]
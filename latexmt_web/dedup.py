@@ -0,0 +1,174 @@
+from flask import current_app
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+from . import db
+from .archive import archive_filename
+from .cache import glossary_hash
+from .configure import ConfigKey
+from .dirs import output_base
+from .job import Job
+from .progress import JobProgress
+
+# type imports
+from pathlib import Path
+from typing import Any, Optional
+
+
+def parameter_fingerprint(job: Job) -> str:
+    '''
+    identifies the parameters the outputs of a job depend on, apart from its
+    inputs: language pair, translator, aligner, glossary and whether the
+    translation memory is used
+
+    the mask placeholder is left out as jobs always use the default one
+    '''
+
+    config = current_app.config
+
+    key_data = [
+        job.src_lang,
+        job.tgt_lang,
+        config[ConfigKey.TRANSLATOR],
+        config[ConfigKey.ALIGNER],
+        # stored glossaries are identified by the hash of their content
+        job.glossary_id if job.glossary_id is not None else glossary_hash(job.glossary),
+        job.use_translation_memory,
+    ]
+
+    return hashlib.sha256(json.dumps(key_data, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def job_fingerprint(job: Job, digests: dict[str, str]) -> str:
+    '''
+    identifies the output of a job: its input files (by path and content
+    hash) and its parameters, see `parameter_fingerprint`
+    '''
+
+    key_data = [
+        parameter_fingerprint(job),
+        sorted(digests.items()),
+    ]
+
+    return hashlib.sha256(json.dumps(key_data, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def __link(src: Path, dst: Path):
+    '''
+    hard-links `src` to `dst`, copying it where that is not possible (e.g.
+    across file systems)
+    '''
+
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def link_outputs(original_id: int, job_id: int):
+    '''
+    makes the outputs (and prebuilt download archive) of job `original_id`
+    those of job `job_id`
+
+    if that fails, whatever was linked is removed again, so that translating
+    the job cannot write into the files of job `original_id`
+    '''
+
+    src_dir = output_base().joinpath(str(original_id))
+    dst_dir = output_base().joinpath(str(job_id))
+
+    try:
+        for src in sorted(src_dir.rglob('*')):
+            dst = dst_dir.joinpath(src.relative_to(src_dir))
+            if src.is_dir():
+                dst.mkdir(parents=True, exist_ok=True)
+            else:
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                __link(src, dst)
+
+        archive = archive_filename(original_id)
+        if archive.exists():
+            __link(archive, archive_filename(job_id))
+    except BaseException:
+        shutil.rmtree(dst_dir, ignore_errors=True)
+        archive_filename(job_id).unlink(missing_ok=True)
+        raise
+
+
+def reused_progress(original_id: int, job_id: int,
+                    logger: logging.Logger) -> Optional[dict[str, Any]]:
+    '''
+    returns the progress of job `job_id`, whose outputs are those of job
+    `original_id`: all its files and segments count as reused
+    '''
+
+    try:
+        file_segments = db.file_segments(original_id)
+        db.set_file_segments(job_id, file_segments)
+    except Exception as err:
+        # progress is informational, the job is done regardless
+        logger.warning(f'Error recording the segments of job {job_id}: {err}')
+        return None
+
+    progress = JobProgress(job_id, len(file_segments), interval=0)
+    progress.reuse_files(file_segments)
+    return progress.snapshot()
+
+
+def reuse_duplicate(job_id: int, digests: dict[str, str], logger: logging.Logger) -> str:
+    '''
+    looks for an earlier job with the same fingerprint as the freshly
+    extracted job `job_id`; returns the job's next status:
+
+    - `done`, with the outputs of a finished duplicate linked into its
+      output directory
+    - `waiting`, for a duplicate which is still queued or running; it
+      completes the job once done, see `complete_duplicates`
+    - `new`, if the job has to be translated
+    '''
+
+    job = db.get_job(job_id)
+    assert job is not None
+
+    original = db.claim_duplicate(job_id, job_fingerprint(job, digests))
+    if original is None:
+        return 'new'
+
+    if original.status in db.reusable_statuses:
+        link_outputs(original.id, job_id)
+        logger.info(f'Reused the outputs of identical job {original.id}')
+        return 'done'
+
+    logger.info(f'Waiting for identical job {original.id}')
+    return 'waiting'
+
+
+def complete_duplicates(job: Job, logger: logging.Logger):
+    '''
+    completes the jobs waiting for `job`, which has just finished: with its
+    outputs if it succeeded, otherwise they are queued to run themselves
+    '''
+
+    for duplicate in db.waiting_duplicates(job.id):
+        linked = False
+        if job.status == 'done':
+            try:
+                link_outputs(job.id, duplicate.id)
+                linked = True
+            except Exception as err:
+                logger.warning(f'Error reusing outputs for identical job {duplicate.id}: {err}')
+
+        if linked:
+            duplicate.status = 'done'
+            duplicate.download_url = f'/api/jobs/{duplicate.id}/download'
+            duplicate.progress = reused_progress(job.id, duplicate.id, logger)
+            logger.info(f'Completed identical job {duplicate.id}')
+        else:
+            duplicate.status = 'new'
+            duplicate.duplicate_of = None
+            logger.info(f'Queued identical job {duplicate.id}')
+
+        db.update_job(duplicate.id, duplicate)
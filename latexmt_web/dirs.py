@@ -11,6 +11,8 @@ def upload_base(): return basedir().joinpath('upload')
 def input_base(): return basedir().joinpath('input')
 def output_base(): return basedir().joinpath('output')
 def log_base(): return basedir().joinpath('log')
+def archive_base(): return basedir().joinpath('archive')
+def glossary_base(): return basedir().joinpath('glossaries')
 
 
 __basepaths = {
@@ -0,0 +1,111 @@
+from collections import deque
+import logging
+import time
+import traceback
+import uuid
+from threading import Condition, Thread
+
+from .job import Job
+
+# type imports
+from flask import Flask
+from typing import Any, Callable, Optional
+
+
+class JobEvent:
+    def __init__(self, version: int, job_id: int, job: Optional[Job]):
+        self.version = version
+        self.job_id = job_id
+        # `None` if the job was deleted
+        self.job = job
+
+
+class JobEventBus:
+    '''
+    in-process feed of job changes
+
+    every change gets a new version number; subscribers wait for the events
+    after the last version they have seen, as long as those are still within
+    the last `history` events
+    '''
+
+    def __init__(self, history: int = 1024):
+        # distinguishes versions of different processes (and restarts)
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+
+        self._cond = Condition()
+        self._events = deque[JobEvent](maxlen=history)
+
+    def publish(self, job_id: int, job: Optional[Job]):
+        with self._cond:
+            self.version += 1
+            self._events.append(JobEvent(self.version, job_id, job))
+            self._cond.notify_all()
+
+    def wait(self, since: int, timeout: float) -> Optional[list[JobEvent]]:
+        '''
+        returns the events after version `since`, waiting up to `timeout`
+        seconds for one to arrive; returns `None` if events after `since`
+        have already been dropped from the history
+        '''
+
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > since, timeout=timeout)
+
+            if since > self.version:
+                return None
+            if self.version > since and (len(self._events) == 0
+                                         or self._events[0].version > since + 1):
+                return None
+
+            return [event for event in self._events if event.version > since]
+
+
+job_events = JobEventBus()
+
+
+class JobWatcher:
+    '''
+    publishes changes made to the `jobs` table by other processes (e.g.
+    `latexmt-worker`s) by polling for rows they changed since the last poll,
+    by the change counter of `db.last_change`
+    '''
+
+    def __init__(self, app: Flask, changed_since: Callable[[int], list[tuple[int, Job]]],
+                 last_change: Callable[[], int], interval: float = 1.0):
+        self.app = app
+        self.changed_since = changed_since
+        self.last_change = last_change
+        self.interval = interval
+
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        Thread(target=self._loop, daemon=True, name='job-watcher').start()
+
+    def _loop(self):
+        last_seen: Optional[int] = None
+
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    if last_seen is None:
+                        last_seen = self.last_change()
+                    changes = self.changed_since(last_seen)
+            except Exception as err:
+                self.logger.warning(
+                    f'Error polling job changes\n{err}\n{traceback.format_exc()}')
+                continue
+
+            for change, job in changes:
+                last_seen = max(last_seen, change)
+                job_events.publish(job.id, job)
+
+
+def event_json(event: JobEvent, job_json: Callable[[Job], dict[str, Any]]) -> dict[str, Any]:
+    version = f'{job_events.epoch}:{event.version}'
+    if event.job is None:
+        return {'version': version, 'deleted': event.job_id}
+    return {'version': version, 'job': job_json(event.job)}
@@ -1,8 +1,24 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
+import hashlib
+import json
 from pathlib import Path
 import subprocess
+import time
+from threading import BoundedSemaphore, Lock
 
+from .cache import texfmt_signature
 from .configure import ConfigKey
+from .metrics import stage_errors, stage_seconds
+
+# type imports
+from typing import Any, Optional
+
+
+def texfmt_enabled() -> bool:
+    texfmt_bin = current_app.config[ConfigKey.TEXFMT_BIN]
+    return texfmt_bin is not None and texfmt_bin != ''
 
 
 def texfmt_cmdline() -> list[str]:
@@ -19,10 +35,179 @@ def texfmt_cmdline() -> list[str]:
     return command_line
 
 
-def texfmt_files(files: list[Path]) -> subprocess.CompletedProcess[bytes]:
-    command_line = texfmt_cmdline()
+class Formatter:
+    '''
+    runs tex-fmt on at most `workers` inputs at a time, caching results by
+    content and formatter configuration
+
+    tex-fmt has no server mode, so every (uncached) input still costs one
+    process; the bound keeps bursts from forking without limit
+    '''
+
+    def __init__(self, command_line: list[str], workers: int, timeout: float,
+                 cache_bytes: int):
+        self.command_line = command_line
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_bytes = cache_bytes
+
+        self._slots = BoundedSemaphore(workers)
+
+        self._mutex = Lock()
+        self._cache = OrderedDict[str, str]()
+        self._cached_bytes = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._timeouts = 0
+        self._failures = 0
+
+    def _key(self, text: str) -> str:
+        signature = json.dumps(texfmt_signature())
+        return hashlib.sha256(f'{signature}\0{text}'.encode('utf-8')).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        with self._mutex:
+            formatted = self._cache.get(key)
+            if formatted is None:
+                self._misses += 1
+                return None
+
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return formatted
+
+    def _cache_put(self, key: str, formatted: str):
+        size = len(formatted.encode('utf-8'))
+        if size > self.cache_bytes:
+            return
+
+        with self._mutex:
+            if key in self._cache:
+                return
+
+            self._cache[key] = formatted
+            self._cached_bytes += size
+            while self._cached_bytes > self.cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted.encode('utf-8'))
+
+    def _run(self, text: str) -> Optional[str]:
+        with self._slots:
+            start = time.perf_counter()
+            try:
+                result = subprocess.run(
+                    self.command_line + ['--stdin'],
+                    input=text.encode('utf-8'),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    timeout=self.timeout,
+                )
+            except subprocess.TimeoutExpired:
+                with self._mutex:
+                    self._timeouts += 1
+                stage_errors.inc(stage='format', pair='', translator='')
+                return None
+            finally:
+                stage_seconds.observe(time.perf_counter() - start,
+                                      stage='format', pair='', translator='')
+
+        if result.returncode != 0:
+            with self._mutex:
+                self._failures += 1
+            stage_errors.inc(stage='format', pair='', translator='')
+            return None
+
+        return result.stdout.decode('utf-8')
+
+    def format_text(self, text: str) -> Optional[str]:
+        '''
+        returns the formatted `text`, or `None` if formatting failed or timed
+        out
+        '''
+
+        key = self._key(text)
+
+        formatted = self._cache_get(key)
+        if formatted is not None:
+            return formatted
+
+        formatted = self._run(text)
+        if formatted is not None:
+            self._cache_put(key, formatted)
+        return formatted
+
+    def format_file(self, path: Path) -> bool:
+        '''
+        formats the file at `path` in place; returns False (leaving the file
+        as it is) if formatting failed
+        '''
+
+        text = path.read_text(encoding='utf-8')
+        formatted = self.format_text(text)
+        if formatted is None:
+            return False
+
+        if formatted != text:
+            path.write_text(formatted, encoding='utf-8')
+        return True
+
+    def format_files(self, files: list[Path]) -> list[Path]:
+        '''
+        formats `files` in place, up to `workers` at a time; returns the
+        files which could not be formatted
+        '''
+
+        app = current_app._get_current_object()  # type: ignore
+
+        def run(file: Path) -> bool:
+            with app.app_context():
+                try:
+                    return self.format_file(file)
+                except (OSError, UnicodeDecodeError):
+                    return False
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(files)))) as executor:
+            results = list(executor.map(run, files))
+
+        return [file for file, formatted in zip(files, results) if not formatted]
+
+    def stats(self) -> dict[str, Any]:
+        with self._mutex:
+            return {
+                'workers': self.workers,
+                'cache_entries': len(self._cache),
+                'cache_bytes': self._cached_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'timeouts': self._timeouts,
+                'failures': self._failures,
+            }
+
+
+__formatter: Optional[Formatter] = None
+__formatter_mutex = Lock()
+
+
+def get_formatter() -> Optional[Formatter]:
+    '''
+    returns `None` if formatting is disabled
+    '''
+
+    global __formatter
+
+    if not texfmt_enabled():
+        return None
+
+    config = current_app.config
 
-    for file in files:
-        command_line += [str(file.resolve())]
+    with __formatter_mutex:
+        if __formatter is None:
+            __formatter = Formatter(
+                texfmt_cmdline(),
+                workers=config[ConfigKey.TEXFMT_WORKERS],
+                timeout=config[ConfigKey.TEXFMT_TIMEOUT],
+                cache_bytes=config[ConfigKey.TEXFMT_CACHE_BYTES],
+            )
 
-    return subprocess.run(command_line)
+    return __formatter
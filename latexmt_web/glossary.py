@@ -0,0 +1,175 @@
+from collections import OrderedDict
+from flask import current_app
+import logging
+import os
+import re
+import tempfile
+from threading import Lock
+
+from latexmt_core.glossary import load_glossary
+
+from .cache import glossary_hash
+from .configure import ConfigKey
+from .dirs import glossary_base
+from .helpers import ensure_dir
+
+# type imports
+from pathlib import Path
+from typing import Any, Optional
+
+
+__glossary_id_pattern = re.compile(r'[0-9a-f]{64}')
+
+
+def normalize_glossary(text: str) -> str:
+    '''
+    the glossary's non-empty lines, stripped; what `glossary_hash` hashes
+    '''
+
+    lines = [line.strip() for line in text.splitlines()]
+    return '\n'.join(line for line in lines if len(line) > 0)
+
+
+def __glossary_filename(glossary_id: str) -> Optional[Path]:
+    if __glossary_id_pattern.fullmatch(glossary_id) is None:
+        return None
+    return glossary_base().joinpath(glossary_id + '.csv')
+
+
+def store_glossary(text: str) -> str:
+    '''
+    stores the glossary, unless an identical one is stored already; returns
+    its ID, the hash of its content
+    '''
+
+    glossary_id = glossary_hash(text)
+    path = __glossary_filename(glossary_id)
+    assert path is not None
+
+    if not path.exists():
+        ensure_dir(path.parent)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.glossary-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as tmp_file:
+            tmp_file.write(normalize_glossary(text))
+        os.replace(tmp_path, path)
+
+    return glossary_id
+
+
+def read_glossary(glossary_id: str) -> Optional[str]:
+    '''
+    returns `None` for unknown IDs
+    '''
+
+    path = __glossary_filename(glossary_id)
+    if path is None:
+        return None
+
+    try:
+        return path.read_text(encoding='utf-8')
+    except FileNotFoundError:
+        return None
+
+
+class GlossaryCache:
+    '''
+    LRU cache of loaded glossaries by content hash, so that a glossary is
+    only parsed once however many requests use it
+
+    loaded glossaries are shared by concurrent requests and thus log to
+    this module's logger rather than to any one job's
+    '''
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+
+        self._mutex = Lock()
+        self._cache = OrderedDict[str, Any]()
+        # glossaries being loaded, so that concurrent requests wait for the
+        # first one instead of loading it again
+        self._loading = dict[str, Lock]()
+
+        self._hits = 0
+        self._misses = 0
+
+        self.logger = logging.getLogger(__name__)
+
+    def _cache_get(self, key: str) -> Optional[Any]:
+        with self._mutex:
+            glossary = self._cache.get(key)
+            if glossary is not None:
+                self._cache.move_to_end(key)
+            return glossary
+
+    def get(self, text: str) -> Any:
+        key = glossary_hash(text)
+
+        glossary = self._cache_get(key)
+        if glossary is not None:
+            with self._mutex:
+                self._hits += 1
+            return glossary
+
+        with self._mutex:
+            loading = self._loading.setdefault(key, Lock())
+
+        with loading:
+            glossary = self._cache_get(key)
+            if glossary is not None:
+                with self._mutex:
+                    self._hits += 1
+                return glossary
+
+            try:
+                glossary = load_glossary(lines=normalize_glossary(text).splitlines(),
+                                         parent_logger=self.logger)
+            finally:
+                with self._mutex:
+                    self._loading.pop(key, None)
+
+            with self._mutex:
+                self._misses += 1
+                if self.max_entries > 0:
+                    self._cache[key] = glossary
+                    while len(self._cache) > self.max_entries:
+                        self._cache.popitem(last=False)
+
+        return glossary
+
+    def stats(self) -> dict[str, Any]:
+        with self._mutex:
+            return {
+                'entries': len(self._cache),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+            }
+
+
+__glossary_cache: Optional[GlossaryCache] = None
+__glossary_cache_mutex = Lock()
+
+
+def get_glossary_cache() -> GlossaryCache:
+    global __glossary_cache
+
+    with __glossary_cache_mutex:
+        if __glossary_cache is None:
+            __glossary_cache = GlossaryCache(
+                max_entries=current_app.config[ConfigKey.GLOSSARY_CACHE_ENTRIES])
+
+    return __glossary_cache
+
+
+def glossary_text(glossary: Optional[str], glossary_id: Optional[str]) -> str:
+    '''
+    the glossary given inline or by ID; raises `KeyError` for unknown IDs
+    '''
+
+    if glossary_id is None:
+        return glossary or ''
+
+    text = read_glossary(glossary_id)
+    if text is None:
+        raise KeyError(f'Glossary {glossary_id} does not exist')
+    return text
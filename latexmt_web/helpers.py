@@ -1,5 +1,6 @@
 # type imports
 from pathlib import Path
+from typing import Optional
 
 
 def ensure_dir(dir: Path):
@@ -7,3 +8,21 @@ def ensure_dir(dir: Path):
         raise NotADirectoryError(dir)
     if not dir.exists():
         dir.mkdir()
+
+
+def parse_pairs(pairs: Optional[list[str]]) -> Optional[list[tuple[str, str]]]:
+    '''
+    parses language pairs given as `src-tgt`
+    '''
+
+    if pairs is None or len(pairs) == 0:
+        return None
+
+    parsed = list[tuple[str, str]]()
+    for pair in pairs:
+        src_lang, _, tgt_lang = pair.partition('-')
+        if src_lang == '' or tgt_lang == '':
+            raise ValueError(f'Invalid language pair: {pair}')
+        parsed.append((src_lang, tgt_lang))
+
+    return parsed
@@ -0,0 +1,266 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Request, current_app, request
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+import traceback
+from zipfile import BadZipFile, ZipFile
+
+from . import db
+from .configure import ConfigKey
+from .dedup import reuse_duplicate, reused_progress
+from .dirs import clear_upload, input_base, log_base, upload_base
+from .helpers import ensure_dir
+from .logstream import BroadcastFileHandler
+from .metrics import stage
+
+# type imports
+from pathlib import Path, PurePosixPath
+from typing import IO, Callable, Optional
+from werkzeug.datastructures import FileStorage
+
+
+class UploadRejected(ValueError):
+    pass
+
+
+class UploadRequest(Request):
+    '''
+    spools uploaded files straight into `upload_base()`, so that they can be
+    handed to the extraction without being copied again
+    '''
+
+    def _get_file_stream(self, total_content_length: Optional[int], content_type: Optional[str],
+                         filename: Optional[str] = None,
+                         content_length: Optional[int] = None) -> IO[bytes]:
+        return tempfile.NamedTemporaryFile('wb+', dir=upload_base(), prefix='.upload-',
+                                           delete=False)
+
+
+def __spooled_path(document: FileStorage) -> Optional[Path]:
+    name = getattr(document.stream, 'name', None)
+    if not isinstance(name, str):
+        return None
+
+    path = Path(name)
+    if path.parent != upload_base() or not path.name.startswith('.upload-'):
+        return None
+    return path
+
+
+def claim_upload(document: FileStorage, path: Path) -> Path:
+    '''
+    moves an uploaded file to `path`
+    '''
+
+    spooled_path = __spooled_path(document)
+    if spooled_path is not None:
+        document.stream.flush()
+        os.replace(spooled_path, path)
+    else:
+        document.save(path)
+    return path
+
+
+def discard_unclaimed_uploads():
+    '''
+    removes files spooled by `UploadRequest` which were not claimed; to be
+    called when tearing down a request
+    '''
+
+    # only if the request body was parsed at all
+    if 'files' not in request.__dict__:
+        return
+
+    for document in request.files.values():
+        spooled_path = __spooled_path(document)
+        if spooled_path is not None:
+            spooled_path.unlink(missing_ok=True)
+
+
+def __keep(name: str, extensions: list[str]) -> bool:
+    return any(name.endswith(extension) for extension in extensions)
+
+
+def __target(input_dir: Path, name: str) -> Path:
+    path = PurePosixPath(name.replace('\\', '/'))
+    if path.is_absolute() or '..' in path.parts or len(path.parts) == 0:
+        raise UploadRejected(f'Invalid path in archive: {name}')
+
+    target = input_dir.joinpath(*path.parts)
+    if not target.resolve().is_relative_to(input_dir.resolve()):
+        raise UploadRejected(f'Invalid path in archive: {name}')
+    return target
+
+
+def __copy_limited(src: IO[bytes], dst: IO[bytes], budget: int,
+                   digest: Optional['hashlib._Hash'] = None) -> int:
+    '''
+    copies `src` to `dst`, failing once more than `budget` bytes were read;
+    returns the number of bytes copied
+    '''
+
+    copied = 0
+    while len(chunk := src.read(64 * 1024)) > 0:
+        copied += len(chunk)
+        if copied > budget:
+            raise UploadRejected('Upload exceeds the size limit')
+        dst.write(chunk)
+        if digest is not None:
+            digest.update(chunk)
+    return copied
+
+
+def extract_upload(upload_path: Path, input_dir: Path, extensions: list[str],
+                   max_bytes: int, max_entries: int, logger: logging.Logger,
+                   digests: Optional[dict[str, str]] = None) -> int:
+    '''
+    extracts the files of the upload with one of `extensions` into
+    `input_dir`; returns the number of files extracted
+
+    sizes are counted while extracting rather than taken from the archive
+    headers, which may lie; if given, `digests` is filled with the SHA-256
+    of every extracted file by its path within `input_dir`, computed while
+    copying
+    '''
+
+    if not upload_path.name.endswith('.zip'):
+        if not __keep(upload_path.name, extensions):
+            raise UploadRejected(f'Unsupported file type: {upload_path.name}')
+        digest = hashlib.sha256()
+        with open(upload_path, 'rb') as src, open(input_dir.joinpath(upload_path.name), 'wb') as dst:
+            __copy_limited(src, dst, max_bytes, digest)
+        if digests is not None:
+            digests[upload_path.name] = digest.hexdigest()
+        return 1
+
+    try:
+        upload_zip = ZipFile(upload_path, mode='r')
+    except BadZipFile as err:
+        raise UploadRejected(f'Invalid archive: {err}')
+
+    with upload_zip:
+        entries = upload_zip.infolist()
+        if len(entries) > max_entries:
+            raise UploadRejected(f'Archive has {len(entries)} entries, at most {max_entries} allowed')
+
+        extracted = 0
+        budget = max_bytes
+        for entry in entries:
+            if entry.is_dir():
+                continue
+
+            target = __target(input_dir, entry.filename)
+            if not __keep(entry.filename, extensions):
+                logger.debug(f'Skipping {entry.filename}')
+                continue
+
+            target.parent.mkdir(parents=True, exist_ok=True)
+            digest = hashlib.sha256()
+            with upload_zip.open(entry) as src, open(target, 'wb') as dst:
+                budget -= __copy_limited(src, dst, budget, digest)
+            if digests is not None:
+                digests[target.relative_to(input_dir).as_posix()] = digest.hexdigest()
+            extracted += 1
+
+    return extracted
+
+
+# uploads are extracted within seconds (see the upload limits); jobs still
+# `uploading` after this long were left behind by a process which stopped
+stale_upload_seconds = 60 * 60
+
+
+def fail_stale_uploads(logger: logging.Logger):
+    '''
+    fails jobs left `uploading` by a process which stopped while extracting
+    their upload, removing what was extracted
+    '''
+
+    for job_id in db.fail_stale_uploads(time.time() - stale_upload_seconds):
+        for base in (upload_base, input_base):
+            shutil.rmtree(base().joinpath(str(job_id)), ignore_errors=True)
+        logger.info(f'Failed job {job_id}, whose upload was never extracted')
+
+
+__ingest_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ingest')
+
+
+def __ingest(app: Flask, job_id: int, upload_path: Path, on_ready: Callable[[], None]):
+    with app.app_context():
+        config = current_app.config
+
+        job_logger = logging.getLogger(f'Job {job_id}')
+        logger = job_logger.getChild(__name__)
+
+        file_handler = BroadcastFileHandler(job_id, log_base().joinpath(f'{job_id}.log'),
+                                            config[ConfigKey.LOG_BUFFER_BYTES])
+        file_handler.setFormatter(logging.getLogger().handlers[0].formatter)
+        job_logger.addHandler(file_handler)
+
+        input_dir = input_base().joinpath(str(job_id))
+        status = 'error'
+        try:
+            ensure_dir(input_dir)
+            digests = dict[str, str]()
+            with stage('extract'):
+                extracted = extract_upload(upload_path, input_dir,
+                                           extensions=config[ConfigKey.UPLOAD_EXTENSIONS],
+                                           max_bytes=config[ConfigKey.UPLOAD_MAX_BYTES],
+                                           max_entries=config[ConfigKey.UPLOAD_MAX_ENTRIES],
+                                           logger=logger,
+                                           digests=digests)
+            if extracted == 0:
+                raise UploadRejected('Upload contains no files to translate')
+
+            logger.info(f'Extracted {extracted} files')
+            status = 'new'
+
+            try:
+                status = reuse_duplicate(job_id, digests, logger)
+            except Exception as err:
+                logger.warning(f'Error reusing identical job, translating instead\n'
+                               f'{err}\n{traceback.format_exc()}')
+        except UploadRejected as err:
+            logger.warning(f'Rejected upload: {err}')
+        except Exception as err:
+            logger.warning(f'Error extracting upload\n{err}\n{traceback.format_exc()}')
+        finally:
+            if status == 'error':
+                shutil.rmtree(input_dir, ignore_errors=True)
+            clear_upload(job_id)
+
+            job_logger.removeHandler(file_handler)
+            file_handler.close()
+
+        # `waiting` jobs are completed by the job they wait for, possibly
+        # already
+        job = db.get_job(job_id)
+        if job is not None and status != 'waiting':
+            job.status = status
+            if status == 'done':
+                job.download_url = f'/api/jobs/{job_id}/download'
+                assert job.duplicate_of is not None
+                job.progress = reused_progress(job.duplicate_of, job_id, logger)
+            elif status == 'new':
+                # in case reusing an identical job failed
+                job.duplicate_of = None
+            db.update_job(job_id, job)
+
+    if status == 'new':
+        on_ready()
+
+
+def ingest_upload(job_id: int, upload_path: Path, on_ready: Callable[[], None]):
+    '''
+    extracts the upload of an `uploading` job into its input directory in the
+    background, then queues the job (`new`) and calls `on_ready`, unless an
+    identical job is reused
+    '''
+
+    app = current_app._get_current_object()  # type: ignore
+    __ingest_executor.submit(__ingest, app, job_id, upload_path, on_ready)
+
@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 
 # type imports
-from typing import Optional
+from typing import Any, Optional
 
 
 @dataclass
@@ -15,4 +15,20 @@ class Job:
     download_url: Optional[str]
     deepl_api_token: Optional[str] = None
     glossary: str = ''
+    # stored glossary, used instead of `glossary` if set
+    glossary_id: Optional[str] = None
     mask_placeholder: Optional[str] = None
+    use_translation_memory: bool = True
+    priority: int = 0
+    created: Optional[float] = None
+    # earlier job for a previous version of the same document, to reuse
+    base_job_id: Optional[int] = None
+    # hash of the parameters the outputs depend on, see
+    # `dedup.parameter_fingerprint`
+    parameters: Optional[str] = None
+    # hash of the inputs and parameters, and the identical job this one
+    # reuses the outputs of
+    fingerprint: Optional[str] = None
+    duplicate_of: Optional[int] = None
+    # files and segments done, see `progress.JobProgress`
+    progress: Optional[dict[str, Any]] = None
@@ -0,0 +1,237 @@
+from collections import deque
+import logging
+import os
+import time
+from threading import Condition, Lock, Thread
+
+# type imports
+from pathlib import Path
+
+
+class LogBroadcaster:
+    '''
+    fans the log of one job out to any number of subscribers
+
+    the most recent `buffer_bytes` of the log are kept in memory; subscribers
+    which are further behind read the missing part from the log file
+    '''
+
+    def __init__(self, job_id: int, path: Path, buffer_bytes: int):
+        self.job_id = job_id
+        self.path = path
+        self.buffer_bytes = buffer_bytes
+
+        self._cond = Condition()
+        # (byte offset, text) pairs, in order
+        self._chunks = deque[tuple[int, str]]()
+        self._buffered = 0
+        self._end = path.stat().st_size if path.exists() else 0
+        self._producers = 0
+
+    @property
+    def end(self) -> int:
+        with self._cond:
+            return self._end
+
+    @property
+    def live(self) -> bool:
+        '''
+        whether something is still writing to the log
+        '''
+
+        with self._cond:
+            return self._producers > 0
+
+    def append(self, text: str, size: int):
+        with self._cond:
+            self._chunks.append((self._end, text))
+            self._end += size
+            self._buffered += size
+
+            while self._buffered > self.buffer_bytes and len(self._chunks) > 1:
+                offset, _ = self._chunks.popleft()
+                self._buffered -= self._chunks[0][0] - offset
+
+            self._cond.notify_all()
+
+    def _read_file(self, start: int, end: int) -> str:
+        with open(self.path, 'rb') as log_file:
+            log_file.seek(start)
+            return log_file.read(end - start).decode('utf-8', errors='replace')
+
+    def read(self, offset: int, timeout: float) -> tuple[str, int]:
+        '''
+        returns the log from byte `offset` on and the offset after it, waiting
+        up to `timeout` seconds for new output while the log is live
+        '''
+
+        with self._cond:
+            self._cond.wait_for(lambda: self._end > offset or self._producers == 0,
+                                timeout=timeout)
+
+            end = self._end
+            chunks = [(chunk_offset, text) for chunk_offset, text in self._chunks
+                      if chunk_offset >= offset]
+
+        if offset >= end:
+            return '', offset
+
+        # whatever is no longer (or not aligned with) the buffer comes from disk
+        gap_end = chunks[0][0] if len(chunks) > 0 else end
+        prefix = self._read_file(offset, gap_end) if offset < gap_end else ''
+
+        return prefix + ''.join(text for _, text in chunks), end
+
+    def add_producer(self):
+        with self._cond:
+            self._producers += 1
+
+    def remove_producer(self):
+        with self._cond:
+            self._producers -= 1
+            self._cond.notify_all()
+
+
+__broadcasters_mutex = Lock()
+__broadcasters: dict[int, LogBroadcaster] = {}
+__subscribers: dict[int, int] = {}
+
+
+def get_broadcaster(job_id: int, path: Path, buffer_bytes: int) -> LogBroadcaster:
+    with __broadcasters_mutex:
+        if job_id not in __broadcasters:
+            __broadcasters[job_id] = LogBroadcaster(job_id, path, buffer_bytes)
+        return __broadcasters[job_id]
+
+
+def release_broadcaster(job_id: int):
+    '''
+    forgets the broadcaster of `job_id` once nothing uses it anymore
+    '''
+
+    with __broadcasters_mutex:
+        broadcaster = __broadcasters.get(job_id)
+        if broadcaster is not None and not broadcaster.live \
+                and __subscribers.get(job_id, 0) == 0:
+            del __broadcasters[job_id]
+
+
+def subscribe(job_id: int, path: Path, buffer_bytes: int) -> LogBroadcaster:
+    broadcaster = get_broadcaster(job_id, path, buffer_bytes)
+    with __broadcasters_mutex:
+        __subscribers[job_id] = __subscribers.get(job_id, 0) + 1
+    return broadcaster
+
+
+def unsubscribe(job_id: int):
+    with __broadcasters_mutex:
+        __subscribers[job_id] -= 1
+        if __subscribers[job_id] == 0:
+            del __subscribers[job_id]
+    release_broadcaster(job_id)
+
+
+def subscriber_count(job_id: int) -> int:
+    with __broadcasters_mutex:
+        return __subscribers.get(job_id, 0)
+
+
+def read_log_file(path: Path, offset: int) -> tuple[str, int]:
+    '''
+    returns the log file at `path` from byte `offset` to its end and the
+    offset after it
+    '''
+
+    with open(path, 'rb') as log_file:
+        log_file.seek(offset)
+        data = log_file.read()
+    return data.decode('utf-8', errors='replace'), offset + len(data)
+
+
+class BroadcastFileHandler(logging.FileHandler):
+    '''
+    writes log records to the job's log file and hands them to the job's
+    `LogBroadcaster`
+    '''
+
+    def __init__(self, job_id: int, path: Path, buffer_bytes: int):
+        super().__init__(path, encoding='utf-8')
+        self.job_id = job_id
+        self.broadcaster = get_broadcaster(job_id, path, buffer_bytes)
+        self.broadcaster.add_producer()
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            text = self.format(record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(text)
+            self.flush()
+            self.broadcaster.append(text, len(text.encode('utf-8')))
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        closed = self.stream is None
+        super().close()
+        if not closed:
+            self.broadcaster.remove_producer()
+            release_broadcaster(self.job_id)
+
+
+class LogFollower:
+    '''
+    feeds a `LogBroadcaster` from a log file written by another process; runs
+    as long as the broadcaster has subscribers
+    '''
+
+    # seconds between two checks for new output
+    interval = 0.5
+
+    def __init__(self, broadcaster: LogBroadcaster):
+        self.broadcaster = broadcaster
+
+    def start(self):
+        self.broadcaster.add_producer()
+        Thread(target=self._loop, daemon=True,
+               name=f'log-follower-{self.broadcaster.job_id}').start()
+
+    def _loop(self):
+        broadcaster = self.broadcaster
+        try:
+            offset = broadcaster.end
+            while subscriber_count(broadcaster.job_id) > 0:
+                try:
+                    size = os.stat(broadcaster.path).st_size
+                except OSError:
+                    size = offset
+
+                if size > offset:
+                    with open(broadcaster.path, 'rb') as log_file:
+                        log_file.seek(offset)
+                        data = log_file.read(size - offset)
+                    # only pass on complete lines, to not split characters
+                    complete = data.rfind(b'\n') + 1
+                    if complete > 0:
+                        broadcaster.append(data[:complete].decode('utf-8', errors='replace'),
+                                           complete)
+                        offset += complete
+
+                time.sleep(self.interval)
+        finally:
+            broadcaster.remove_producer()
+            release_broadcaster(broadcaster.job_id)
+
+
+__followers_mutex = Lock()
+
+
+def ensure_follower(broadcaster: LogBroadcaster):
+    '''
+    starts a `LogFollower` for `broadcaster` unless something already writes
+    to it
+    '''
+
+    with __followers_mutex:
+        if not broadcaster.live:
+            LogFollower(broadcaster).start()
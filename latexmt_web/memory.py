@@ -0,0 +1,273 @@
+from flask import current_app
+import hashlib
+import logging
+import sqlite3
+import time
+from threading import Lock
+
+from .configure import ConfigKey
+from .dirs import basedir
+from .proxy import TranslatorProxy
+
+# type imports
+from pathlib import Path
+from typing import Optional
+from latexmt_core.translation import Translator
+
+
+def memory_filename(): return basedir().joinpath('translation_memory.sqlite3')
+
+
+def segment_hash(segment: str) -> str:
+    return hashlib.sha256(segment.encode('utf-8')).hexdigest()
+
+
+class TranslationMemory:
+    '''
+    persistent store of translated segments, indexed by language pair, model
+    and source segment hash
+
+    entries not accessed for `ttl` seconds are dropped, and the least recently
+    accessed entries are evicted once there are more than `max_entries`
+    '''
+
+    # number of insertions between two eviction passes
+    prune_interval = 1000
+
+    def __init__(self, path: Path, max_entries: int, ttl: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._mutex = Lock()
+        self._puts_since_prune = self.prune_interval
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        sql = '''
+            create table if not exists segments(
+                src_lang text not null,
+                tgt_lang text not null,
+                model text not null,
+                source_hash text not null,
+                source text not null,
+                target text not null,
+                created real not null,
+                accessed real not null,
+                primary key (src_lang, tgt_lang, model, source_hash))
+        '''
+        index_sql = '''
+            create index if not exists segments_accessed on segments(accessed)
+        '''
+
+        con = sqlite3.connect(self.path, timeout=30)
+        cur = con.cursor()
+        cur.execute(sql)
+        cur.execute(index_sql)
+
+        return con
+
+    def lookup(self, src_lang: str, tgt_lang: str, model: str,
+               segments: list[str]) -> dict[str, str]:
+        '''
+        returns the stored translations for those of `segments` which are in
+        the memory
+        '''
+
+        sql = '''
+            select source, target from segments
+                where src_lang = ? and tgt_lang = ? and model = ?
+                    and source_hash = ? and accessed >= ?
+        '''
+
+        now = time.time()
+        found = dict[str, str]()
+
+        con = self._connect()
+        cur = con.cursor()
+        for segment in set(segments):
+            row = cur.execute(sql, (src_lang, tgt_lang, model,
+                                    segment_hash(segment), now - self.ttl)).fetchone()
+            # guard against hash collisions
+            if row is not None and row[0] == segment:
+                found[segment] = row[1]
+
+        if len(found) > 0:
+            cur.executemany('''
+                update segments set accessed = ?
+                    where src_lang = ? and tgt_lang = ? and model = ?
+                        and source_hash = ?
+            ''', [(now, src_lang, tgt_lang, model, segment_hash(segment))
+                  for segment in found])
+            con.commit()
+        con.close()
+
+        with self._mutex:
+            self._hits += sum(1 for segment in segments if segment in found)
+            self._misses += sum(1 for segment in segments if segment not in found)
+
+        return found
+
+    def store(self, src_lang: str, tgt_lang: str, model: str,
+              translations: dict[str, str]):
+        if len(translations) == 0:
+            return
+
+        now = time.time()
+
+        con = self._connect()
+        cur = con.cursor()
+        cur.executemany('''
+            insert or replace into segments
+                (src_lang, tgt_lang, model, source_hash, source, target,
+                 created, accessed)
+                values (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(src_lang, tgt_lang, model, segment_hash(source), source, target,
+               now, now)
+              for source, target in translations.items()])
+        con.commit()
+
+        with self._mutex:
+            self._puts_since_prune += len(translations)
+            prune = self._puts_since_prune >= self.prune_interval
+            if prune:
+                self._puts_since_prune = 0
+
+        if prune:
+            self._prune(cur, now)
+            con.commit()
+
+        con.close()
+
+    def _prune(self, cur: sqlite3.Cursor, now: float):
+        cur.execute('delete from segments where accessed < ?', (now - self.ttl,))
+        evicted = cur.rowcount
+
+        count = cur.execute('select count(*) from segments').fetchone()[0]
+        if count > self.max_entries:
+            cur.execute('''
+                delete from segments where rowid in (
+                    select rowid from segments order by accessed asc limit ?)
+            ''', (count - self.max_entries,))
+            evicted += cur.rowcount
+
+        with self._mutex:
+            self._evictions += evicted
+
+    def stats(self) -> dict[str, int]:
+        with self._mutex:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+            }
+
+
+class SegmentCounts:
+    '''
+    segments answered from the translation memory (`reused`) and sent to
+    the translator (`translated`), e.g. for one job
+    '''
+
+    def __init__(self):
+        self._mutex = Lock()
+        self.reused = 0
+        self.translated = 0
+
+    def add(self, reused: int, translated: int):
+        with self._mutex:
+            self.reused += reused
+            self.translated += translated
+
+
+class MemoryTranslator(TranslatorProxy):
+    '''
+    answers segments from the translation memory, and only sends misses on to
+    the wrapped translator
+    '''
+
+    def __init__(self, translator: Translator, memory: TranslationMemory,
+                 src_lang: str, tgt_lang: str, model: str,
+                 counts: Optional[SegmentCounts] = None):
+        super().__init__(translator)
+        self.memory = memory
+        self.src_lang = src_lang
+        self.tgt_lang = tgt_lang
+        self.model = model
+        self.counts = counts
+
+        self.logger = logging.getLogger(__name__)
+
+    def _translate_segments(self, segments: list[str]) -> list[str]:
+        try:
+            found = self.memory.lookup(self.src_lang, self.tgt_lang,
+                                       self.model, segments)
+        except sqlite3.Error as err:
+            self.logger.warning(f'Translation memory lookup failed: {err}')
+            found = {}
+
+        misses = list(dict.fromkeys(
+            segment for segment in segments if segment not in found))
+        translated = dict(zip(misses, super()._translate_segments(misses)))
+
+        if self.counts is not None:
+            self.counts.add(reused=len(segments) - len(misses), translated=len(misses))
+
+        try:
+            self.memory.store(self.src_lang, self.tgt_lang, self.model, translated)
+        except sqlite3.Error as err:
+            self.logger.warning(f'Translation memory update failed: {err}')
+
+        return [found[segment] if segment in found else translated[segment]
+                for segment in segments]
+
+
+__memory_mutex = Lock()
+__memory: Optional[TranslationMemory] = None
+
+
+def get_translation_memory() -> Optional[TranslationMemory]:
+    '''
+    returns `None` if the translation memory is disabled
+    '''
+
+    global __memory
+    config = current_app.config
+
+    if config[ConfigKey.TRANSLATION_MEMORY_MAX_ENTRIES] <= 0:
+        return None
+
+    with __memory_mutex:
+        if __memory is None:
+            __memory = TranslationMemory(
+                memory_filename(),
+                max_entries=config[ConfigKey.TRANSLATION_MEMORY_MAX_ENTRIES],
+                ttl=config[ConfigKey.TRANSLATION_MEMORY_TTL],
+            )
+
+    return __memory
+
+
+def with_translation_memory(translator: Translator, src_lang: str, tgt_lang: str,
+                            trans_type: str, counts: Optional[SegmentCounts] = None) -> Translator:
+    '''
+    returns `translator` unchanged if the translation memory is disabled
+    '''
+
+    config = current_app.config
+
+    memory = get_translation_memory()
+    if memory is None:
+        return translator
+
+    model = trans_type
+    if config.get(ConfigKey.ENDPOINT):
+        model += '@' + config[ConfigKey.ENDPOINT]
+
+    return MemoryTranslator(translator, memory, src_lang, tgt_lang, model,  # type: ignore
+                            counts=counts)
@@ -0,0 +1,219 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import functools
+import logging
+import time
+from threading import Lock
+
+# type imports
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+
+def __escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...],
+                  extra: Optional[tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{__escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if len(pairs) > 0 else ''
+
+
+class Metric:
+    '''
+    base of all metrics; values are kept per combination of label values
+    '''
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+
+        self._mutex = Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines += self.samples()
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()):
+        super().__init__(name, help, label_names)
+        self._values = dict[tuple[str, ...], float]()
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._mutex:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._mutex:
+            values = list(self._values.items())
+
+        for key, value in values:
+            yield f'{self.name}{format_labels(self.label_names, key)} {value}'
+
+
+class Gauge(Metric):
+    '''
+    either set explicitly, or read from `collect` (returning values per label
+    values) whenever the metrics are rendered
+    '''
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = (),
+                 collect: Optional[Callable[[], dict[tuple[str, ...], float]]] = None):
+        super().__init__(name, help, label_names)
+        self.collect = collect
+        self._values = dict[tuple[str, ...], float]()
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._mutex:
+            self._values[key] = value
+
+    def samples(self) -> Iterator[str]:
+        if self.collect is not None:
+            values = list(self.collect().items())
+        else:
+            with self._mutex:
+                values = list(self._values.items())
+
+        for key, value in values:
+            yield f'{self.name}{format_labels(self.label_names, key)} {value}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                       1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = default_buckets):
+        super().__init__(name, help, label_names)
+        self.buckets = buckets
+        # per label values: (count per bucket, sum, count)
+        self._values = dict[tuple[str, ...], tuple[list[int], float, int]]()
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        bucket = bisect_left(self.buckets, value)
+
+        with self._mutex:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            if bucket < len(counts):
+                counts[bucket] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def samples(self) -> Iterator[str]:
+        with self._mutex:
+            values = [(key, (list(counts), total, count))
+                      for key, (counts, total, count) in self._values.items()]
+
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = format_labels(self.label_names, key, ('le', str(bound)))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+
+            labels = format_labels(self.label_names, key, ('le', '+Inf'))
+            yield f'{self.name}_bucket{labels} {count}'
+
+            labels = format_labels(self.label_names, key)
+            yield f'{self.name}_sum{labels} {total}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+__registry_mutex = Lock()
+__registry = list[Metric]()
+
+M = TypeVar('M', bound=Metric)
+
+
+def register(metric: M) -> M:
+    with __registry_mutex:
+        __registry.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    '''
+    returns all registered metrics in the Prometheus text format
+    '''
+
+    with __registry_mutex:
+        metrics = list(__registry)
+
+    output = list[str]()
+    for metric in metrics:
+        try:
+            output.append(metric.render())
+        except Exception as err:
+            logging.getLogger(__name__).warning(f'Error collecting {metric.name}: {err}')
+
+    return ''.join(output)
+
+
+# stages of translating: `load` (model), `replica_wait`, `translate`,
+# `align`, `format` and `extract` (uploads)
+stage_seconds = register(Histogram(
+    'latexmt_stage_seconds', 'Time spent per processing stage',
+    ('stage', 'pair', 'translator')))
+
+stage_errors = register(Counter(
+    'latexmt_stage_errors_total', 'Failures per processing stage',
+    ('stage', 'pair', 'translator')))
+
+db_seconds = register(Histogram(
+    'latexmt_db_seconds', 'Time spent per database operation', ('operation',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)))
+
+
+@contextmanager
+def stage(name: str, pair: str = '', translator: str = '') -> Iterator[None]:
+    '''
+    times the `with` block as stage `name`, counting it as failed if it
+    raises
+    '''
+
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage=name, pair=pair, translator=translator)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - start,
+                              stage=name, pair=pair, translator=translator)
+
+
+def timed_db(function: Callable) -> Callable:
+    '''
+    decorator timing a database function under its name
+    '''
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            db_seconds.observe(time.perf_counter() - start, operation=function.__name__)
+
+    return wrapper
@@ -0,0 +1,348 @@
+from contextlib import contextmanager
+from enum import IntEnum
+import itertools
+import logging
+import os
+import time
+from threading import Condition
+
+from .metrics import stage, stage_seconds
+
+# type imports
+from typing import Any, Callable, Iterator, Optional
+from latexmt_core.alignment import Aligner
+from latexmt_core.translation import Translator
+
+
+class Priority(IntEnum):
+    '''
+    checkout priority; lower values are served first, requests with the same
+    priority are served in arrival order
+    '''
+
+    INTERACTIVE = 0
+    JOB = 1
+
+
+def resident_memory() -> int:
+    '''
+    returns the resident set size of this process in bytes (0 if unknown)
+    '''
+
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class Replica:
+    def __init__(self, translator: Translator, aligner: Aligner, memory: int):
+        self.translator = translator
+        self.aligner = aligner
+        self.memory = memory
+        self.last_used = time.monotonic()
+
+
+class TimingStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def json(self) -> dict[str, float]:
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count > 0 else 0.0,
+            'max': self.max,
+        }
+
+
+class TimedAligner:
+    '''
+    records every method call of the aligner as the `align` stage; other
+    attributes are looked up on `aligner`
+    '''
+
+    def __init__(self, pool: 'ReplicaPool', aligner: Aligner):
+        self._pool = pool
+        self._aligner = aligner
+
+    def _call(self, name: str, *args, **kwargs):
+        return getattr(self._aligner, name)(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._aligner, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with stage('align', **self._pool.metric_labels):
+                return self._call(name, *args, **kwargs)
+
+        return call
+
+
+class PooledAligner(TimedAligner):
+    '''
+    runs every method call of the aligner on an exclusively checked out
+    replica
+    '''
+
+    def __init__(self, pool: 'ReplicaPool', priority: Priority, aligner: Aligner):
+        super().__init__(pool, aligner)
+        self._priority = priority
+
+    def _call(self, name: str, *args, **kwargs):
+        with self._pool.checkout(self._priority) as (_, aligner):
+            return getattr(aligner, name)(*args, **kwargs)
+
+
+class ReplicaPool:
+    '''
+    pool of up to `max_replicas` (translator, aligner) replicas for one
+    language pair and translator type
+
+    replicas are loaded on demand by `load` as long as their estimated memory
+    use stays within `memory_budget` (bytes, `None` for no limit), and all but
+    one are dropped again after being idle for `idle_timeout` seconds
+
+    `close` drops all replicas once the pool's current users are done
+    '''
+
+    def __init__(self, name: str, load: Callable[[], tuple[Translator, Aligner]],
+                 max_replicas: int, memory_budget: Optional[int],
+                 idle_timeout: float):
+        self.name = name
+        self.max_replicas = max(1, max_replicas)
+        self.memory_budget = memory_budget
+        self.idle_timeout = idle_timeout
+
+        # set to a `BatchScheduler` if segments are to be batched, or to a
+        # `RemoteDispatcher` for remote translators; either runs segments on
+        # replicas checked out per request instead of per session
+        self.batcher: Optional[Any] = None
+        self.remote: Optional[Any] = None
+        # `pair` and `translator` labels of the pool's metrics
+        self.metric_labels = {'pair': '', 'translator': ''}
+
+        self._load = load
+        self._cond = Condition()
+        self._idle = list[Replica]()
+        self._busy = 0
+        self._loading = 0
+        self._waiters = list[tuple[int, int]]()
+        self._seq = itertools.count()
+        self._memory_estimate = 0
+        self._users = 0
+        self._closed = False
+        self.last_used = time.monotonic()
+
+        self._load_stats = TimingStats()
+        self._wait_stats = {priority: TimingStats() for priority in Priority}
+        self._service_stats = {priority: TimingStats() for priority in Priority}
+
+        self.logger = logging.getLogger(__name__).getChild(name)
+
+    @property
+    def replicas(self) -> int:
+        return len(self._idle) + self._busy + self._loading
+
+    @property
+    def memory(self) -> int:
+        '''
+        estimated memory used by the loaded replicas, in bytes
+        '''
+
+        with self._cond:
+            return self._memory_estimate * self.replicas
+
+    @property
+    def in_use(self) -> bool:
+        with self._cond:
+            return self._in_use()
+
+    def _in_use(self) -> bool:
+        return (self._users > 0 or self._busy > 0 or self._loading > 0
+                or len(self._waiters) > 0)
+
+    def _can_load(self) -> bool:
+        if self.replicas >= self.max_replicas:
+            return False
+
+        # always allow the first replica, otherwise estimate from loaded ones
+        if self.replicas == 0 or self.memory_budget is None:
+            return True
+
+        estimate = self._memory_estimate
+        return estimate == 0 or estimate * (self.replicas + 1) <= self.memory_budget
+
+    def _reap_idle(self):
+        now = time.monotonic()
+        while len(self._idle) > 1 and self.replicas > 1:
+            oldest = min(self._idle, key=lambda replica: replica.last_used)
+            if now - oldest.last_used < self.idle_timeout:
+                break
+
+            self._idle.remove(oldest)
+            self.logger.info(f'Dropped idle replica ({self.replicas} remaining)')
+
+    def _acquire(self, priority: Priority) -> Replica:
+        ticket = (int(priority), next(self._seq))
+
+        with self._cond:
+            self._waiters.append(ticket)
+            try:
+                while True:
+                    if min(self._waiters) == ticket:
+                        if len(self._idle) > 0:
+                            self._waiters.remove(ticket)
+                            # most recently used first, so extra replicas go idle
+                            replica = max(self._idle, key=lambda r: r.last_used)
+                            self._idle.remove(replica)
+                            self._busy += 1
+                            return replica
+
+                        if self._can_load():
+                            self._waiters.remove(ticket)
+                            self._loading += 1
+                            break
+
+                    self._cond.wait()
+            finally:
+                self._cond.notify_all()
+
+        try:
+            memory_before = resident_memory()
+            load_start = time.monotonic()
+            translator, aligner = self._load()
+            load_time = time.monotonic() - load_start
+            memory = max(0, resident_memory() - memory_before)
+        except BaseException:
+            with self._cond:
+                self._loading -= 1
+                self._cond.notify_all()
+            raise
+
+        self.logger.info(f'Loaded replica {self.replicas} in {load_time:.1f}s (~{memory >> 20} MiB)')
+
+        with self._cond:
+            self._loading -= 1
+            self._busy += 1
+            self._memory_estimate = max(self._memory_estimate, memory)
+            self._load_stats.add(load_time)
+
+        return Replica(translator, aligner, memory)
+
+    def _release(self, replica: Replica):
+        replica.last_used = time.monotonic()
+
+        with self._cond:
+            self._busy -= 1
+            self._idle.append(replica)
+            if not self._closed:
+                self._reap_idle()
+            self._cond.notify_all()
+
+    @contextmanager
+    def checkout(self, priority: Priority = Priority.JOB) -> Iterator[tuple[Translator, Aligner]]:
+        '''
+        waits for a free replica and hands out its translator and aligner
+        exclusively for the duration of the `with` block
+        '''
+
+        wait_start = time.monotonic()
+        replica = self._acquire(priority)
+        service_start = time.monotonic()
+
+        try:
+            yield replica.translator, replica.aligner
+        finally:
+            service_end = time.monotonic()
+            self._release(replica)
+
+            with self._cond:
+                self._wait_stats[priority].add(service_start - wait_start)
+                self._service_stats[priority].add(service_end - service_start)
+            stage_seconds.observe(service_start - wait_start, stage='replica_wait',
+                                  **self.metric_labels)
+
+    @contextmanager
+    def session(self, priority: Priority = Priority.JOB) -> Iterator[tuple[Translator, Aligner]]:
+        '''
+        hands out a translator and aligner for processing a document
+
+        without batching, a replica is checked out for the whole `with` block;
+        with batching, replicas are only checked out per batch and per aligner
+        call, so that segments of concurrent documents can share batches;
+        remote translators likewise check out a replica per request
+        '''
+
+        with self._cond:
+            self._users += 1
+            self.last_used = time.monotonic()
+
+        try:
+            dispatcher = self.batcher if self.batcher is not None else self.remote
+            if dispatcher is None:
+                with self.checkout(priority) as (translator, aligner):
+                    yield translator, TimedAligner(self, aligner)  # type: ignore
+                return
+
+            # make sure a replica is loaded, to look up attributes on
+            with self.checkout(priority) as (translator, aligner):
+                pass
+
+            yield (dispatcher.translator(translator, priority),
+                   PooledAligner(self, priority, aligner))  # type: ignore
+        finally:
+            with self._cond:
+                self._users -= 1
+                self.last_used = time.monotonic()
+                self._cond.notify_all()
+
+    def close(self):
+        '''
+        waits for the pool's users to finish, then drops all replicas
+
+        a closed pool still works if used afterwards, it just is no longer
+        kept loaded
+        '''
+
+        with self._cond:
+            self._closed = True
+            self._cond.wait_for(lambda: not self._in_use())
+            dropped = len(self._idle)
+            self._idle.clear()
+
+        if self.batcher is not None:
+            self.batcher.stop()
+
+        self.logger.info(f'Unloaded {dropped} replicas')
+
+    def stats(self) -> dict[str, Any]:
+        batcher_stats = self.batcher.stats() if self.batcher is not None else None
+
+        with self._cond:
+            return {
+                'replicas': self.replicas,
+                'busy': self._busy,
+                'loading': self._loading,
+                'waiting': len(self._waiters),
+                'max_replicas': self.max_replicas,
+                'replica_memory': self._memory_estimate,
+                'users': self._users,
+                'idle_seconds': time.monotonic() - self.last_used,
+                'load_time': self._load_stats.json(),
+                'wait_time': {priority.name.lower(): stats.json()
+                              for priority, stats in self._wait_stats.items()},
+                'service_time': {priority.name.lower(): stats.json()
+                                 for priority, stats in self._service_stats.items()},
+                'batching': batcher_stats,
+            }
@@ -0,0 +1,199 @@
+from collections import deque
+import logging
+import time
+import traceback
+from threading import Event, Lock
+
+from . import db
+from .memory import SegmentCounts
+from .proxy import TranslatorProxy
+
+# type imports
+from latexmt_core.translation import Translator
+from typing import Any, Optional
+
+
+class FileProgress:
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self.segments = 0
+
+
+class JobProgress:
+    '''
+    files and segments done by a job, the file last started and an estimate
+    of when the job will be done; written to the database at most every
+    `interval` seconds
+
+    with `owner` given, progress is only written while the job is leased to
+    `owner`; `lease_lost` is set once it is not (or by the caller), after
+    which no more segments are translated
+
+    the number of segments is only known once a file has been parsed, so
+    the total is extrapolated from the segments per input byte of the files
+    done so far
+
+    segments of files reused from a base job, and segments answered by the
+    translation memory (counted in `memory_counts`), are reported as reused
+    '''
+
+    # seconds of recent throughput the estimate is based on
+    window = 60
+
+    def __init__(self, job_id: int, files_total: int, interval: float,
+                 owner: Optional[str] = None, lease_lost: Optional[Event] = None):
+        self.job_id = job_id
+        self.interval = interval
+        self.owner = owner
+        self.lease_lost = lease_lost if lease_lost is not None else Event()
+
+        self._mutex = Lock()
+        self._files_total = files_total
+        self._files_done = 0
+        self._segments_done = 0
+        self._running = list[FileProgress]()
+        # input bytes still to be translated, and bytes and segments of the
+        # translated files
+        self._pending_bytes = 0
+        self._finished_bytes = 0
+        self._finished_segments = 0
+        # segments per file done, by path
+        self._file_segments = dict[str, int]()
+        self._files_reused = 0
+        self._segments_reused = 0
+        self.memory_counts = SegmentCounts()
+        # (time, segments done) samples within `window`
+        self._samples = deque[tuple[float, int]]()
+        self._last_write = 0.0
+
+        self.logger = logging.getLogger(__name__)
+
+    def reuse_files(self, file_segments: dict[str, int]):
+        '''
+        counts the files (and their segments, by path) as done without
+        translating them
+        '''
+
+        with self._mutex:
+            self._files_done += len(file_segments)
+            self._files_reused += len(file_segments)
+            self._segments_reused += sum(file_segments.values())
+            self._file_segments.update(file_segments)
+
+    def file_segments(self) -> dict[str, int]:
+        with self._mutex:
+            return dict(self._file_segments)
+
+    def check_lease(self):
+        if self.lease_lost.is_set():
+            raise db.LeaseLost(self.job_id)
+
+    def add_pending(self, size: int):
+        with self._mutex:
+            self._pending_bytes += size
+
+    def start_file(self, path: str, size: int) -> FileProgress:
+        file = FileProgress(path, size)
+        with self._mutex:
+            self._running.append(file)
+        self.flush()
+        return file
+
+    def add_segments(self, file: FileProgress, count: int):
+        now = time.monotonic()
+        with self._mutex:
+            file.segments += count
+            self._segments_done += count
+
+            self._samples.append((now, self._segments_done))
+            while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+                self._samples.popleft()
+
+        self.flush()
+
+    def finish_file(self, file: FileProgress):
+        with self._mutex:
+            self._running.remove(file)
+            self._files_done += 1
+            self._pending_bytes -= file.size
+            self._finished_bytes += file.size
+            self._finished_segments += file.segments
+            self._file_segments[file.path] = file.segments
+
+        self.flush()
+
+    def _segments_total(self) -> Optional[int]:
+        if self._finished_bytes == 0:
+            return None if self._pending_bytes > 0 else self._segments_done
+
+        per_byte = self._finished_segments / self._finished_bytes
+        estimate = self._finished_segments + round(per_byte * self._pending_bytes)
+        return max(estimate, self._segments_done)
+
+    def _eta(self, segments_total: Optional[int]) -> Optional[float]:
+        if segments_total is None or len(self._samples) < 2:
+            return None
+
+        (start, start_done), (end, end_done) = self._samples[0], self._samples[-1]
+        if end <= start or end_done <= start_done:
+            return None
+
+        rate = (end_done - start_done) / (end - start)
+        return time.time() + (segments_total - self._segments_done) / rate
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._mutex:
+            segments_total = self._segments_total()
+            return {
+                'files_total': self._files_total,
+                'files_done': self._files_done,
+                'segments_total': segments_total,
+                'segments_done': self._segments_done,
+                'files_reused': self._files_reused,
+                'segments_reused': self._segments_reused + self.memory_counts.reused,
+                'segments_translated': self._segments_done - self.memory_counts.reused,
+                'current_file': self._running[-1].path if len(self._running) > 0 else None,
+                # Unix time the job is expected to be done
+                'eta': self._eta(segments_total),
+                'updated': time.time(),
+            }
+
+    def flush(self, force: bool = False):
+        '''
+        writes the progress unless it was written within `interval` seconds
+        '''
+
+        now = time.monotonic()
+        with self._mutex:
+            if not force and now - self._last_write < self.interval:
+                return
+            self._last_write = now
+
+        try:
+            db.update_progress(self.job_id, self.snapshot(), owner=self.owner)
+        except db.LeaseLost as err:
+            self.logger.warning(str(err))
+            self.lease_lost.set()
+        except Exception as err:
+            # progress is informational, the job goes on regardless
+            self.logger.warning(f'Error writing progress of job {self.job_id}\n'
+                                f'{err}\n{traceback.format_exc()}')
+
+
+class ProgressTranslator(TranslatorProxy):
+    '''
+    counts the segments translated for one file of a job
+    '''
+
+    def __init__(self, translator: Translator, progress: JobProgress, file: FileProgress):
+        super().__init__(translator)
+        self.progress = progress
+        self.file = file
+
+    def _translate_segments(self, segments: list[str]) -> list[str]:
+        # another worker runs the job now
+        self.progress.check_lease()
+        translated = super()._translate_segments(segments)
+        self.progress.add_segments(self.file, len(segments))
+        return translated
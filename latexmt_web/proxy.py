@@ -0,0 +1,35 @@
+# type imports
+from latexmt_core.translation import Translator
+
+
+class TranslatorProxy:
+    '''
+    wraps a `Translator`, forwarding everything except segment translation to
+    it; subclasses override `_translate_segments` to intercept segments
+    '''
+
+    def __init__(self, translator: Translator):
+        self.translator = translator
+
+    def __getattr__(self, name: str):
+        return getattr(self.translator, name)
+
+    def translate(self, input: str) -> str:
+        return self._translate_segments([input])[0]
+
+    def translate_batch(self, input_batch: list[str]) -> list[str]:
+        return self._translate_segments(list(input_batch))
+
+    def _translate_segments(self, segments: list[str]) -> list[str]:
+        return translate_segments(self.translator, segments)
+
+
+def translate_segments(translator: Translator, segments: list[str]) -> list[str]:
+    if len(segments) == 0:
+        return []
+
+    translate_batch = getattr(translator, 'translate_batch', None)
+    if translate_batch is not None:
+        return list(translate_batch(segments))
+
+    return [translator.translate(segment) for segment in segments]
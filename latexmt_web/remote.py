@@ -0,0 +1,250 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+import logging
+import random
+from threading import Lock, Thread
+from weakref import WeakKeyDictionary
+
+from .configure import ConfigKey
+from .metrics import Counter, register
+from .pool import Priority, ReplicaPool
+from .proxy import TranslatorProxy, translate_segments
+
+# type imports
+from latexmt_core.translation import Translator
+from typing import Any, Optional
+
+
+remote_retries = register(Counter(
+    'latexmt_remote_retries_total', 'Retried requests to remote translators', ('translator',)))
+
+# names of exception types (of any API client library) for errors which may
+# go away when retried
+__transient_error_names = ('Timeout', 'Connection', 'TooManyRequests', 'RateLimit',
+                           'ServiceUnavailable')
+
+
+def is_remote(trans_type: str) -> bool:
+    '''
+    whether the translator sends its segments to a remote service
+    '''
+
+    return trans_type.startswith('api_') or bool(current_app.config.get(ConfigKey.ENDPOINT))
+
+
+def __status_code(err: BaseException) -> Optional[int]:
+    '''
+    the HTTP status of an error raised by an API client, if it carries one
+    '''
+
+    for source in (err, getattr(err, 'response', None)):
+        for name in ('status_code', 'http_status_code', 'status', 'code'):
+            value = getattr(source, name, None)
+            if isinstance(value, int) and 100 <= value < 600:
+                return value
+    return None
+
+
+def is_transient(err: BaseException) -> bool:
+    '''
+    whether a request which failed with `err` may succeed when retried:
+    timeouts, connection errors, 429 and 5xx responses; errors such as
+    invalid credentials or exceeded quotas are not retried
+    '''
+
+    while err is not None:
+        if isinstance(err, (TimeoutError, ConnectionError)):
+            return True
+
+        status = __status_code(err)
+        if status is not None:
+            return status == 429 or status >= 500
+
+        if any(name in type(err).__name__ for name in __transient_error_names):
+            return True
+
+        err = err.__cause__ or err.__context__  # type: ignore
+
+    return False
+
+
+class RemoteExecutor:
+    '''
+    runs the requests of remote translators from an asyncio event loop on
+    its own thread: each call's segments are split into chunks of up to
+    `chunk_size` which are sent concurrently, at most `max_concurrency` at
+    once across all pools and at most one per replica (client) of a pool;
+    transient failures are retried up to `retries` times with jittered
+    exponential backoff
+
+    the clients are blocking, so every request in flight runs on one of
+    `max_concurrency` executor threads, on a replica checked out of its pool
+    so that no client is used by two requests at once
+    '''
+
+    def __init__(self, max_concurrency: int, chunk_size: int, retries: int, backoff: float):
+        self.max_concurrency = max_concurrency
+        self.chunk_size = max(1, chunk_size)
+        self.retries = retries
+        self.backoff = backoff
+
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(ThreadPoolExecutor(max_workers=max_concurrency,
+                                                           thread_name_prefix='remote'))
+        # only used on the loop's thread
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pool_semaphores = WeakKeyDictionary[ReplicaPool, asyncio.Semaphore]()
+
+        self._mutex = Lock()
+        self._in_flight = 0
+        self._requests = 0
+        self._retries = 0
+        self._failures = 0
+
+        self.logger = logging.getLogger(__name__)
+
+        Thread(target=self._run_loop, daemon=True, name='remote-translators').start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._loop.run_forever()
+
+    def _pool_semaphore(self, pool: ReplicaPool) -> asyncio.Semaphore:
+        if pool not in self._pool_semaphores:
+            self._pool_semaphores[pool] = asyncio.Semaphore(pool.max_replicas)
+        return self._pool_semaphores[pool]
+
+    @staticmethod
+    def _request(pool: ReplicaPool, priority: Priority, chunk: list[str]) -> list[str]:
+        with pool.checkout(priority) as (translator, _):
+            return translate_segments(translator, chunk)
+
+    async def _send(self, pool: ReplicaPool, priority: Priority, chunk: list[str],
+                    label: str) -> list[str]:
+        assert self._semaphore is not None
+
+        attempt = 0
+        while True:
+            # not held while backing off, so that others may go ahead
+            async with self._semaphore, self._pool_semaphore(pool):
+                with self._mutex:
+                    self._in_flight += 1
+                    self._requests += 1
+                try:
+                    return await self._loop.run_in_executor(
+                        None, self._request, pool, priority, chunk)
+                except Exception as err:
+                    if attempt >= self.retries or not is_transient(err):
+                        with self._mutex:
+                            self._failures += 1
+                        raise
+                    error = err
+                finally:
+                    with self._mutex:
+                        self._in_flight -= 1
+
+            delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            attempt += 1
+            self.logger.info(f'Retrying {label} in {delay:.2f}s: {error}')
+            with self._mutex:
+                self._retries += 1
+            remote_retries.inc(translator=label)
+            await asyncio.sleep(delay)
+
+    async def _translate(self, pool: ReplicaPool, priority: Priority, segments: list[str],
+                         label: str) -> list[str]:
+        chunks = [segments[start:start + self.chunk_size]
+                  for start in range(0, len(segments), self.chunk_size)]
+        results = await asyncio.gather(*(self._send(pool, priority, chunk, label)
+                                         for chunk in chunks))
+        return [segment for result in results for segment in result]
+
+    def translate(self, pool: ReplicaPool, priority: Priority, segments: list[str],
+                  label: str) -> list[str]:
+        '''
+        translates `segments` on the replicas of `pool`; blocks the calling
+        thread until all are translated
+        '''
+
+        if len(segments) == 0:
+            return []
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._translate(pool, priority, segments, label), self._loop)
+        return future.result()
+
+    def stats(self) -> dict[str, Any]:
+        with self._mutex:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self._in_flight,
+                'requests': self._requests,
+                'retries': self._retries,
+                'failures': self._failures,
+            }
+
+
+class RemoteDispatcher:
+    '''
+    sends the segments of a pool's remote translators through the
+    `RemoteExecutor`, see `ReplicaPool.remote`
+    '''
+
+    def __init__(self, pool: ReplicaPool, executor: RemoteExecutor, label: str):
+        self.pool = pool
+        self.executor = executor
+        self.label = label
+
+    def translator(self, translator: Translator, priority: Priority) -> Translator:
+        return RemoteTranslator(translator, self, priority)  # type: ignore
+
+    def translate(self, segments: list[str], priority: Priority) -> list[str]:
+        return self.executor.translate(self.pool, priority, segments, self.label)
+
+
+class RemoteTranslator(TranslatorProxy):
+    '''
+    hands every segment to the `RemoteDispatcher`; `translator` is only used
+    to look up attributes other than segment translation
+    '''
+
+    def __init__(self, translator: Translator, dispatcher: RemoteDispatcher,
+                 priority: Priority):
+        super().__init__(translator)
+        self.dispatcher = dispatcher
+        self.priority = priority
+
+    def _translate_segments(self, segments: list[str]) -> list[str]:
+        return self.dispatcher.translate(segments, self.priority)
+
+
+__executor: Optional[RemoteExecutor] = None
+__executor_mutex = Lock()
+
+
+def get_remote_executor() -> RemoteExecutor:
+    global __executor
+
+    config = current_app.config
+
+    with __executor_mutex:
+        if __executor is None:
+            __executor = RemoteExecutor(
+                max_concurrency=config[ConfigKey.REMOTE_MAX_CONCURRENCY],
+                chunk_size=config[ConfigKey.REMOTE_CHUNK_SIZE],
+                retries=config[ConfigKey.REMOTE_RETRIES],
+                backoff=config[ConfigKey.REMOTE_BACKOFF_MS] / 1000,
+            )
+
+    return __executor
+
+
+def remote_executor_stats() -> Optional[dict[str, Any]]:
+    '''
+    `None` if no remote translator has been used
+    '''
+
+    with __executor_mutex:
+        return __executor.stats() if __executor is not None else None
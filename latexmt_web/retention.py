@@ -0,0 +1,210 @@
+from flask import Flask
+import gzip
+import logging
+import os
+import shutil
+import time
+import traceback
+from threading import Thread
+
+from . import db
+from .archive import archive_filename
+from .configure import ConfigKey
+from .dirs import input_base, log_base, output_base, upload_base
+from .ingest import fail_stale_uploads
+from .logstream import subscriber_count
+
+# type imports
+from pathlib import Path
+from typing import Optional
+
+
+def log_filename(job_id: int) -> Path:
+    return log_base().joinpath(f'{job_id}.log')
+
+
+def compressed_log_filename(job_id: int) -> Path:
+    return log_base().joinpath(f'{job_id}.log.gz')
+
+
+def read_compressed_log(job_id: int, offset: int) -> Optional[tuple[str, int]]:
+    '''
+    returns the compressed log of a job from byte `offset` on and its size,
+    or `None` if the log is not compressed
+    '''
+
+    try:
+        with gzip.open(compressed_log_filename(job_id), 'rb') as log_file:
+            data = log_file.read()
+    except FileNotFoundError:
+        return None
+
+    return data[offset:].decode('utf-8', errors='replace'), len(data)
+
+
+def __job_paths(job_id: int) -> list[Path]:
+    return [
+        upload_base().joinpath(str(job_id)),
+        input_base().joinpath(str(job_id)),
+        output_base().joinpath(str(job_id)),
+        archive_filename(job_id),
+        log_filename(job_id),
+        compressed_log_filename(job_id),
+    ]
+
+
+def __size(path: Path) -> int:
+    '''
+    outputs hard-linked from an identical job are counted for both jobs
+    '''
+
+    if path.is_file():
+        return path.stat().st_size
+    if path.is_dir():
+        return sum(file.stat().st_size for file in path.rglob('*') if file.is_file())
+    return 0
+
+
+def job_disk_usage(job_id: int) -> int:
+    return sum(__size(path) for path in __job_paths(job_id))
+
+
+def remove_job(job_id: int):
+    '''
+    deletes the job and all its files
+    '''
+
+    db.delete_job(job_id)
+
+    for path in __job_paths(job_id):
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+
+
+def compress_log(job_id: int) -> bool:
+    '''
+    replaces the job's log with a gzip-compressed copy; returns False if
+    there is no uncompressed log
+    '''
+
+    path = log_filename(job_id)
+    if not path.exists():
+        return False
+
+    tmp_path = path.with_name(f'.{path.name}.gz')
+    with open(path, 'rb') as src, gzip.open(tmp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp_path, compressed_log_filename(job_id))
+    path.unlink()
+    return True
+
+
+class RetentionSweeper:
+    '''
+    removes finished jobs (rows and files) in the background: after a time
+    to live per status, and least recently updated first while the jobs'
+    files exceed the disk quota; old logs may be compressed, and jobs whose
+    upload was never extracted are failed
+
+    every sweep handles at most `batch` jobs per step, sweeping again right
+    away while work remains, so that a backlog is worked off in small steps
+    '''
+
+    def __init__(self, app: Flask):
+        self.app = app
+
+        config = app.config
+        self.ttl = dict[str, int](config[ConfigKey.RETENTION_TTL])
+        self.disk_quota = config[ConfigKey.DISK_QUOTA_BYTES]
+        self.compress_logs_after = config[ConfigKey.COMPRESS_LOGS_AFTER]
+        self.interval = config[ConfigKey.RETENTION_INTERVAL]
+        self.batch = config[ConfigKey.RETENTION_BATCH]
+
+        self.logger = logging.getLogger(__name__)
+
+        for status in list(self.ttl):
+            if status not in db.finished_statuses:
+                self.logger.warning(f'Ignoring retention TTL of unfinished status {status}')
+                del self.ttl[status]
+
+    def start(self):
+        Thread(target=self._loop, daemon=True, name='retention').start()
+
+    def _loop(self):
+        while True:
+            more = False
+            try:
+                with self.app.app_context():
+                    more = self.sweep()
+            except Exception as err:
+                self.logger.warning(f'Error sweeping jobs\n{err}\n{traceback.format_exc()}')
+
+            time.sleep(1 if more else self.interval)
+
+    def sweep(self) -> bool:
+        '''
+        returns whether work remains
+        '''
+
+        fail_stale_uploads(self.logger)
+
+        more = self._measure()
+        more = self._expire() or more
+        more = self._enforce_quota() or more
+        more = self._compress_logs() or more
+        return more
+
+    def _measure(self) -> bool:
+        job_ids = db.unmeasured_jobs(self.batch)
+        for job_id in job_ids:
+            db.set_disk_usage(job_id, job_disk_usage(job_id))
+        return len(job_ids) == self.batch
+
+    def _expire(self) -> bool:
+        more = False
+        now = time.time()
+
+        for status, ttl in self.ttl.items():
+            job_ids = db.expired_jobs(status, now - ttl, self.batch)
+            for job_id in job_ids:
+                remove_job(job_id)
+                self.logger.info(f'Removed job {job_id} ({status} for more than {ttl} seconds)')
+            more = more or len(job_ids) == self.batch
+
+        return more
+
+    def _enforce_quota(self) -> bool:
+        if self.disk_quota is None:
+            return False
+
+        total, _, _ = db.disk_usage(limit=0)
+        if total <= self.disk_quota:
+            return False
+
+        candidates = db.oldest_finished_jobs(self.batch)
+        for job_id, disk_bytes in candidates:
+            if total <= self.disk_quota:
+                return False
+
+            remove_job(job_id)
+            total -= disk_bytes
+            self.logger.info(f'Removed job {job_id} to stay within the disk quota')
+
+        return total > self.disk_quota and len(candidates) == self.batch
+
+    def _compress_logs(self) -> bool:
+        if self.compress_logs_after is None:
+            return False
+
+        job_ids = db.logs_to_compress(time.time() - self.compress_logs_after, self.batch)
+        for job_id in job_ids:
+            # log viewers read the uncompressed file
+            if subscriber_count(job_id) > 0:
+                continue
+
+            compress_log(job_id)
+            db.set_disk_usage(job_id, job_disk_usage(job_id), log_compressed=True)
+
+        return len(job_ids) == self.batch
@@ -0,0 +1,196 @@
+from flask import Flask
+import logging
+import traceback
+import uuid
+from threading import Event, Lock, Thread
+
+from . import db
+from .admission import get_admission
+from .configure import ConfigKey
+from .dedup import complete_duplicates
+from .worker import job_worker
+
+# type imports
+from typing import Optional
+
+
+class JobScheduler:
+    '''
+    runs queued jobs from the `jobs` table
+
+    jobs are claimed with a lease which is renewed while they run; jobs whose
+    lease expires (e.g. because the process running them died) are put back
+    into the queue, so no job is lost across restarts
+
+    `stop` lets the running jobs finish (for a while), so that jobs are
+    not run twice needlessly
+    '''
+
+    # seconds between two polls of the queue when not notified
+    poll_interval = 5.0
+
+    def __init__(self, app: Flask, pairs: Optional[list[tuple[str, str]]] = None):
+        self.app = app
+        self.pairs = pairs
+        self.owner = uuid.uuid4().hex
+
+        config = app.config
+        self.concurrency = config[ConfigKey.JOB_CONCURRENCY]
+        self.pair_concurrency = config[ConfigKey.JOB_PAIR_CONCURRENCY]
+        self.lease_seconds = config[ConfigKey.JOB_LEASE_SECONDS]
+
+        self._mutex = Lock()
+        # running jobs, and the events telling them they lost their lease
+        self._running = dict[int, Event]()
+        self._wakeup = Event()
+        self._stopped = Event()
+        # set once `stop` gave up waiting for the running jobs
+        self._abandoned = Event()
+        self._thread: Optional[Thread] = None
+
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        with self.app.app_context():
+            requeued = db.requeue_orphaned_jobs()
+        if len(requeued) > 0:
+            self.logger.info(f'Re-queued orphaned jobs {requeued}')
+
+        self._thread = Thread(target=self._loop, daemon=True, name='job-scheduler')
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        '''
+        stops claiming jobs and waits up to `timeout` seconds (`None` for no
+        limit) for the running jobs to finish, renewing their leases
+
+        jobs still running after that are put back into the queue right away
+        '''
+
+        with self._mutex:
+            self._stopped.set()
+            running = sorted(self._running)
+        self._wakeup.set()
+
+        if len(running) > 0:
+            self.logger.info(f'Waiting for running jobs {running}')
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+        self._abandoned.set()
+        with self._mutex:
+            running = sorted(self._running)
+        if len(running) > 0:
+            self.logger.warning(f'Stopped with jobs {running} still running, re-queueing them')
+            with self.app.app_context():
+                db.requeue_orphaned_jobs(owner=self.owner)
+            with self._mutex:
+                for lease_lost in self._running.values():
+                    lease_lost.set()
+
+    @property
+    def active_jobs(self) -> int:
+        with self._mutex:
+            return len(self._running)
+
+    def notify(self):
+        '''
+        wakes up the scheduler, e.g. after a job was queued
+        '''
+
+        self._wakeup.set()
+
+    def _loop(self):
+        heartbeat_interval = self.lease_seconds / 3
+
+        # once stopped, only the leases of the running jobs are renewed until
+        # they are done or abandoned
+        while not (self._stopped.is_set() and self.active_jobs == 0
+                   or self._abandoned.is_set()):
+            try:
+                with self.app.app_context():
+                    self._renew_leases()
+                    if not self._stopped.is_set():
+                        db.requeue_orphaned_jobs()
+                        self._claim_jobs()
+            except Exception as err:
+                self.logger.warning(
+                    f'Error scheduling jobs\n{err}\n{traceback.format_exc()}')
+
+            self._wakeup.wait(timeout=min(self.poll_interval, heartbeat_interval))
+            self._wakeup.clear()
+
+    def _renew_leases(self):
+        with self._mutex:
+            running = list(self._running.items())
+
+        for job_id, lease_lost in running:
+            if not lease_lost.is_set() and not db.renew_lease(job_id, self.owner,
+                                                              self.lease_seconds):
+                # e.g. after this process stalled for longer than the lease;
+                # the job may already run elsewhere, so it is abandoned here
+                self.logger.warning(f'Lost lease on job {job_id}, abandoning it')
+                lease_lost.set()
+
+    def _claim_jobs(self):
+        while True:
+            # claimed with the mutex held, so that `stop` cannot come between
+            # checking and claiming
+            with self._mutex:
+                if self._stopped.is_set() or len(self._running) >= self.concurrency:
+                    return
+
+                job = db.claim_job(self.owner, self.lease_seconds,
+                                   pair_limit=self.pair_concurrency, pairs=self.pairs)
+                if job is None:
+                    return
+
+                lease_lost = Event()
+                self._running[job.id] = lease_lost
+
+            self.logger.info('Claimed', extra={'job': job})
+            try:
+                # not an executor: its workers are joined at interpreter
+                # shutdown, before `stop` could be called
+                Thread(target=self._run,
+                       args=(job.id, f'{job.src_lang}-{job.tgt_lang}', lease_lost),
+                       daemon=True, name=f'job-{job.id}').start()
+            except RuntimeError as err:
+                # e.g. while the interpreter shuts down
+                self.logger.warning(f'Could not start job {job.id}, re-queueing it: {err}')
+                db.requeue_job(job.id, self.owner)
+                with self._mutex:
+                    self._running.pop(job.id, None)
+                return
+
+    def _run(self, job_id: int, pair: str, lease_lost: Event):
+        try:
+            with self.app.app_context():
+                job_worker(job_id, owner=self.owner, lease_lost=lease_lost)
+                get_admission().job_finished(pair)
+        except db.LeaseLost:
+            self.logger.warning(f'Abandoned job {job_id}, which is no longer leased to '
+                                'this process')
+        except Exception as err:
+            self.logger.warning(
+                f'Error running job {job_id}\n{err}\n{traceback.format_exc()}')
+            with self.app.app_context():
+                # e.g. as the interpreter shuts down; not the job's fault
+                if self._stopped.is_set() and db.requeue_job(job_id, self.owner):
+                    self.logger.info(f'Re-queued job {job_id} interrupted by stopping')
+                    return
+
+                job = db.get_job(job_id)
+                if job is not None:
+                    job.status = 'error'
+                    try:
+                        db.update_job(job_id, job, owner=self.owner)
+                    except db.LeaseLost:
+                        return
+                    complete_duplicates(job, self.logger)
+        finally:
+            with self.app.app_context():
+                db.release_lease(job_id, self.owner)
+            with self._mutex:
+                self._running.pop(job_id, None)
+            self.notify()
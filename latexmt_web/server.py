@@ -4,33 +4,46 @@ from pathlib import Path
 sys.path.insert(1, str(Path(__file__).parent.parent))
 
 # autopep8: off - the stuff at the top needs to STAY at the top
-from flask import Flask, jsonify, render_template, request, send_file
-from flask_executor import Executor
+from flask import Flask, Response, jsonify, render_template, request, send_file, stream_with_context
 from flask_sock import Sock, Server as WS
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-import subprocess
+import atexit
+import hmac
 import time
 import json
-from io import BytesIO
 import logging
-import shutil
-from zipfile import ZipFile, ZIP_STORED
-from typing import Any
+from typing import Any, Optional
 
 from latexmt_core.context_logger import ContextLogger
+from .admission import Overloaded, get_admission
+from .archive import archive_filename, output_files, stream_zip
+from .cache import get_result_cache
 from .configure import ConfigKey, latexmt_configure
 from . import db
+from .dedup import parameter_fingerprint
 from .dirs import (
+    archive_base,
     basedir,
     upload_base,
     input_base,
     output_base,
     log_base,
-    clear_upload,
 )
+from .events import JobWatcher, event_json, job_events
+from .format import get_formatter
+from .glossary import get_glossary_cache, normalize_glossary, read_glossary, store_glossary
 from .helpers import ensure_dir
+from .ingest import UploadRequest, claim_upload, discard_unclaimed_uploads, ingest_upload
 from .job import Job
-from .worker import job_worker, translate_single
+from .logstream import ensure_follower, read_log_file, subscribe, unsubscribe
+from .memory import get_translation_memory
+from .metrics import Gauge, register, render_metrics
+from .remote import remote_executor_stats
+from .retention import RetentionSweeper, read_compressed_log
+from .scheduler import JobScheduler
+from .translator import preload_translators, translator_pool_stats
+from .worker import translate_single, translate_stream
 # autopep8: on
 
 
@@ -48,9 +61,7 @@ app = Flask(__name__,
             template_folder='templates'
             )
 app.config['TEMPLATES_AUTO_RELOAD'] = True
-
-app.config['EXECUTOR_PROPAGATE_EXCEPTIONS'] = True
-executor = Executor(app)
+app.request_class = UploadRequest
 
 app.config['SOCK_SERVER_OPTIONS'] = {'ping_interval': 25}
 sock = Sock(app)
@@ -59,11 +70,53 @@ sock = Sock(app)
 latexmt_configure(app)
 
 with app.app_context():
-    for dir_ in (basedir, upload_base, input_base, output_base, log_base):
+    for dir_ in (basedir, upload_base, input_base, output_base, log_base, archive_base):
         ensure_dir(dir_())
 
 logging.getLogger().setLevel(app.config[ConfigKey.LOG_LEVEL])
 
+# clients are told apart by address, e.g. for their rate limit
+if app.config[ConfigKey.TRUSTED_PROXIES] > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config[ConfigKey.TRUSTED_PROXIES])
+
+# larger uploads could not be extracted within the limit anyway
+app.config['MAX_CONTENT_LENGTH'] = app.config[ConfigKey.UPLOAD_MAX_BYTES]
+
+if app.config[ConfigKey.ENABLE_JOBS]:
+    JobWatcher(app, db.jobs_changed_since, db.last_change).start()
+    RetentionSweeper(app).start()
+
+# with translation disabled, jobs are left to `latexmt-worker` processes
+scheduler = JobScheduler(app)
+if app.config[ConfigKey.ENABLE_JOBS] and app.config[ConfigKey.ENABLE_TRANSLATION]:
+    scheduler.start()
+    # jobs interrupted by the interpreter shutting down before this runs
+    # (e.g. as their executors stopped accepting work) are re-queued
+    atexit.register(scheduler.stop, app.config[ConfigKey.JOB_STOP_TIMEOUT])
+
+if app.config[ConfigKey.ENABLE_TRANSLATION]:
+    preload_translators(app)
+
+
+def queue_gauge(column: str):
+    def collect() -> dict[tuple[str, ...], float]:
+        return {(pair,): stats[column] for pair, stats in db.queue_stats().items()}
+    return collect
+
+
+register(Gauge('latexmt_queued_jobs', 'Jobs waiting to be run, across all processes',
+               ('pair',), collect=queue_gauge('queued')))
+register(Gauge('latexmt_running_jobs', 'Jobs being run, across all processes',
+               ('pair',), collect=queue_gauge('running')))
+register(Gauge('latexmt_active_jobs', 'Jobs being run by this process',
+               collect=lambda: {(): scheduler.active_jobs}))
+register(Gauge('latexmt_replicas', 'Loaded translator replicas', ('pool',),
+               collect=lambda: {(name,): stats['replicas']
+                                for name, stats in translator_pool_stats().items()}))
+register(Gauge('latexmt_replica_waiters', 'Requests waiting for a translator replica', ('pool',),
+               collect=lambda: {(name,): stats['waiting']
+                                for name, stats in translator_pool_stats().items()}))
+
 # templates and their defaults
 templates = {
     'index': (
@@ -83,10 +136,81 @@ def job_json(job: Job) -> dict[str, Any]:
         'src_lang': job.src_lang,
         'tgt_lang': job.tgt_lang,
         'status': job.status,
+        'priority': job.priority,
+        'base_job_id': job.base_job_id,
+        'glossary_id': job.glossary_id,
+        'duplicate_of': job.duplicate_of,
+        'progress': job.progress,
         'download_url': job.download_url,
     }
 
 
+def form_flag(name: str, default: bool) -> bool:
+    if name not in request.form:
+        return default
+    return request.form[name].strip().lower() not in ('', '0', 'false', 'off', 'no')
+
+
+def query_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    '''
+    returns the query argument `name` as an integer; raises `ValueError` if
+    it is not one
+    '''
+
+    if name not in request.args:
+        return default
+    return int(request.args[name])
+
+
+# priorities jobs may be queued with; positive ones require the admin token
+job_priorities = range(-10, 11)
+
+
+def admin_error() -> Optional[tuple[Response, int]]:
+    '''
+    returns the error response if the request does not carry the configured
+    admin token
+    '''
+
+    token = app.config[ConfigKey.ADMIN_TOKEN]
+    if token is None or token == '':
+        return jsonify('Admin endpoints are disabled'), 403
+
+    given = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not hmac.compare_digest(given.encode('utf-8'), token.encode('utf-8')):
+        return jsonify('Invalid admin token'), 401
+
+    return None
+
+
+def retry_after_headers(err: Overloaded) -> dict[str, str]:
+    return {'Retry-After': str(err.retry_after)}
+
+
+def form_glossary() -> tuple[str, Optional[str]]:
+    '''
+    returns the request's inline glossary and stored glossary ID; raises
+    `ValueError` if both are given or the ID is unknown
+    '''
+
+    glossary = request.form.get('glossary', '')
+    glossary_id = request.form.get('glossary_id', '').strip() or None
+
+    if glossary_id is None:
+        return glossary, None
+    if glossary.strip() != '':
+        raise ValueError('Either a glossary or a glossary ID may be given')
+    if read_glossary(glossary_id) is None:
+        raise ValueError(f'Glossary {glossary_id} does not exist')
+
+    return '', glossary_id
+
+
+@app.teardown_request
+def teardown_uploads(_exc):
+    discard_unclaimed_uploads()
+
+
 def render_template_with_defaults(template_name: str, **context):
     template, defaults = templates[template_name]
     return render_template(template, **defaults, **context)
@@ -94,11 +218,20 @@ def render_template_with_defaults(template_name: str, **context):
 
 @app.route('/')
 def index():
-    return render_template_with_defaults('index', jobs=api_jobs())
+    return render_template_with_defaults('index')
 
 
 @app.route('/api/translate', methods=['POST'])
 def api_translate():
+    if not app.config[ConfigKey.ENABLE_TRANSLATION]:
+        return 'Translation is not enabled on this server', 503
+
+    admission = get_admission()
+    try:
+        admission.check_client(request.remote_addr or '', 'interactive')
+    except Overloaded as err:
+        return err.message, err.status, retry_after_headers(err)
+
     input_text = '\n'.join(request.form['input_text'].splitlines())
     # model = request.form['model']
     # input_prefix = request.form['input-prefix']
@@ -107,8 +240,13 @@ def api_translate():
     tgt_lang = request.form['tgt_lang']
     deepl_api_token = request.form['deepl_api_token'] if 'deepl_api_token' in request.form else ''
 
-    glossary = request.form['glossary'] if 'glossary' in request.form else None
+    try:
+        glossary, glossary_id = form_glossary()
+    except ValueError as err:
+        return str(err), 400
+
     mask_placeholder = request.form['mask_placeholder'] if 'mask_placeholder' in request.form else ''
+    use_translation_memory = form_flag('use_translation_memory', True)
 
     params = Job(0,
                  status='new',
@@ -116,7 +254,9 @@ def api_translate():
                  input_prefix=None,
                  download_url=None,
                  glossary=glossary,
+                 glossary_id=glossary_id,
                  mask_placeholder=mask_placeholder,
+                 use_translation_memory=use_translation_memory,
                  deepl_api_token=deepl_api_token,
                  src_lang=src_lang,
                  tgt_lang=tgt_lang)
@@ -128,7 +268,83 @@ def api_translate():
     # job_logger = logging.getLogger(f'Job {params.id}')
     # job_logger.addHandler(file_handler)
 
-    return translate_single(input_text, src_lang=src_lang, tgt_lang=tgt_lang, params=params)
+    try:
+        slot = admission.enter_interactive(f'{src_lang}-{tgt_lang}')
+    except Overloaded as err:
+        return err.message, err.status, retry_after_headers(err)
+
+    if form_flag('stream', False):
+        # server-sent events: `paragraph`s as they are translated, then the
+        # complete formatted output as `done`
+        def events():
+            with slot:
+                for event, text in translate_stream(input_text, src_lang=src_lang,
+                                                    tgt_lang=tgt_lang, params=params):
+                    yield f'event: {event}\ndata: {json.dumps(text)}\n\n'
+
+        response = Response(stream_with_context(events()), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        # in case the stream is never read
+        response.call_on_close(slot.release)
+        return response
+
+    with slot:
+        return translate_single(input_text, src_lang=src_lang, tgt_lang=tgt_lang, params=params)
+
+
+@app.route('/api/stats', methods=['GET'])
+def api_stats():
+    translation_memory = get_translation_memory()
+    formatter = get_formatter()
+
+    return jsonify({
+        'result_cache': get_result_cache().stats(),
+        'translator_pools': translator_pool_stats(),
+        'translation_memory': (translation_memory.stats()
+                               if translation_memory is not None else None),
+        'formatter': formatter.stats() if formatter is not None else None,
+        'glossary_cache': get_glossary_cache().stats(),
+        'admission': get_admission().stats(),
+        'remote': remote_executor_stats(),
+    })
+
+
+@app.route('/api/glossaries', methods=['POST'])
+def api_glossaries():
+    '''
+    stores the glossary given as `glossary` (form field or file) for use by
+    its ID as `glossary_id`
+    '''
+
+    if 'glossary' in request.files:
+        try:
+            text = request.files['glossary'].read().decode('utf-8')
+        except UnicodeDecodeError:
+            return jsonify('Glossary must be UTF-8 encoded'), 400
+    elif 'glossary' in request.form:
+        text = request.form['glossary']
+    else:
+        return jsonify('No glossary given'), 400
+
+    entries = normalize_glossary(text).splitlines()
+    if len(entries) == 0:
+        return jsonify('Glossary is empty'), 400
+
+    return jsonify({'id': store_glossary(text), 'entries': len(entries)})
+
+
+@app.route('/api/glossaries/<glossary_id>', methods=['GET'])
+def api_glossary(glossary_id: str):
+    text = read_glossary(glossary_id)
+    if text is None:
+        return jsonify(f'Glossary {glossary_id} does not exist'), 404
+
+    return Response(text, mimetype='text/csv')
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/api/jobs', methods=['GET', 'POST'])
@@ -137,58 +353,188 @@ def api_jobs():
         return jsonify('Jobs are not enabled'), 403
 
     if request.method == 'GET':
-        return [job_json(job) for job in db.get_jobs().values()
-                if job.status != 'archived']
+        # taken before reading, so that no change is missed by the ETag; the
+        # change counter also covers changes made by other processes which the
+        # event feed has not caught up with yet
+        events_version = f'{job_events.epoch}:{job_events.version}'
+        etag = f'{db.last_change()}:{request.query_string.decode()}'
+        if request.if_none_match.contains(etag):
+            return '', 304
+
+        try:
+            limit = query_int('limit', 100)
+            cursor = query_int('cursor')
+        except ValueError:
+            return jsonify('limit and cursor must be integers'), 400
+        assert limit is not None
+        limit = max(1, min(limit, 1000))
+        statuses = request.args['status'].split(',') if 'status' in request.args else None
+
+        jobs, next_cursor = db.list_jobs(
+            limit, cursor=cursor, statuses=statuses,
+            exclude_statuses=['archived'] if statuses is None else None)
+
+        response = jsonify([job_json(job) for job in jobs])
+        if next_cursor is not None:
+            response.headers['X-Next-Cursor'] = str(next_cursor)
+        response.headers['X-Events-Version'] = events_version
+        response.headers['Cache-Control'] = 'no-cache'
+        response.set_etag(etag)
+        return response
 
     else:
+        # checked before the upload is read
+        admission = get_admission()
+        try:
+            admission.check_client(request.remote_addr or '', 'job')
+        except Overloaded as err:
+            return jsonify(err.message), err.status, retry_after_headers(err)
+
         document = request.files['document']
         model = request.form['model']
         input_prefix = request.form['input-prefix']
         src_lang = request.form['src_lang']
         tgt_lang = request.form['tgt_lang']
-        glossary = request.form['glossary'] if 'glossary' in request.form else ''
         mask_placeholder = request.form['mask_placeholder'] if 'mask_placeholder' in request.form else ''
+        use_translation_memory = form_flag('use_translation_memory', True)
+        try:
+            priority = int(request.form['priority']) if 'priority' in request.form else 0
+            base_job_id = (int(request.form['base_job_id'])
+                           if request.form.get('base_job_id', '').strip() != '' else None)
+        except ValueError:
+            return jsonify('priority and base_job_id must be integers'), 400
+
+        if priority not in job_priorities:
+            return jsonify(f'priority must be between {job_priorities.start} and '
+                           f'{job_priorities.stop - 1}'), 400
+        # jumping the queue is reserved to admins, making way for others is not
+        if priority > 0:
+            error = admin_error()
+            if error is not None:
+                return error
+
+        if base_job_id is not None:
+            base_job = db.get_job(base_job_id)
+            if base_job is None:
+                return jsonify(f'Job {base_job_id} does not exist'), 400
+            if (base_job.src_lang, base_job.tgt_lang) != (src_lang, tgt_lang):
+                return jsonify(f'Job {base_job_id} has a different language pair'), 400
+            if base_job.status not in db.reusable_statuses:
+                return jsonify(f'Job {base_job_id} has not finished successfully'), 400
+
+        try:
+            glossary, glossary_id = form_glossary()
+        except ValueError as err:
+            return jsonify(str(err)), 400
+
+        try:
+            admission.check_job(f'{src_lang}-{tgt_lang}', db.unfinished_jobs(src_lang, tgt_lang))
+        except Overloaded as err:
+            return jsonify(err.message), err.status, retry_after_headers(err)
+
+        # inline glossaries are stored as well, instead of with every job
+        if glossary.strip() != '':
+            glossary_id = store_glossary(glossary)
+            glossary = ''
 
         job = Job(0,
-                  status='new',
+                  status='uploading',
                   model=model,
                   input_prefix=input_prefix,
                   download_url=None,
                   glossary=glossary,
+                  glossary_id=glossary_id,
                   mask_placeholder=mask_placeholder,
+                  use_translation_memory=use_translation_memory,
+                  priority=priority,
+                  base_job_id=base_job_id,
                   src_lang=src_lang,
                   tgt_lang=tgt_lang)
-        
+        job.parameters = parameter_fingerprint(job)
+
         job = db.create_job(job)
 
         upload_dir = upload_base().joinpath(str(job.id))
         ensure_dir(upload_dir)
-        input_dir = input_base().joinpath(str(job.id))
-        ensure_dir(input_dir)
 
         assert document.filename is not None
-        upload_path = upload_dir.joinpath(document.filename)
-        document.save(upload_path)
+        upload_path = claim_upload(document, upload_dir.joinpath(Path(document.filename).name))
 
-        log_file = log_base().joinpath(str(job.id) + '.log')
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setFormatter(logging.getLogger().handlers[0].formatter)
+        # log viewers may connect while the upload is being extracted
+        log_base().joinpath(str(job.id) + '.log').touch()
 
-        job_logger = logging.getLogger(f'Job {job.id}')
-        job_logger.addHandler(file_handler)
+        ingest_upload(job.id, upload_path, on_ready=scheduler.notify)
+        logger.info('Submitted', extra={'job': job})
 
-        if upload_path.name.endswith('.zip'):
-            with ZipFile(upload_path, mode='r') as upload_zip:
-                upload_zip.extractall(path=input_dir)
-        else:
-            shutil.copy2(src=str(upload_path), dst=str(input_dir))
+        return jsonify(job_json(job))
 
-        executor.submit(job_worker, job.id)
-        logger.info('Submitted', extra={'job': job})
 
-        clear_upload(job.id)
+@sock.route('/api/jobs/events')
+def api_job_events(ws: WS):
+    '''
+    streams job changes after the `since` version (as returned in the
+    `X-Events-Version` header of `/api/jobs`); a `reset` message tells the
+    client to fetch the full list again
+    '''
 
-        return jsonify(job_json(job))
+    if not app.config[ConfigKey.ENABLE_JOBS]:
+        ws.close(message='Jobs are not enabled')
+        return
+
+    epoch, _, since_str = request.args.get('since', '').partition(':')
+    since = int(since_str) if epoch == job_events.epoch and since_str.isdigit() else None
+
+    while ws.connected:
+        if since is None:
+            since = job_events.version
+            ws.send(json.dumps({'reset': True, 'version': f'{job_events.epoch}:{since}'}))
+
+        events = job_events.wait(since, timeout=25)
+        if events is None:
+            since = None
+            continue
+
+        for event in events:
+            ws.send(json.dumps(event_json(event, job_json)))
+            since = event.version
+
+
+@app.route('/api/admin/disk', methods=['GET'])
+def api_admin_disk():
+    '''
+    disk usage of the jobs' files as last measured by the retention sweeper,
+    largest first; requires the admin token
+    '''
+
+    if not app.config[ConfigKey.ENABLE_JOBS]:
+        return jsonify('Jobs are not enabled'), 403
+
+    error = admin_error()
+    if error is not None:
+        return error
+
+    try:
+        limit = query_int('limit', 100)
+    except ValueError:
+        return jsonify('limit must be an integer'), 400
+    assert limit is not None
+    limit = max(0, min(limit, 10_000))
+    total, unmeasured, jobs = db.disk_usage(limit)
+
+    return jsonify({
+        'total_bytes': total,
+        'quota_bytes': app.config[ConfigKey.DISK_QUOTA_BYTES],
+        'unmeasured_jobs': unmeasured,
+        'jobs': jobs,
+    })
+
+
+@app.route('/api/queue', methods=['GET'])
+def api_queue():
+    if not app.config[ConfigKey.ENABLE_JOBS]:
+        return jsonify('Jobs are not enabled'), 403
+
+    return jsonify(db.queue_stats())
 
 
 @app.route('/api/jobs/<job_id>', methods=['GET'])
@@ -213,23 +559,29 @@ def api_download(job_id: str):
         return 'Job does not exist', 404
 
     output_dir = output_base().joinpath(str(job.id))
-    output_files = list(output_dir.rglob('*'))
-
-    if len(output_files) > 1:
-        download_file = BytesIO()
-        with ZipFile(download_file, mode='w', compression=ZIP_STORED) as zf:
-            for output_file in output_files:
-                zf.write(output_file, arcname=output_file.relative_to(output_dir))
-
-        download_file.seek(0)
-        response = send_file(download_file, download_name=f'{job.id}.zip',
-                             mimetype='application/zip', as_attachment=True)
+    files = output_files(output_dir)
+    if len(files) == 0:
+        return 'Job has no output', 404
+
+    if len(files) > 1:
+        archive = archive_filename(job.id)
+        if archive.exists():
+            # `Range` and `ETag` are handled by `send_file` for files on disk
+            response = send_file(archive, download_name=f'{job.id}.zip',
+                                 mimetype='application/zip', as_attachment=True,
+                                 conditional=True, etag=True)
+        else:
+            response = Response(stream_zip(output_dir, files), mimetype='application/zip',
+                                headers={'Content-Disposition':
+                                         f'attachment; filename={job.id}.zip'})
 
     else:
-        with open(output_files[0], mode='rb') as download_bytes:
-            download_file = BytesIO(download_bytes.read())
-        response = send_file(download_file, download_name=str(output_files[0].name),
-                             mimetype='text/x-tex', as_attachment=True)
+        response = send_file(files[0], download_name=str(files[0].name),
+                             mimetype='text/x-tex', as_attachment=True,
+                             conditional=True, etag=True)
+
+    if job.status == 'archived':
+        return response
 
     job.status = 'archived'
     db.update_job(job.id, job)
@@ -238,19 +590,17 @@ def api_download(job_id: str):
     return response
 
 
-def ws_monitor(ws: WS, job_id: str, reader: subprocess.Popen):
-    while ws.connected and ws.pong_received:
-        time.sleep(1)
-
-    reader.terminate()
-    logger.info(f'Closed log reader for job {job_id}')
-
-    if ws.connected:
-        ws.close()
+# statuses after which nothing is appended to a job's log anymore
+finished_statuses = db.finished_statuses
 
 
 @sock.route('/api/jobs/<job_id>/log')
 def api_logs(ws: WS, job_id: str):
+    '''
+    streams the log of a job from byte `offset` (0 by default); every message
+    carries the offset to resume from after a reconnect
+    '''
+
     if not app.config[ConfigKey.ENABLE_JOBS]:
         ws.close(message='Jobs are not enabled')
         return
@@ -260,23 +610,60 @@ def api_logs(ws: WS, job_id: str):
         ws.send(json.dumps({'error': f'Job {job_id} does not exist'}))
         return
 
+    try:
+        offset = max(0, query_int('offset', 0))  # type: ignore
+    except ValueError:
+        ws.send(json.dumps({'error': 'offset must be an integer'}))
+        return
+
     log_file = log_base().joinpath(str(job.id) + '.log')
     if not log_file.exists():
-        ws.send(json.dumps({'error': f'No log file for job {job_id}'}))
+        # logs of old jobs may have been compressed
+        compressed = read_compressed_log(job.id, offset)
+        if compressed is None:
+            ws.send(json.dumps({'error': f'No log file for job {job_id}'}))
+            return
+
+        text, offset = compressed
+        if text != '':
+            ws.send(json.dumps({'log_line': text, 'offset': offset}))
+        ws.send(json.dumps({'eof': True, 'offset': offset}))
         return
 
-    f: subprocess.Popen | None = None
+    # jobs of other processes (`latexmt-worker`) are only visible in the file
+    follow_file = not app.config[ConfigKey.ENABLE_TRANSLATION]
+
+    broadcaster = subscribe(job.id, log_file, app.config[ConfigKey.LOG_BUFFER_BYTES])
     try:
-        f = subprocess.Popen(
-            ['tail', '-f', '-n+1', str(log_file)],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        logger.info(f'Opened log reader for job {job_id}')
-        assert f.stdout is not None
-
-        executor.submit(ws_monitor, ws, job_id, f)
-        for line in f.stdout:
-            ws.send(json.dumps({'log_line': line.decode()}))
+        while ws.connected:
+            # checked every time, as a follower may have been about to exit
+            # for lack of subscribers when this one subscribed
+            if follow_file and job.status not in finished_statuses:
+                ensure_follower(broadcaster)
+
+            text, offset = broadcaster.read(offset, timeout=25)
+            if text != '':
+                ws.send(json.dumps({'log_line': text, 'offset': offset}))
+                continue
+
+            if broadcaster.live and not follow_file:
+                continue
+
+            job = db.get_job(job.id)
+            if job is None or job.status in finished_statuses:
+                if follow_file and log_file.exists():
+                    # whatever the follower did not pick up before the end
+                    text, offset = read_log_file(log_file, offset)
+                    if text != '':
+                        ws.send(json.dumps({'log_line': text, 'offset': offset}))
+                ws.send(json.dumps({'eof': True, 'offset': offset}))
+                break
+
+            if not broadcaster.live:
+                # queued, nothing writes to the log yet
+                time.sleep(1)
     except Exception as e:
-        ws.send(json.dumps({'error': str(e)}))
-        if f is not None and f.returncode is None:
-            f.terminate()
+        if ws.connected:
+            ws.send(json.dumps({'error': str(e)}))
+    finally:
+        unsubscribe(broadcaster.job_id)
@@ -0,0 +1,83 @@
+from argparse import ArgumentParser
+from flask import Flask
+import logging
+import os
+import signal
+from threading import Event
+
+from latexmt_core.context_logger import ContextLogger
+from .configure import ConfigKey, get_config_path, latexmt_configure
+from .dirs import archive_base, basedir, input_base, output_base, log_base
+from .helpers import ensure_dir, parse_pairs
+from .scheduler import JobScheduler
+from .translator import preload_translators
+
+# type imports
+from pathlib import Path
+
+
+def main():
+    '''
+    entry point of `latexmt-worker`: runs queued jobs from the database in
+    `work_dir`, without serving HTTP
+    '''
+
+    parser = ArgumentParser(prog='latexmt-worker',
+                            description='Runs queued LaTeXMT jobs')
+    parser.add_argument('--config', type=Path, default=get_config_path(),
+                        help='path to the JSON configuration file')
+    parser.add_argument('--pairs', nargs='*', metavar='SRC-TGT',
+                        help='language pairs to run jobs for '
+                        '(default: `worker_pairs` from the configuration, or all)')
+    args = parser.parse_args()
+
+    logging.setLoggerClass(ContextLogger)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(
+        '%(levelname)s:%(name)s:%(message)s\tcontext=%(context)s', defaults={'context': {}}))
+    logging.basicConfig(level=logging.INFO, handlers=[handler])
+
+    logger = logging.getLogger(__name__)
+
+    app = Flask(__name__)
+    latexmt_configure(app, args.config)
+    logging.getLogger().setLevel(app.config[ConfigKey.LOG_LEVEL])
+
+    with app.app_context():
+        for dir_ in (basedir, input_base, output_base, log_base, archive_base):
+            ensure_dir(dir_())
+
+    pairs = parse_pairs(args.pairs if args.pairs is not None
+                        else app.config[ConfigKey.WORKER_PAIRS])
+
+    scheduler = JobScheduler(app, pairs=pairs)
+
+    stopped = Event()
+
+    def stop(signum, _frame):
+        if stopped.is_set():
+            # running jobs are re-queued once their lease expires
+            logger.warning(f'Received signal {signum} again, exiting without waiting for '
+                           'running jobs')
+            os._exit(1)
+
+        logger.info(f'Received signal {signum}, stopping once the running jobs are done')
+        stopped.set()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    scheduler.start()
+    preload_translators(app, only_pairs=pairs)
+    logger.info(f'Worker {scheduler.owner} started for '
+                + ('all language pairs' if pairs is None
+                   else ', '.join(f'{src}-{tgt}' for src, tgt in pairs)))
+
+    while not stopped.wait(timeout=1):
+        pass
+
+    scheduler.stop(app.config[ConfigKey.JOB_STOP_TIMEOUT])
+
+
+if __name__ == '__main__':
+    main()
@@ -191,19 +191,65 @@ function clearJobTable() {
  * }[]>}
  */
 async function getJobs() {
-  const response = await fetch('/api/jobs')
+  // revalidates with the ETag, so an unchanged list costs a 304
+  const response = await fetch('/api/jobs', { cache: 'no-cache' })
   if (!response.ok) {
     console.error('fetching jobs failed')
-    return {}
+    return []
+  }
+
+  if (response.headers.has('X-Events-Version')) {
+    jobEventsVersion = response.headers.get('X-Events-Version')
   }
 
   return response.json()
 }
 
+/**
+ * @param { {
+ *    files_total: number
+ *    files_done: number
+ *    segments_total: number | null
+ *    segments_done: number
+ *    files_reused: number
+ *    segments_reused: number
+ *    segments_translated: number
+ *    current_file: string | null
+ *    eta: number | null
+ * } } progress
+ */
+function formatProgress(progress) {
+  const parts = [`${progress.files_done}/${progress.files_total} files`]
+
+  if (progress.segments_total !== null) {
+    parts.push(`${progress.segments_done}/~${progress.segments_total} segments`)
+  } else {
+    parts.push(`${progress.segments_done} segments`)
+  }
+
+  if (progress.eta !== null) {
+    const minutes = Math.max(0, Math.round((progress.eta - Date.now() / 1000) / 60))
+    parts.push(minutes > 0 ? `~${minutes} min left` : 'almost done')
+  }
+
+  // file names come from uploads
+  let currentFile = ''
+  if (progress.current_file) {
+    const elem = document.createElement('small')
+    elem.className = 'text-muted'
+    elem.textContent = progress.current_file
+    currentFile = '<br>' + elem.outerHTML
+  }
+
+  return `<br><small>${parts.join(', ')}</small>${currentFile}`
+}
+
 /**
  * @param { {
  *    id: number
  *    status: string
+ *    duplicate_of: number | null
+ *    progress: object | null
  *    download_url: string | null
  * } } job
  */
@@ -217,6 +263,16 @@ function formatJobRow(job) {
             ? '(<a href="' + job.download_url + '">download</a>)'
             : ''
         }
+        ${
+          job.duplicate_of
+            ? `<br><small class="text-muted">identical to job ${job.duplicate_of}</small>`
+            : ''
+        }
+        ${
+          job.progress && job.status === 'processing'
+            ? formatProgress(job.progress)
+            : ''
+        }
       </td>
       <td scope="row" class="align-middle">
         <button
@@ -231,37 +287,99 @@ function formatJobRow(job) {
     </tr>`
 }
 
+/**
+ * @param { {
+ *    id: number
+ *    status: string
+ *    download_url: string | null
+ * } } job
+ */
+function upsertJobRow(job) {
+  const jobTable = getJobTable()
+  const rowElem = jobTable.querySelector(`tr[data-id="${job.id}"]`)
+  if (!rowElem) {
+    jobTable.innerHTML += formatJobRow(job)
+  } else {
+    rowElem.outerHTML = formatJobRow(job)
+  }
+}
+
+/**
+ * @param {number} jobId
+ */
+function removeJobRow(jobId) {
+  const rowElem = getJobTable().querySelector(`tr[data-id="${jobId}"]`)
+  if (rowElem) {
+    closeLogs(jobId)
+    rowElem.remove()
+  }
+}
+
 async function updateJobTable() {
   const jobs = await getJobs()
 
   let existingJobs = []
 
-  const jobTable = getJobTable()
   for (const job of jobs) {
     existingJobs.push(job.id)
-
-    const rowElem = jobTable.querySelector(`tr[data-id="${job.id}"]`)
-    if (!rowElem) {
-      jobTable.innerHTML += formatJobRow(job)
-    } else {
-      rowElem.outerHTML = formatJobRow(job)
-    }
+    upsertJobRow(job)
   }
 
   for (const elem of document.querySelectorAll('tr[data-id]')) {
     const jobId = parseInt(elem.attributes['data-id'].value)
     if (!existingJobs.includes(jobId)) {
-      closeLogs(jobId)
-      elem.remove()
+      removeJobRow(jobId)
     }
   }
 }
 
 /**
- * @type {Record<number, {socket: WebSocket; elem: HTMLElement}>}
+ * version of the last job change seen, as `epoch:version`
+ * @type {string}
+ */
+let jobEventsVersion = ''
+
+const jobEventsRetryInterval = 3000
+
+/**
+ * keeps the job table up to date with changes pushed by the server, falling
+ * back to re-fetching the list whenever the connection drops
+ */
+function watchJobs() {
+  const socket = new WebSocket(
+    `/api/jobs/events?since=${encodeURIComponent(jobEventsVersion)}`
+  )
+
+  socket.addEventListener('message', event => {
+    const data = JSON.parse(event.data)
+    jobEventsVersion = data.version
+
+    if (data.reset) {
+      updateJobTable()
+    } else if ('deleted' in data) {
+      removeJobRow(data.deleted)
+    } else if (data.job.status === 'archived') {
+      removeJobRow(data.job.id)
+    } else {
+      upsertJobRow(data.job)
+    }
+  })
+
+  socket.addEventListener('close', () => {
+    setTimeout(
+      () => updateJobTable().finally(watchJobs),
+      jobEventsRetryInterval
+    )
+  })
+}
+
+/**
+ * @type {Record<number, {socket: WebSocket; elem: HTMLElement; offset: number}>}
  */
 const logRows = {}
 
+const logRetryInterval = 3000
+
 /**
  * @param {number} jobId
  */
@@ -271,8 +389,6 @@ function showLogs(jobId) {
     return
   }
 
-  const socket = new WebSocket(`/api/jobs/${jobId}/log`)
-
   button_node = document.querySelector(`button[data-id="${jobId}"]`)
   const elem = document.createElement('tr')
   elem.innerHTML =
@@ -284,29 +400,57 @@ function showLogs(jobId) {
 
   const code_elem = elem.childNodes[0].childNodes[0]
 
-  logRows[jobId] = { socket, elem: code_elem }
+  logRows[jobId] = { socket: null, elem: code_elem, offset: 0 }
+  followLogs(jobId)
+}
+
+/**
+ * (re)connects the log of `jobId`, resuming after the last received byte
+ * @param {number} jobId
+ */
+function followLogs(jobId) {
+  const logRow = logRows[jobId]
+  const code_elem = logRow.elem
+
+  const socket = new WebSocket(`/api/jobs/${jobId}/log?offset=${logRow.offset}`)
+  logRow.socket = socket
+
+  let finished = false
 
   socket.addEventListener('message', event => {
     const data = JSON.parse(event.data)
     if ('error' in data) {
       console.error(data.error)
       code_elem.innerHTML += 'Error: ' + data.error
+      finished = true
+    } else if (data.eof) {
+      finished = true
     } else {
       code_elem.innerHTML += data.log_line
+      logRow.offset = data.offset
     }
 
     code_elem.scrollTo(0, code_elem.scrollHeight)
   })
+
+  socket.addEventListener('close', () => {
+    if (!finished && logRows[jobId] === logRow) {
+      setTimeout(() => {
+        if (logRows[jobId] === logRow) followLogs(jobId)
+      }, logRetryInterval)
+    }
+  })
 }
 
 function closeLogs(jobId) {
   if (jobId in logRows) {
-    if (logRows[jobId].socket.readyState !== WebSocket.CLOSED)
-      logRows[jobId].socket.close()
+    const logRow = logRows[jobId]
+    delete logRows[jobId]
 
-    logRows[jobId].elem.parentElement.parentElement.remove()
+    if (logRow.socket.readyState !== WebSocket.CLOSED)
+      logRow.socket.close()
 
-    delete logRows[jobId]
+    logRow.elem.parentElement.parentElement.remove()
   }
 }
 
@@ -357,6 +501,84 @@ function validateParams(formData, validateSet) {
   return { valid, invalid }
 }
 
+/**
+ * shows translated paragraphs as they arrive, then replaces them with the
+ * complete formatted output; warnings (paragraphs left untranslated) are
+ * listed in `warningsElem`
+ * @param {Response} response
+ * @param {HTMLElement} outputElem
+ * @param {HTMLElement} warningsElem
+ */
+async function readTranslationStream(response, outputElem, warningsElem) {
+  if (!response.ok) {
+    outputElem.textContent = 'Error: ' + (await response.text())
+    return
+  }
+
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+  let buffer = ''
+
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) break
+
+    buffer += value
+    // events are separated by blank lines
+    let end
+    while ((end = buffer.indexOf('\n\n')) >= 0) {
+      const message = buffer.slice(0, end)
+      buffer = buffer.slice(end + 2)
+
+      let eventName = 'message'
+      let data = ''
+      for (const line of message.split('\n')) {
+        if (line.startsWith('event: ')) eventName = line.slice(7)
+        else if (line.startsWith('data: ')) data += line.slice(6)
+      }
+
+      const text = JSON.parse(data)
+      if (eventName === 'paragraph') {
+        outputElem.textContent += text
+      } else if (eventName === 'warning') {
+        const item = document.createElement('div')
+        item.textContent = text
+        warningsElem.appendChild(item)
+        warningsElem.classList.remove('d-none')
+      } else if (eventName === 'done') {
+        outputElem.textContent = text
+      }
+    }
+  }
+}
+
+// IDs of glossaries stored on the server, by glossary text
+const glossaryIds = new Map()
+
+/**
+ * replaces the glossary in `formData` by the ID of the stored glossary,
+ * storing it first; the glossary is sent inline if storing fails
+ * @param {FormData} formData
+ */
+async function useStoredGlossary(formData) {
+  const glossary = formData.get('glossary')
+  if (!glossary || glossary.trim() === '') {
+    return
+  }
+
+  if (!glossaryIds.has(glossary)) {
+    const body = new FormData()
+    body.set('glossary', glossary)
+    const response = await fetch('/api/glossaries', { method: 'POST', body })
+    if (!response.ok) {
+      return
+    }
+    glossaryIds.set(glossary, (await response.json()).id)
+  }
+
+  formData.delete('glossary')
+  formData.set('glossary_id', glossaryIds.get(glossary))
+}
+
 /**
  * @param {SubmitEvent} event
  */
@@ -388,13 +610,21 @@ async function translateText(event) {
   }
 
   setFormState('disabled', event.submitter.form.id)
-  document.querySelector('#output_text').innerHTML = ''
-  const result = await fetch('/api/translate', {
+  const outputElem = document.querySelector('#output_text')
+  outputElem.innerHTML = ''
+  const warningsElem = document.querySelector('#output_warnings')
+  warningsElem.replaceChildren()
+  warningsElem.classList.add('d-none')
+
+  formData.set('stream', '1')
+  await useStoredGlossary(formData)
+  await fetch('/api/translate', {
     method: 'POST',
     body: formData,
-  }).finally(() => setFormState('enabled', event.submitter.form.id))
+  })
+    .then(response => readTranslationStream(response, outputElem, warningsElem))
+    .finally(() => setFormState('enabled', event.submitter.form.id))
 
-  document.querySelector('#output_text').innerHTML = await result.text()
   // If Prism is available, re-run highlighting on the updated code element
   try {
     const outElem = document.querySelector('#output_text')
@@ -425,6 +655,7 @@ async function translateDocument(event) {
   event.preventDefault()
 
   const formData = new FormData(event.submitter.form)
+  await useStoredGlossary(formData)
   const response = await fetch('/api/jobs', {
     method: 'POST',
     body: formData,
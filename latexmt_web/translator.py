@@ -1,22 +1,201 @@
-from flask import current_app
-from threading import Lock
+from contextlib import contextmanager
+from flask import Flask, current_app
+import hashlib
+import logging
+import os
+import time
+import traceback
+from threading import Lock, Thread
 
 from latexmt_core.context_logger import logger_from_kwargs
 
+from .batching import BatchScheduler
 from .configure import ConfigKey
+from .helpers import parse_pairs
+from .metrics import stage
+from .pool import Priority, ReplicaPool, resident_memory
+from .remote import RemoteDispatcher, get_remote_executor, is_remote
 from latexmt_core.get_translator import get_translator_aligner as get_translator_aligner_base
 
 # type imports
 from latexmt_core.alignment import Aligner
 from latexmt_core.translation import Translator
+from typing import Any, Iterator, Optional
 
-__translator_aligners_mutex = Lock()
-__translator_aligners: dict[tuple[str, str, str],
-                            tuple[Lock, Translator, Aligner]] = {}
 
+# (src_lang, tgt_lang, trans_type, credential ID), the latter being empty
+# for translators which do not take a per-request credential
+__translator_pools_mutex = Lock()
+__translator_pools: dict[tuple[str, str, str, str], ReplicaPool] = {}
 
-def get_translator_aligner(src_lang: str, tgt_lang: str, trans_type: str, align_type: str, **kwargs) -> tuple[Lock, Translator, Aligner]:
-    global __translator_aligners
+# aligners shared by the remote translator pools of a language pair, by
+# (src_lang, tgt_lang)
+__shared_aligners_mutex = Lock()
+__shared_aligners: dict[tuple[str, str], 'SharedAligner'] = {}
+
+# environment variables API translators read their credential from
+__credential_variables = {
+    'api_deepl': 'DEEPL_API_TOKEN',
+}
+__environ_mutex = Lock()
+
+
+def credential_id(credential: str) -> str:
+    return hashlib.sha256(credential.encode('utf-8')).hexdigest()[:16]
+
+
+class SharedAligner:
+    '''
+    one aligner shared by all remote translator pools of a language pair,
+    instead of one per credential and API client; calls are serialised, as aligners are not
+    known to be thread-safe
+
+    `memory` is the estimated memory used by the aligner, in bytes
+    '''
+
+    def __init__(self, aligner: Aligner, memory: int):
+        self.memory = memory
+        self._aligner = aligner
+        self._mutex = Lock()
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._aligner, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._mutex:
+                return attr(*args, **kwargs)
+
+        return call
+
+
+def __shared_aligner(src_lang: str, tgt_lang: str, aligner: Aligner,
+                     memory: int) -> SharedAligner:
+    '''
+    returns the shared aligner of the pair, which becomes `aligner` if there
+    is none yet
+    '''
+
+    with __shared_aligners_mutex:
+        if (src_lang, tgt_lang) not in __shared_aligners:
+            __shared_aligners[(src_lang, tgt_lang)] = SharedAligner(aligner, memory)
+        return __shared_aligners[(src_lang, tgt_lang)]
+
+
+def __shared_aligner_memory(pair: tuple[str, str]) -> int:
+    with __shared_aligners_mutex:
+        shared = __shared_aligners.get(pair)
+        return shared.memory if shared is not None else 0
+
+
+@contextmanager
+def __credential_environment(trans_type: str, credential: Optional[str]) -> Iterator[None]:
+    '''
+    exposes `credential` to the translator's constructor, which only reads it
+    from the environment; the variable is restored right after, and all API
+    translator constructions are serialised so that none can see another
+    request's credential
+    '''
+
+    if not trans_type.startswith('api_'):
+        yield
+        return
+
+    variable = __credential_variables.get(trans_type)
+
+    with __environ_mutex:
+        if credential is None or variable is None:
+            yield
+            return
+
+        previous = os.environ.get(variable)
+        os.environ[variable] = credential
+        try:
+            yield
+        finally:
+            if previous is None:
+                del os.environ[variable]
+            else:
+                os.environ[variable] = previous
+
+
+def __evict_pools(keep: tuple[str, str, str, str]) -> list[ReplicaPool]:
+    '''
+    removes pools (other than `keep`) from the registry; to be called with
+    `__translator_pools_mutex` held
+
+    pools are removed least recently used first until within the configured
+    number of pairs and memory budget, which count the local model pools and
+    the aligners shared by the remote pools of a pair; API client pools are
+    also removed once idle for `api_client_ttl` seconds, or least recently
+    used first beyond `api_client_max`
+    '''
+
+    config = current_app.config
+    max_pairs = config[ConfigKey.MAX_LOADED_PAIRS]
+    memory_budget = config[ConfigKey.MODEL_MEMORY_BUDGET]
+    api_client_ttl = config[ConfigKey.API_CLIENT_TTL]
+    api_client_max = config[ConfigKey.API_CLIENT_MAX]
+
+    def lru_order(keys: list[tuple[str, str, str, str]]) -> list[tuple[str, str, str, str]]:
+        # idle pools first, then the least recently used
+        return sorted((key for key in keys if key != keep),
+                      key=lambda key: (__translator_pools[key].in_use,
+                                       __translator_pools[key].last_used))
+
+    model_keys = [key for key in __translator_pools if key[3] == '']
+    api_keys = [key for key in __translator_pools if key[3] != '']
+
+    def aligner_pairs() -> set[tuple[str, str]]:
+        return {(key[0], key[1]) for key in model_keys + api_keys
+                if __translator_pools[key].remote is not None}
+
+    def over_budget() -> bool:
+        pairs = {(key[0], key[1]) for key in model_keys} | aligner_pairs()
+        if max_pairs is not None and len(pairs) > max_pairs:
+            return True
+        if memory_budget is not None:
+            memory = sum(__translator_pools[key].memory for key in model_keys
+                         if __translator_pools[key].remote is None)
+            memory += sum(__shared_aligner_memory(pair) for pair in aligner_pairs())
+            return memory > memory_budget
+        return False
+
+    evicted = list[ReplicaPool]()
+
+    candidates = lru_order(model_keys + api_keys)
+    while over_budget() and len(candidates) > 0:
+        key = candidates.pop(0)
+        (model_keys if key[3] == '' else api_keys).remove(key)
+        evicted.append(__translator_pools.pop(key))
+
+    now = time.monotonic()
+    for key in lru_order(api_keys):
+        pool = __translator_pools[key]
+        expired = not pool.in_use and now - pool.last_used > api_client_ttl
+        if expired or len(api_keys) > api_client_max:
+            api_keys.remove(key)
+            evicted.append(__translator_pools.pop(key))
+
+    # the evicted pools keep their aligner until closed
+    with __shared_aligners_mutex:
+        for pair in set(__shared_aligners) - aligner_pairs():
+            del __shared_aligners[pair]
+
+    return evicted
+
+
+def get_translator_pool(src_lang: str, tgt_lang: str, trans_type: str, align_type: str,
+                        credential: Optional[str] = None, **kwargs) -> ReplicaPool:
+    '''
+    returns the pool for the language pair and translator type; API
+    translators given a `credential` get a pool per credential, so that
+    their clients (and connections) are reused by requests with the same
+    credential
+    '''
+
+    global __translator_pools
     config = current_app.config
 
     logger = logger_from_kwargs(**kwargs)
@@ -24,8 +203,13 @@ def get_translator_aligner(src_lang: str, tgt_lang: str, trans_type: str, align_
     if config.get(ConfigKey.ENDPOINT):
         kwargs['endpoint'] = config[ConfigKey.ENDPOINT]
 
-    with __translator_aligners_mutex:
-        if (src_lang, tgt_lang, trans_type) not in __translator_aligners or (trans_type == 'api_deepl'):
+    pair = f'{src_lang}-{tgt_lang}'
+
+    remote = is_remote(trans_type)
+
+    def load() -> tuple[Translator, Aligner]:
+        with stage('load', pair, trans_type), __credential_environment(trans_type, credential):
+            memory_before = resident_memory()
             translator, aligner = get_translator_aligner_base(
                 src_lang=src_lang, tgt_lang=tgt_lang,
                 trans_type=trans_type,
@@ -34,9 +218,95 @@ def get_translator_aligner(src_lang: str, tgt_lang: str, trans_type: str, align_
                 **kwargs
             )
 
-            __translator_aligners[(src_lang, tgt_lang, trans_type)] = \
-                (Lock(), translator, aligner)
+        if remote:
+            # translators and aligners can only be constructed together; all
+            # but the first aligner of the pair are dropped right away, so that
+            # API clients (per credential and replica) do not each keep one
+            aligner = __shared_aligner(  # type: ignore
+                src_lang, tgt_lang, aligner, max(0, resident_memory() - memory_before))
+
+        return translator, aligner
+
+    key = (src_lang, tgt_lang, trans_type,
+           credential_id(credential) if credential is not None else '')
+
+    with __translator_pools_mutex:
+        if key not in __translator_pools:
+            pool = ReplicaPool(
+                '-'.join(part for part in key if part != ''),
+                load,
+                # replicas of remote translators are API clients
+                max_replicas=config[ConfigKey.REMOTE_CLIENTS if remote
+                                    else ConfigKey.MAX_REPLICAS],
+                memory_budget=config[ConfigKey.REPLICA_MEMORY_BUDGET],
+                idle_timeout=config[ConfigKey.REPLICA_IDLE_TIMEOUT],
+            )
+            pool.metric_labels = {'pair': pair, 'translator': trans_type}
+
+            # remote translators send their segments in concurrent chunks
+            # rather than batches
+            if remote:
+                pool.remote = RemoteDispatcher(pool, get_remote_executor(), trans_type)
+            elif config[ConfigKey.BATCH_MAX_SIZE] > 1:
+                pool.batcher = BatchScheduler(
+                    pool,
+                    max_size=config[ConfigKey.BATCH_MAX_SIZE],
+                    max_wait=config[ConfigKey.BATCH_MAX_WAIT_MS] / 1000,
+                )
+
+            __translator_pools[key] = pool
+
+        pool = __translator_pools[key]
+        evicted = __evict_pools(keep=key)
+
+    # unloading waits for the evicted pools' users, so it must not hold up
+    # this request
+    for evicted_pool in evicted:
+        Thread(target=evicted_pool.close, daemon=True,
+               name=f'unload-{evicted_pool.name}').start()
+
+    return pool
+
+
+def translator_pool_stats() -> dict[str, Any]:
+    with __translator_pools_mutex:
+        pools = list(__translator_pools.values())
+
+    return {pool.name: pool.stats() for pool in pools}
+
+
+def preload_translators(app: Flask, only_pairs: Optional[list[tuple[str, str]]] = None):
+    '''
+    loads a replica for each pair in the `preload` configuration (and in
+    `only_pairs`, if given) in the background, so that their first requests
+    do not pay for loading
+    '''
+
+    logger = logging.getLogger(__name__)
+
+    pairs = parse_pairs(app.config[ConfigKey.PRELOAD])
+    if pairs is None:
+        return
+    if only_pairs is not None:
+        pairs = [pair for pair in pairs if pair in only_pairs]
+
+    def preload():
+        with app.app_context():
+            config = current_app.config
+
+            for src_lang, tgt_lang in pairs:
+                try:
+                    pool = get_translator_pool(
+                        src_lang, tgt_lang,
+                        trans_type=config[ConfigKey.TRANSLATOR],
+                        align_type=config[ConfigKey.ALIGNER],
+                        parent_logger=logger,
+                    )
+                    with pool.checkout(Priority.JOB):
+                        pass
+                    logger.info(f'Preloaded {pool.name}')
+                except Exception as err:
+                    logger.warning(f'Error preloading {src_lang}-{tgt_lang}\n'
+                                   f'{err}\n{traceback.format_exc()}')
 
-    lock, translator, aligner = __translator_aligners[(src_lang, tgt_lang, trans_type)]
-    
-    return lock, translator, aligner
+    Thread(target=preload, daemon=True, name='preload').start()
@@ -1,97 +1,400 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import filecmp
 from io import StringIO
 from flask import current_app
 from itertools import chain
 import logging
-import subprocess
+import re
+import shutil
+from threading import Event
 import traceback
-import os
 
 from latexmt_core.document_processor import DocumentTranslator
-from latexmt_core.glossary import load_glossary
 from latexmt_core.parsing.to_text import mask_str_default
 
 from . import db
+from .archive import archive_filename, build_zip
+from .cache import get_result_cache, result_key
 from .configure import ConfigKey
-from .dirs import input_base, output_base
-from .format import texfmt_cmdline, texfmt_files
+from .dedup import complete_duplicates
+from .dirs import input_base, log_base, output_base
+from .format import get_formatter
+from .glossary import get_glossary_cache, glossary_text
 from .job import Job
-from .translator import get_translator_aligner
-
-
-def translate_single(input_text: str, src_lang: str, tgt_lang: str, params: Job) -> str:
-    config = current_app.config
-
-    job_logger = logging.getLogger("translate_single")
-    logger = job_logger.getChild(__name__)
-
-    trans_type = config[ConfigKey.TRANSLATOR]
-    align_type = config[ConfigKey.ALIGNER]
-
-    if params.deepl_api_token is not None and len(params.deepl_api_token.strip()) > 0:
-        trans_type = "api_deepl"
-        os.environ["DEEPL_API_TOKEN"] = params.deepl_api_token.strip()
-    
-    lock, translator, aligner = get_translator_aligner(
-        src_lang,
-        tgt_lang,
-        trans_type=trans_type,
-        align_type=align_type,
-        parent_logger=job_logger,
-    )
+from .logstream import BroadcastFileHandler
+from .memory import SegmentCounts, with_translation_memory
+from .metrics import stage
+from .pool import Priority, ReplicaPool
+from .progress import JobProgress, ProgressTranslator
+from .translator import get_translator_pool
+
+# type imports
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+
+class SnippetSettings:
+    """
+    translator settings and result cache key of a snippet translation
+    """
+
+    def __init__(self, input_text: str, src_lang: str, tgt_lang: str, params: Job):
+        config = current_app.config
+
+        self.src_lang = src_lang
+        self.tgt_lang = tgt_lang
+        self.params = params
+
+        self.trans_type = config[ConfigKey.TRANSLATOR]
+        self.align_type = config[ConfigKey.ALIGNER]
+
+        self.credential = None
+        if params.deepl_api_token is not None and len(params.deepl_api_token.strip()) > 0:
+            self.trans_type = "api_deepl"
+            self.credential = params.deepl_api_token.strip()
+
+        # raises `KeyError` for unknown glossary IDs
+        self.glossary = glossary_text(params.glossary, params.glossary_id)
+
+        self.mask_str = mask_str_default
+        if params.mask_placeholder is not None and len(params.mask_placeholder.strip()) > 0:
+            self.mask_str = params.mask_placeholder.strip()
+
+        self.cache_key = result_key(
+            input_text,
+            src_lang,
+            tgt_lang,
+            trans_type=self.trans_type,
+            align_type=self.align_type,
+            glossary=self.glossary,
+            mask_str=self.mask_str,
+        )
+        self.paragraphs_cache_key = result_key(
+            input_text,
+            src_lang,
+            tgt_lang,
+            trans_type=self.trans_type,
+            align_type=self.align_type,
+            glossary=self.glossary,
+            mask_str=self.mask_str,
+            paragraphs=True,
+        )
 
-    glossary = load_glossary(lines=params.glossary.splitlines())
+    def pool(self, logger: logging.Logger) -> ReplicaPool:
+        return get_translator_pool(
+            self.src_lang,
+            self.tgt_lang,
+            trans_type=self.trans_type,
+            align_type=self.align_type,
+            credential=self.credential,
+            parent_logger=logger,
+        )
 
-    mask_str = mask_str_default
-    if params.mask_placeholder is not None and len(params.mask_placeholder.strip()) > 0:
-        mask_str = params.mask_placeholder.strip()
 
-    processor = DocumentTranslator(
-        translator,
-        aligner,
-        glossary=glossary,
-        parent_logger=logger,
-        recurse_input=False,
-        mask_str=mask_str,
-    )
+def __process_text(
+    input_text: str,
+    settings: SnippetSettings,
+    pool: ReplicaPool,
+    glossary: Any,
+    logger: logging.Logger,
+) -> tuple[str, bool]:
+    """
+    returns the translated text and whether translating failed
+    """
 
     processor_in = StringIO(input_text)
     processor_in.name = str(processor_in)
     processor_out = StringIO()
     processor_out.name = str(processor_out)
 
-    logger.info("Start processing input")
-
+    failed = False
     try:
-        with lock:
-            processor._DocumentTranslator__process_file(  # type: ignore
-                processor_in, processor_out
+        with pool.session(Priority.INTERACTIVE) as (translator, aligner):
+            if settings.params.use_translation_memory:
+                translator = with_translation_memory(
+                    translator, settings.src_lang, settings.tgt_lang, settings.trans_type
+                )
+
+            processor = DocumentTranslator(
+                translator,
+                aligner,
+                glossary=glossary,
+                parent_logger=logger,
+                recurse_input=False,
+                mask_str=settings.mask_str,
             )
+            with stage("translate", **pool.metric_labels):
+                processor._DocumentTranslator__process_file(  # type: ignore
+                    processor_in, processor_out
+                )
             processor_out.flush()
             processor_out.seek(0)
     except Exception as err:
+        failed = True
         logger.warning(f"Error processing input\n{err}\n{traceback.format_exc()}")
 
-    output_text = processor_out.read()
+    return processor_out.read(), failed
+
+
+def __format_output(output_text: str, logger: logging.Logger) -> tuple[str, bool]:
+    """
+    returns the formatted text (unformatted if formatting failed) and whether
+    formatting failed
+    """
+
+    formatter = get_formatter()
+    if formatter is None:
+        return output_text, False
+
+    formatted_text = formatter.format_text(output_text)
+    if formatted_text is None:
+        logger.warning("Error formatting output, returning it unformatted")
+        return output_text, True
+
+    logger.info("Formatted output")
+    return formatted_text, False
+
+
+def translate_single(input_text: str, src_lang: str, tgt_lang: str, params: Job) -> str:
+    job_logger = logging.getLogger("translate_single")
+    logger = job_logger.getChild(__name__)
+
+    settings = SnippetSettings(input_text, src_lang, tgt_lang, params)
+
+    result_cache = get_result_cache()
+    cached_text = result_cache.get(settings.cache_key)
+    if cached_text is not None:
+        logger.info("Returning cached result")
+        return cached_text
+
+    pool = settings.pool(job_logger)
+    glossary = get_glossary_cache().get(settings.glossary)
+
+    logger.info("Start processing input")
+    output_text, failed = __process_text(input_text, settings, pool, glossary, logger)
     logger.info("Finished processing input")
 
-    if config[ConfigKey.TEXFMT_BIN] is not None and config[ConfigKey.TEXFMT_BIN] != "":
-        texfmt_result = subprocess.run(
-            texfmt_cmdline() + ["--stdin"],
-            input=output_text.encode("utf-8"),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.DEVNULL,
-        )
+    output_text, format_failed = __format_output(output_text, logger)
 
-        if texfmt_result.returncode != 0:
-            logger.warning("Error formatting output")
-        else:
-            output_text = texfmt_result.stdout.decode("utf-8")
-            logger.info("Formatted output")
+    # failures are not cached, so that a later request gets another chance
+    if not failed and not format_failed:
+        result_cache.put(settings.cache_key, output_text)
 
     return output_text
 
 
-def job_worker(job_id: int):
+# environments which may span the whole input, and thus are not kept together
+__unsplit_environments = ("document",)
+__environment_pattern = re.compile(r"\\(begin|end)\{([^}]*)\}")
+__comment_pattern = re.compile(r"(?<!\\)%.*")
+
+
+def split_paragraphs(input_text: str) -> list[tuple[str, str]]:
+    """
+    splits `input_text` at blank lines outside of environments into
+    (paragraph, separator) pairs, which concatenate to the input again
+    """
+
+    paragraphs = list[tuple[str, str]]()
+    paragraph = list[str]()
+    separator = list[str]()
+    depth = 0
+
+    for line in input_text.splitlines(keepends=True):
+        if line.strip() == "" and depth <= 0 and len(paragraph) > 0:
+            separator.append(line)
+            continue
+
+        if len(separator) > 0:
+            paragraphs.append(("".join(paragraph), "".join(separator)))
+            paragraph, separator = [], []
+
+        paragraph.append(line)
+
+        code = __comment_pattern.sub("", line)
+        for kind, name in __environment_pattern.findall(code):
+            if name not in __unsplit_environments:
+                depth += 1 if kind == "begin" else -1
+
+    if len(paragraph) > 0 or len(separator) > 0:
+        paragraphs.append(("".join(paragraph), "".join(separator)))
+
+    return paragraphs
+
+
+def translate_stream(
+    input_text: str, src_lang: str, tgt_lang: str, params: Job
+) -> Iterator[tuple[str, str]]:
+    """
+    translates `input_text` paragraph by paragraph, yielding `("paragraph",
+    translation)` as soon as each is done and finally `("done", output)`
+    with the complete, formatted output; paragraphs which fail are kept
+    untranslated, with a `("warning", message)` each
+
+    paragraphs are translated without the context of the rest of the input,
+    so their output is cached apart from that of `translate_single`, which
+    is returned instead if cached
+    """
+
+    job_logger = logging.getLogger("translate_single")
+    logger = job_logger.getChild(__name__)
+
+    settings = SnippetSettings(input_text, src_lang, tgt_lang, params)
+
+    result_cache = get_result_cache()
+    for cache_key in (settings.cache_key, settings.paragraphs_cache_key):
+        cached_text = result_cache.get(cache_key)
+        if cached_text is not None:
+            logger.info("Returning cached result")
+            yield "done", cached_text
+            return
+
+    pool = settings.pool(job_logger)
+    glossary = get_glossary_cache().get(settings.glossary)
+
+    paragraphs = split_paragraphs(input_text)
+    logger.info(f"Start processing input ({len(paragraphs)} paragraphs)")
+
+    output = list[str]()
+    failed = 0
+    for index, (paragraph, separator) in enumerate(paragraphs, start=1):
+        if paragraph.strip() == "":
+            translated = paragraph
+        else:
+            translated, paragraph_failed = __process_text(
+                paragraph, settings, pool, glossary, logger
+            )
+            if paragraph_failed:
+                failed += 1
+                translated = paragraph
+                yield "warning", f"Paragraph {index} could not be translated and is left as is"
+            # the processor may drop the paragraph's final line break
+            if paragraph.endswith("\n") and not translated.endswith("\n"):
+                translated += "\n"
+
+        output.append(translated + separator)
+        yield "paragraph", translated + separator
+
+    logger.info("Finished processing input")
+
+    output_text, format_failed = __format_output("".join(output), logger)
+
+    # failures are not cached, so that a later request gets another chance
+    if failed == 0 and not format_failed:
+        result_cache.put(settings.paragraphs_cache_key, output_text)
+
+    yield "done", output_text
+
+
+def translate_file(
+    job: Job,
+    pool: ReplicaPool,
+    glossary: Any,
+    input_file: Path,
+    input_dir: Path,
+    output_dir: Path,
+    job_logger: logging.Logger,
+    segment_counts: SegmentCounts,
+    progress: JobProgress,
+):
+    # every input file is visited by `job_worker`, so `\input`s are not
+    # followed; each file gets its own processor as files run concurrently
+    with pool.session(Priority.JOB) as (translator, aligner):
+        if job.use_translation_memory:
+            translator = with_translation_memory(
+                translator,
+                job.src_lang,
+                job.tgt_lang,
+                current_app.config[ConfigKey.TRANSLATOR],
+                counts=segment_counts,
+            )
+
+        file_progress = progress.start_file(
+            str(input_file.relative_to(input_dir)), input_file.stat().st_size
+        )
+        try:
+            processor = DocumentTranslator(
+                ProgressTranslator(translator, progress, file_progress),
+                aligner,
+                glossary=glossary,
+                parent_logger=job_logger,
+                recurse_input=False,
+            )
+            with stage("translate", **pool.metric_labels):
+                processor.process_document(
+                    input_file,
+                    output_dir.joinpath(input_file.relative_to(input_dir).parent),
+                )
+            processor.clear_processed()
+        finally:
+            progress.finish_file(file_progress)
+
+
+def reuse_base_outputs(
+    job: Job,
+    input_files: list[Path],
+    input_dir: Path,
+    output_dir: Path,
+    logger: logging.Logger,
+) -> tuple[list[Path], dict[str, int]]:
+    """
+    copies the outputs of input files unchanged since the job's base job, if
+    that finished and was run with the same parameters; returns the input
+    files which still need to be translated, and the segments of the reused
+    ones by path (as far as the base job recorded them)
+
+    changed files are translated in full, with their unchanged segments
+    answered by the translation memory
+    """
+
+    if job.base_job_id is None:
+        return input_files, {}
+
+    base_job = db.get_job(job.base_job_id)
+    if base_job is None or base_job.status not in db.reusable_statuses:
+        logger.info(f"Job {job.base_job_id} is gone or unfinished, translating all files")
+        return input_files, {}
+    if base_job.parameters is None or base_job.parameters != job.parameters:
+        logger.info(f"Job {job.base_job_id} used other parameters, translating all files")
+        return input_files, {}
+
+    base_file_segments = db.file_segments(job.base_job_id)
+    base_input_dir = input_base().joinpath(str(job.base_job_id))
+    base_output_dir = output_base().joinpath(str(job.base_job_id))
+
+    changed = list[Path]()
+    reused = dict[str, int]()
+    for input_file in input_files:
+        relative_path = input_file.relative_to(input_dir)
+        base_input = base_input_dir.joinpath(relative_path)
+        base_output = base_output_dir.joinpath(relative_path)
+
+        if (
+            base_input.is_file()
+            and base_output.is_file()
+            and filecmp.cmp(input_file, base_input, shallow=False)
+        ):
+            output_file = output_dir.joinpath(relative_path)
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(base_output, output_file)
+            reused[str(relative_path)] = base_file_segments.get(str(relative_path), 0)
+        else:
+            changed.append(input_file)
+
+    logger.info(
+        f"Reused {len(reused)} of {len(input_files)} files ({sum(reused.values())} segments)"
+        f" unchanged since job {job.base_job_id}"
+    )
+    return changed, reused
+
+
+def job_worker(job_id: int, owner: Optional[str] = None, lease_lost: Optional[Event] = None):
+    """
+    runs job `job_id`; with `owner` given, the job is only written while
+    leased to `owner`, and abandoned with `db.LeaseLost` once it is not (or
+    once `lease_lost` is set)
+    """
+
     config = current_app.config
 
     job = db.get_job(job_id)
@@ -100,62 +403,151 @@ def job_worker(job_id: int):
     job_logger = logging.getLogger(f"Job {job.id}")
     logger = job_logger.getChild(__name__)
 
-    logger.info("Starting worker")
-    job.status = "initialising"
-    job = db.update_job(job_id, job)
+    log_file = log_base().joinpath(str(job.id) + ".log")
+    file_handler = BroadcastFileHandler(job.id, log_file, config[ConfigKey.LOG_BUFFER_BYTES])
+    file_handler.setFormatter(logging.getLogger().handlers[0].formatter)
+    job_logger.addHandler(file_handler)
 
-    glossary = load_glossary(lines=job.glossary.splitlines(), parent_logger=job_logger)
+    try:
+        logger.info("Starting worker")
+        job.status = "initialising"
+        job = db.update_job(job_id, job, owner=owner)
 
-    input_dir = input_base().joinpath(str(job.id))
-    output_dir = output_base().joinpath(str(job.id))
+        glossary = get_glossary_cache().get(glossary_text(job.glossary, job.glossary_id))
 
-    # job.model contains src_lang, job.input_prefix contains tgt_lang
-    lock, translator, aligner = get_translator_aligner(
-        job.src_lang, job.tgt_lang, parent_logger=job_logger
-    )
+        input_dir = input_base().joinpath(str(job.id))
+        output_dir = output_base().joinpath(str(job.id))
 
-    processor = DocumentTranslator(
-        translator, aligner, glossary=glossary, parent_logger=job_logger
-    )
+        trans_type = config[ConfigKey.TRANSLATOR]
+        align_type = config[ConfigKey.ALIGNER]
 
-    logger.info(f"Job {job.id}: Start processing documents")
-    job.status = "processing"
-    job = db.update_job(job_id, job)
+        pool = get_translator_pool(
+            job.src_lang,
+            job.tgt_lang,
+            trans_type=trans_type,
+            align_type=align_type,
+            parent_logger=job_logger,
+        )
 
-    for input_file in chain(input_dir.rglob("*.tex"), input_dir.rglob("*.Rnw")):
-        try:
-            with lock:
-                processor.process_document(
+        all_input_files = sorted(chain(input_dir.rglob("*.tex"), input_dir.rglob("*.Rnw")))
+        input_files, reused_files = reuse_base_outputs(
+            job, all_input_files, input_dir, output_dir, logger
+        )
+
+        progress = JobProgress(
+            job.id,
+            len(all_input_files),
+            config[ConfigKey.JOB_PROGRESS_INTERVAL],
+            owner=owner,
+            lease_lost=lease_lost,
+        )
+        progress.reuse_files(reused_files)
+        progress.add_pending(sum(input_file.stat().st_size for input_file in input_files))
+
+        # without batching (or a remote translator), every file being translated
+        # holds a replica
+        parallelism = config[ConfigKey.JOB_FILE_WORKERS]
+        if pool.batcher is None and pool.remote is None:
+            parallelism = min(parallelism, pool.max_replicas)
+
+        logger.info(
+            f"Job {job.id}: Start processing {len(input_files)} documents"
+            f" ({parallelism} in parallel)"
+        )
+        job.status = "processing"
+        job.progress = progress.snapshot()
+        job = db.update_job(job_id, job, owner=owner)
+
+        app = current_app._get_current_object()  # type: ignore
+
+        def run(input_file: Path):
+            progress.check_lease()
+            with app.app_context():
+                translate_file(
+                    job,
+                    pool,
+                    glossary,
                     input_file,
-                    output_dir.joinpath(input_file.relative_to(input_dir).parent),
+                    input_dir,
+                    output_dir,
+                    job_logger,
+                    progress.memory_counts,
+                    progress,
+                )
+
+        errors = list[tuple[Path, Exception]]()
+        with ThreadPoolExecutor(max_workers=max(1, parallelism)) as file_executor:
+            futures = {
+                file_executor.submit(run, input_file): input_file for input_file in input_files
+            }
+
+            for files_done, future in enumerate(as_completed(futures), start=1):
+                input_file = futures[future]
+                relative_path = input_file.relative_to(input_dir)
+
+                err = future.exception()
+                if err is not None:
+                    logger.warning(
+                        f"Error processing input\n{err}\n"
+                        + "".join(traceback.format_exception(err)),
+                        extra={"input_file": input_file},
+                    )
+                    errors.append((relative_path, err))  # type: ignore
+
+                logger.info(
+                    f"Processed file {files_done}/{len(input_files)}: {relative_path}"
+                    + (" (failed)" if err is not None else "")
                 )
 
-        except Exception as err:
+        # the files failed because another worker runs the job now
+        progress.check_lease()
+        job.progress = progress.snapshot()
+
+        if len(errors) > 0:
             logger.warning(
-                f"Error processing input\n{err}\n{traceback.format_exc()}",
-                extra={"input_file": input_file},
+                f"{len(errors)} of {len(input_files)} files failed: "
+                + ", ".join(str(path) for path, _ in sorted(errors))
             )
             job.status = "error"
             job.download_url = f"/api/jobs/{job.id}/download"
-            job = db.update_job(job_id, job)
-            break
-
-    logger.info("Finished translating input files")
-
-    if config[ConfigKey.TEXFMT_BIN] is not None and config[ConfigKey.TEXFMT_BIN] != "":
-        output_files = list(chain(output_dir.rglob("*.tex"), output_dir.rglob("*.Rnw")))
-        texfmt_result = texfmt_files(output_files)
-        if texfmt_result.returncode != 0:
-            logger.warning("Error formatting output files")
-        logger.info("Formatted output files")
-
-    if job.status != "error":
-        logger.info("Finished")
-        job.status = "done"
-        job.download_url = f"/api/jobs/{job.id}/download"
-        job = db.update_job(job_id, job)
-
-    processor.clear_processed()
-    for handler in job_logger.handlers:
-        job_logger.removeHandler(handler)
-        handler.close()
+            job = db.update_job(job_id, job, owner=owner)
+
+        logger.info("Finished translating input files")
+        logger.info(
+            f"Segments: {job.progress['segments_reused']} reused (from unchanged files and"
+            f" the translation memory), {job.progress['segments_translated']} translated"
+        )
+        # for jobs reusing this one's outputs
+        db.set_file_segments(job.id, progress.file_segments())
+
+        formatter = get_formatter()
+        if formatter is not None:
+            output_files = sorted(chain(output_dir.rglob("*.tex"), output_dir.rglob("*.Rnw")))
+            unformatted = formatter.format_files(output_files)
+            if len(unformatted) > 0:
+                logger.warning(
+                    f"Error formatting {len(unformatted)} of {len(output_files)} output files: "
+                    + ", ".join(str(path.relative_to(output_dir)) for path in unformatted)
+                )
+            logger.info("Formatted output files")
+
+        if config[ConfigKey.PREBUILD_DOWNLOAD_ZIP]:
+            try:
+                build_zip(output_dir, archive_filename(job.id))
+                logger.info("Built download archive")
+            except Exception as err:
+                # downloads fall back to streaming the archive
+                logger.warning(f"Error building download archive\n{err}\n{traceback.format_exc()}")
+
+        if job.status != "error":
+            logger.info("Finished")
+            job.status = "done"
+            job.download_url = f"/api/jobs/{job.id}/download"
+            job = db.update_job(job_id, job, owner=owner)
+
+        complete_duplicates(job, logger)
+    finally:
+        # also on errors, so that log viewers see the end of the log
+        for handler in list(job_logger.handlers):
+            job_logger.removeHandler(handler)
+            handler.close()
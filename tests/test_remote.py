@@ -0,0 +1,203 @@
+'''
+tests of `RemoteExecutor` against a stub translation service on a local HTTP
+server: chunking, retries with backoff, and the concurrency caps
+'''
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from threading import Lock, Thread
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from latexmt_web.pool import Priority, ReplicaPool
+from latexmt_web.remote import RemoteExecutor, is_transient
+
+
+class StubService:
+    '''
+    translates segments by upper-casing them after `delay` seconds; the
+    first requests fail with the statuses in `failures`
+    '''
+
+    def __init__(self, delay: float = 0.02):
+        self.delay = delay
+        self.failures = list[int]()
+        self.requests = list[list[str]]()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._mutex = Lock()
+
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                segments = json.loads(body)['segments']
+
+                with service._mutex:
+                    service.requests.append(segments)
+                    status = service.failures.pop(0) if len(service.failures) > 0 else 200
+                    service.in_flight += 1
+                    service.max_in_flight = max(service.max_in_flight, service.in_flight)
+
+                try:
+                    time.sleep(service.delay)
+                finally:
+                    with service._mutex:
+                        service.in_flight -= 1
+
+                if status != 200:
+                    self.send_error(status)
+                    return
+
+                response = json.dumps({'translations': [s.upper() for s in segments]})
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(response.encode('utf-8'))
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/translate'
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StubClient:
+    '''
+    API client translator of the stub service; not safe to use from two
+    threads at once, which `busy` asserts
+    '''
+
+    def __init__(self, url: str):
+        self.url = url
+        self.busy = False
+
+    def translate_batch(self, segments: list[str]) -> list[str]:
+        assert not self.busy, 'client used by two requests at once'
+        self.busy = True
+        try:
+            request = urllib.request.Request(
+                self.url, json.dumps({'segments': segments}).encode('utf-8'),
+                headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return json.loads(response.read())['translations']
+        finally:
+            self.busy = False
+
+
+@pytest.fixture
+def service():
+    service = StubService()
+    yield service
+    service.close()
+
+
+def make_pool(service: StubService, clients: int) -> ReplicaPool:
+    return ReplicaPool('stub', lambda: (StubClient(service.url), None),  # type: ignore
+                       max_replicas=clients, memory_budget=None, idle_timeout=60)
+
+
+def test_chunks_keep_order(service):
+    executor = RemoteExecutor(max_concurrency=8, chunk_size=3, retries=0, backoff=0)
+    pool = make_pool(service, clients=4)
+    segments = [f'segment {i}' for i in range(10)]
+
+    assert executor.translate(pool, Priority.JOB, segments, 'stub') == \
+        [segment.upper() for segment in segments]
+    assert sorted(len(chunk) for chunk in service.requests) == [1, 3, 3, 3]
+    assert executor.translate(pool, Priority.JOB, [], 'stub') == []
+
+
+def test_transient_errors_are_retried(service):
+    service.failures = [503, 429]
+    executor = RemoteExecutor(max_concurrency=1, chunk_size=8, retries=3, backoff=0.05)
+    pool = make_pool(service, clients=1)
+
+    start = time.monotonic()
+    assert executor.translate(pool, Priority.JOB, ['a', 'b'], 'stub') == ['A', 'B']
+    elapsed = time.monotonic() - start
+
+    assert len(service.requests) == 3
+    # jittered backoff of at least half of 0.05s and 0.1s
+    assert elapsed >= 0.075
+    stats = executor.stats()
+    assert stats['retries'] == 2
+    assert stats['failures'] == 0
+    assert stats['in_flight'] == 0
+
+
+def test_retries_are_limited(service):
+    service.failures = [503] * 3
+    executor = RemoteExecutor(max_concurrency=1, chunk_size=8, retries=1, backoff=0.01)
+    pool = make_pool(service, clients=1)
+
+    with pytest.raises(urllib.error.HTTPError):
+        executor.translate(pool, Priority.JOB, ['a'], 'stub')
+    assert len(service.requests) == 2
+    assert executor.stats()['failures'] == 1
+
+
+def test_client_errors_are_not_retried(service):
+    service.failures = [400]
+    executor = RemoteExecutor(max_concurrency=1, chunk_size=8, retries=3, backoff=0.01)
+    pool = make_pool(service, clients=1)
+
+    with pytest.raises(urllib.error.HTTPError) as err:
+        executor.translate(pool, Priority.JOB, ['a'], 'stub')
+    assert not is_transient(err.value)
+    assert len(service.requests) == 1
+    assert executor.stats()['retries'] == 0
+
+
+def test_transient_errors():
+    assert is_transient(TimeoutError())
+    assert is_transient(ConnectionResetError())
+
+    class TooManyRequests(Exception):
+        pass
+
+    assert is_transient(TooManyRequests())
+
+    try:
+        try:
+            raise TimeoutError()
+        except TimeoutError as err:
+            raise RuntimeError('translation failed') from err
+    except RuntimeError as err:
+        assert is_transient(err)
+
+    assert not is_transient(ValueError('invalid credential'))
+
+
+def test_concurrency_is_capped_by_clients(service):
+    executor = RemoteExecutor(max_concurrency=16, chunk_size=1, retries=0, backoff=0)
+    pool = make_pool(service, clients=3)
+
+    executor.translate(pool, Priority.JOB, [str(i) for i in range(12)], 'stub')
+    assert service.max_in_flight == 3
+    assert pool.stats()['replicas'] <= 3
+
+
+def test_concurrency_is_capped_across_pools(service):
+    executor = RemoteExecutor(max_concurrency=4, chunk_size=1, retries=0, backoff=0)
+    pools = [make_pool(service, clients=4) for _ in range(3)]
+
+    threads = [Thread(target=executor.translate,
+                      args=(pool, Priority.JOB, [str(i) for i in range(8)], 'stub'))
+               for pool in pools]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(service.requests) == 24
+    assert service.max_in_flight == 4
+    assert executor.stats()['in_flight'] == 0